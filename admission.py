@@ -0,0 +1,178 @@
+# admission.py - Priority admission control in front of every upstream model call
+import os
+import time
+import threading
+from collections import deque
+import metrics
+from metrics import percentile
+from upstream_guard import UpstreamUnavailable
+
+# Highest priority first: people waiting on a page, background generation, health probes
+PRIORITIES = ("interactive", "batch", "diagnostics")
+
+# Calls are classified by the endpoint label they are recorded under (see metrics.call_labels)
+ENDPOINT_PRIORITIES = {
+    "generate": "interactive",
+    "generate_stream": "interactive",
+    "refine": "interactive",
+    "compare": "interactive",
+    # The command-line chat in test,py: someone is waiting at the terminal
+    "ask_claude": "interactive",
+    "warmup": "batch",
+    "speculative": "batch",
+    "batch": "batch",
+    "api_test": "diagnostics",
+    "test_claude": "diagnostics"
+}
+
+# Set to false to send every call upstream in arrival order
+admission_enabled = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+
+# Concurrent upstream calls per process, in total and per class; the gap leaves room for interactive calls
+admission_max_concurrency = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "24"))
+class_limits = {
+    "interactive": int(os.getenv("ADMISSION_INTERACTIVE_CONCURRENCY", "24")),
+    "batch": int(os.getenv("ADMISSION_BATCH_CONCURRENCY", "4")),
+    "diagnostics": int(os.getenv("ADMISSION_DIAGNOSTICS_CONCURRENCY", "2"))
+}
+
+# Longest a call may wait for a slot before it is rejected
+class_deadlines = {
+    "interactive": float(os.getenv("ADMISSION_INTERACTIVE_DEADLINE_SECONDS", "30")),
+    "batch": float(os.getenv("ADMISSION_BATCH_DEADLINE_SECONDS", "120")),
+    "diagnostics": float(os.getenv("ADMISSION_DIAGNOSTICS_DEADLINE_SECONDS", "5"))
+}
+
+# Upstream latency (time to first token for streams, wall time otherwise) above which low-priority work is shed:
+# diagnostics over the target, batch over twice the target. Interactive calls are never shed.
+latency_target_seconds = float(os.getenv("ADMISSION_LATENCY_TARGET_SECONDS", "15"))
+latency_window = int(os.getenv("ADMISSION_LATENCY_WINDOW", "50"))
+# Older samples are ignored, so shedding stops once nothing slow has been seen for a while
+latency_max_age_seconds = float(os.getenv("ADMISSION_LATENCY_MAX_AGE_SECONDS", "120"))
+
+
+class AdmissionRejected(UpstreamUnavailable):
+    """The call was shed or waited past its class deadline; it never reached the provider"""
+
+
+class AdmissionController:
+    """Priority slots for upstream calls.
+
+    A call takes a slot when its class is under its own limit, the process
+    is under `max_concurrency` and no higher class is waiting for a slot it
+    could use. Within a class, calls start in arrival order and give up at
+    the class deadline. While the p95 of recent upstream latencies is over
+    the target, diagnostics (and at twice the target, batch) calls are
+    rejected instead of adding load.
+    """
+
+    def __init__(self, max_concurrency, limits, deadlines, latency_target, window=50, max_age=120.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.limits = {priority: max(1, limits[priority]) for priority in PRIORITIES}
+        self.deadlines = deadlines
+        self.latency_target = latency_target
+        self.max_age = max_age
+        self.active = {priority: 0 for priority in PRIORITIES}
+        # Waiters per class in arrival order; only the head of a queue may take a slot
+        self._queues = {priority: deque() for priority in PRIORITIES}
+        self._latencies = deque(maxlen=window)
+        self._condition = threading.Condition()
+
+    def acquire(self, priority):
+        """Block until a slot is free; raise AdmissionRejected when shed or past the deadline"""
+        started = time.monotonic()
+        deadline = started + self.deadlines[priority]
+        waiter = object()
+        with self._condition:
+            self._queues[priority].append(waiter)
+            try:
+                while True:
+                    if self._should_shed(priority):
+                        self._reject(priority, "shed", "Upstream is slow; low-priority calls are shed",
+                                     retry_after=self.latency_target)
+                    if self._queues[priority][0] is waiter and self._can_start(priority):
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._reject(priority, "deadline", f"No upstream slot for {priority} calls within "
+                                     f"{self.deadlines[priority]:.0f}s", retry_after=5.0)
+                    self._condition.wait(remaining)
+                self.active[priority] += 1
+            finally:
+                self._queues[priority].remove(waiter)
+                # The next waiter in line may be able to start (or give up) now
+                self._condition.notify_all()
+        metrics.ADMISSION_WAIT.observe({"priority": priority}, time.monotonic() - started)
+        metrics.ADMISSION_DECISIONS.inc({"priority": priority, "outcome": "admitted"})
+
+    def release(self, priority, latency=None):
+        """Give the slot back; `latency` feeds the shedding signal"""
+        with self._condition:
+            self.active[priority] -= 1
+            if latency is not None:
+                self._latencies.append((time.monotonic(), latency))
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {
+                "active": dict(self.active),
+                "waiting": {priority: len(queue) for priority, queue in self._queues.items()},
+                "latency_p95_s": round(self._latency_p95(), 3),
+                "latency_target_s": self.latency_target
+            }
+
+    def _latency_p95(self):
+        cutoff = time.monotonic() - self.max_age
+        recent = [latency for observed, latency in self._latencies if observed >= cutoff]
+        return percentile(recent, 95) if recent else 0.0
+
+    def _can_start(self, priority):
+        if self.active[priority] >= self.limits[priority] or sum(self.active.values()) >= self.max_concurrency:
+            return False
+        # Strict priority: leave a free slot to a higher class that is waiting and under its own limit
+        for higher in PRIORITIES[:PRIORITIES.index(priority)]:
+            if self._queues[higher] and self.active[higher] < self.limits[higher]:
+                return False
+        return True
+
+    def _should_shed(self, priority):
+        if priority == "interactive" or self.latency_target <= 0:
+            return False
+        return self._latency_p95() > self.latency_target * (2 if priority == "batch" else 1)
+
+    def _reject(self, priority, outcome, message, retry_after):
+        metrics.ADMISSION_DECISIONS.inc({"priority": priority, "outcome": outcome})
+        raise AdmissionRejected(message, retry_after=retry_after)
+
+
+def priority_for(endpoint):
+    """Priority class of calls recorded under `endpoint`; unlisted endpoints are treated as batch work"""
+    return ENDPOINT_PRIORITIES.get(endpoint, "batch")
+
+
+controller = AdmissionController(admission_max_concurrency, class_limits, class_deadlines,
+                                 latency_target_seconds, latency_window, latency_max_age_seconds) if admission_enabled else None
+
+
+def acquire(endpoint):
+    """Take a slot for a call under `endpoint`; returns the release function (a no-op when disabled)"""
+    if controller is None:
+        return lambda latency=None: None
+    priority = priority_for(endpoint)
+    controller.acquire(priority)
+    slot = [priority]
+
+    def release(latency=None):
+        # Streams may be closed and finish iterating; only the first call gives the slot back (list.pop is atomic)
+        try:
+            slot.pop()
+        except IndexError:
+            return
+        controller.release(priority, latency)
+
+    return release
+
+
+def stats():
+    return controller.stats() if controller is not None else {"enabled": False}
@@ -1,20 +1,36 @@
 # app.py - Simplified version with fixed types
-import os
-import json
 import streamlit as st
-from dotenv import load_dotenv
-from openai import OpenAI
+from llm_client import get_client, model_id, preload_client
 import base64
-from datetime import datetime
+import time
+import uuid
+from concurrent.futures import as_completed
+from response_cache import make_cache_key
+import metrics
+from artifact_server import ARTIFACT_PREFIX
+from refine import refine_result
+from routing import get_router
+from upstream_guard import UpstreamUnavailable, breaker
+from warmup import create_catalog_warmer
+from codegen import TEMPERATURE, fallback_response, generate_result, stream_generation
+from generation_tracker import GenerationCancelled
+from prompt_library import DEVICES, FRAMEWORKS, PROMPT_LIBRARY
+from project_export import project_slug
+from ui_assets import APP_CSS, DEVICE_FRAME_HTML, FOOTER_HTML
+from app_resources import (
+    HISTORY_PAGE_SIZE, artifact_public_url, compare_default_frameworks, refine_device_switch, speculative_variants,
+    streaming_enabled, validation_auto_repair, warmup_concurrency, warmup_devices, warmup_enabled, warmup_frameworks, warmup_interval_seconds,
+    get_artifact_store, get_compare_pool, get_generation_tracker, get_history_store, get_pending_variants, get_project_exporter,
+    get_response_cache, get_semantic_cache, get_speculative_pool, get_validation_pool
+)
+
+# Environment variables (.env included) are loaded once per process by llm_client
 
-# Load environment variables
-load_dotenv()
-api_key = os.getenv("OPENAI_API_KEY")
-base_url = os.getenv("OPENAI_BASE_URL")
-model_id = os.getenv("MODEL_ID")
+# The shared, pooled OpenAI client is created in the background; importing openai would delay the first page
+preload_client()
 
-# Initialize the OpenAI client
-client = OpenAI(api_key=api_key, base_url=base_url)
+# Picks the model and token budget per request and learns from completed generations
+router = get_router()
 
 # Page config
 st.set_page_config(
@@ -24,72 +40,43 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# Define frontend frameworks
-FRAMEWORKS = [
-    "HTML/CSS/JS",
-    "React",
-    "Vue.js",
-    "Angular",
-    "Svelte"
-]
-
-# Define device types - All dimensions are integers
-DEVICES = {
-    "Desktop": {"width": 1200, "height": 600},
-    "Tablet": {"width": 768, "height": 600},
-    "Mobile": {"width": 375, "height": 600}
-}
-
-# Prompt library organized by categories
-PROMPT_LIBRARY = {
-    "Form Components": [
-        "Create a login form with email and password fields",
-        "Create a sign-up form with name, email, password fields",
-        "Create a contact form with name, email, message, and submit button",
-        "Create a checkout form with billing address and payment details",
-        "Create a search form with filters and search button"
-    ],
-    "Navigation Components": [
-        "Create a responsive navbar with logo and links",
-        "Create a sidebar navigation with categories",
-        "Create a bottom navigation bar for mobile with icons",
-        "Create a mega menu with dropdown categories",
-        "Create a breadcrumb navigation for a product page"
-    ],
-    "Interactive Elements": [
-        "Create an image carousel with navigation arrows",
-        "Create a modal popup with form inside",
-        "Create an accordion FAQ section",
-        "Create a tabbed interface for content",
-        "Create a star rating component"
-    ],
-    "Data Display": [
-        "Create a responsive data table with sorting",
-        "Create a pricing table with multiple tiers",
-        "Create a dashboard with key metrics",
-        "Create a product grid with cards",
-        "Create a timeline component for events"
-    ],
-    "Complete Layouts": [
-        "Create a landing page with hero section",
-        "Create a product page with images and details",
-        "Create a blog layout with featured post",
-        "Create a portfolio gallery with filtering",
-        "Create an admin dashboard with sidebar navigation"
-    ]
-}
+# Process-wide resources (see app_resources)
+response_cache = get_response_cache()
+semantic_cache = get_semantic_cache()
+speculative_pool = get_speculative_pool()
+compare_pool = get_compare_pool()
+history_store = get_history_store()
+artifact_store = get_artifact_store()
+pending_variants, pending_variants_lock = get_pending_variants()
+project_exporter = get_project_exporter()
+validation_pool = get_validation_pool()
+generation_tracker = get_generation_tracker()
 
 # Initialize session state variables
 if 'current_device' not in st.session_state:
     st.session_state.current_device = "Desktop"
 if 'current_framework' not in st.session_state:
     st.session_state.current_framework = "HTML/CSS/JS"
-if 'history' not in st.session_state:
-    st.session_state.history = []
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+if 'current_entry_id' not in st.session_state:
+    st.session_state.current_entry_id = None
+if 'history_page' not in st.session_state:
+    st.session_state.history_page = 0
 if 'prompt_text' not in st.session_state:
     st.session_state.prompt_text = ""
 if 'show_result' not in st.session_state:
     st.session_state.show_result = False
+if 'bypass_cache' not in st.session_state:
+    st.session_state.bypass_cache = False
+if 'stream_results' not in st.session_state:
+    st.session_state.stream_results = streaming_enabled
+if 'compare_frameworks' not in st.session_state:
+    st.session_state.compare_frameworks = [name for name in compare_default_frameworks if name in FRAMEWORKS]
+if 'show_compare' not in st.session_state:
+    st.session_state.show_compare = False
+if 'speculative' not in st.session_state:
+    st.session_state.speculative = None
 
 # Helper function to clear the input
 def clear_input():
@@ -102,113 +89,498 @@ def handle_form_submit():
         st.warning("Please enter a prompt first.")
         return
     
-    with st.spinner("Generating your UI and code..."):
-        # Call API to generate code
-        result = generate_code(
-            prompt, 
-            st.session_state.current_framework, 
-            st.session_state.current_device
-        )
-        
-        # Add to history
-        history_item = {
-            'prompt': prompt,
-            'framework': st.session_state.current_framework,
-            'device': st.session_state.current_device,
-            'result': result
-        }
-        
-        # Add to history (limit to 10 items)
-        st.session_state.history.insert(0, history_item)
-        if len(st.session_state.history) > 10:
-            st.session_state.history = st.session_state.history[:10]
+    framework = st.session_state.current_framework
+    device = st.session_state.current_device
+    context = {"action": "generate"}
+    # Streaming renders its own progress, so only the blocking call needs a spinner
+    if st.session_state.stream_results:
+        result = generate_code(prompt, framework, device, use_cache=not st.session_state.bypass_cache, live=True, context=context)
+    else:
+        with st.spinner("Generating your UI and code..."):
+            # Call API to generate code
+            result = generate_code(prompt, framework, device, use_cache=not st.session_state.bypass_cache, context=context)
+    finish_generation(result, dict(context, prompt=prompt, framework=framework, device=device))
+
+# Record a new generation in the history and show it
+def finish_generation(result, context):
+    prompt, framework = context["prompt"], context["framework"]
+    # Add to history; session state only keeps the entry id
+    entry_id = history_store.add_entry(st.session_state.session_id, prompt, framework, context["device"], result)
+    st.session_state.current_entry_id = entry_id
+    st.session_state.history_page = 0
+    
+    # Variants started with this generation (see generate_code) are filed under its entry.
+    # Fallback results have no metadata and are not worth keeping variants for.
+    variants = st.session_state.speculative
+    if variants is not None and (variants["prompt"], variants["framework"]) == (prompt, framework) and "metadata" in result:
+        attach_speculative_variants(variants, entry_id)
+    
+    # Store result in session state
+    st.session_state.result = result
+    st.session_state.show_result = True
+    st.session_state.show_compare = False
+
+# Function to generate code from Claude, served from the response cache when possible.
+# `live` renders fields as they arrive; `context` says how a later page run finishes the result (see resume_generation).
+def generate_code(prompt, framework, device, use_cache=True, live=False, context=None):
+    # The other device variants run alongside a new generation, so switching devices is instant once it is in
+    if speculative_variants and (context or {}).get("action") == "generate":
+        start_speculative_variants(prompt, framework, device, use_cache)
+    
+    route = router.route(prompt, framework, device)
+    cache_key = make_cache_key(prompt, framework, device, route["model"], TEMPERATURE)
+    if use_cache:
+        cached = get_cached_result(prompt, framework, device, route["model"], cache_key)
+        if cached is not None:
+            # The answer is already here, so anything still generating for this session is wasted
+            generation_tracker.cancel(st.session_state.session_id)
+            return cached
+    
+    endpoint = "generate_stream" if live else "generate"
+    ticket = generation_tracker.submit(
+        st.session_state.session_id,
+        cache_key,
+        lambda ticket: run_generation(ticket, prompt, framework, device, route, endpoint, live),
+        labels=metrics.call_labels(endpoint, framework, device),
+        context=dict(context or {"action": "none"}, prompt=prompt, framework=framework, device=device, model=route["model"])
+    )
+    return await_generation(ticket, live)
+
+# Generation worker on the tracker's pool; no Streamlit calls are allowed here
+def run_generation(ticket, prompt, framework, device, route, endpoint, live=False):
+    if not live:
+        # Nothing to preview, so a blocking call is enough and identical requests share it (llm_client coalescing).
+        # Once sent it cannot be stopped; a superseded result is simply not shown.
+        json_result, missing_fields = generate_result(get_client(), route["model"], prompt, framework, device,
+                                                      temperature=TEMPERATURE, max_tokens=route["max_tokens"],
+                                                      endpoint=endpoint)
+        router.observe(route, json_result)
+        return json_result, missing_fields
+    # Streamed: closing the stream is what cancels a superseded call
+    for event in stream_generation(get_client(), route["model"], prompt, framework, device,
+                                   temperature=TEMPERATURE, max_tokens=route["max_tokens"],
+                                   endpoint=endpoint, cancel=ticket.cancelled):
+        if event[0] == "done":
+            _, json_result, missing_fields = event
+            router.observe(route, json_result)
+            return json_result, missing_fields
+        ticket.publish(event[1], event[2])
+    raise RuntimeError("Generation stream ended without a result")
+
+# Wait for a tracked generation, rendering fields as they arrive when `live`, then report and cache the result.
+# The wait touches the page a few times a second so a newer click can interrupt this run; the call keeps going.
+def await_generation(ticket, live=False):
+    context = ticket.context
+    framework, device = context["framework"], context["device"]
+    live_area = st.empty()
+    try:
+        with live_area.container():
+            status = st.empty()
+            placeholders = {"explanation": st.empty(), "css_code": st.empty(), "interactive_code": st.empty()} if live else {}
+            rendered = {}
+            while True:
+                ticket.changed.wait(0.25)
+                ticket.changed.clear()
+                done = ticket.future.done()
+                for field, value in list(ticket.fields.items()):
+                    if field not in placeholders or rendered.get(field) is value:
+                        continue
+                    rendered[field] = value
+                    if field == "explanation":
+                        placeholders[field].markdown(str(value))
+                    elif field == "css_code":
+                        placeholders[field].code(str(value), language="css")
+                    else:
+                        with placeholders[field].container():
+                            st.components.v1.iframe(get_html_display(str(value), inline=True), height=DEVICES[device]["height"], scrolling=True)
+                if done:
+                    break
+                status.caption(f"Generating {framework} UI for {device}... {time.time() - ticket.started_at:.0f}s")
         
-        # Store result in session state
+        json_result, missing_fields = ticket.future.result()
+        result = store_result(ticket.key, context["model"], json_result, missing_fields)
+    except GenerationCancelled:
+        st.info("This generation was replaced by a newer request.")
+        result = fallback_response()
+    except UpstreamUnavailable as e:
+        result = serve_degraded(context["prompt"], framework, device, context["model"], ticket.key, e)
+    except Exception as e:
+        st.error(f"Error generating code: {str(e)}")
+        result = fallback_response()
+    finally:
+        live_area.empty()
+    # Not reached when a rerun interrupts the wait, so the next page run can collect the result
+    generation_tracker.release(st.session_state.session_id, ticket)
+    return result
+
+# Finish a generation that an earlier page run started but was interrupted waiting for
+def resume_generation():
+    ticket = generation_tracker.pending(st.session_state.session_id)
+    if ticket is None:
+        return
+    context = ticket.context
+    with st.spinner(f"Finishing your {context['framework']} UI for {context['device']}..."):
+        result = await_generation(ticket)
+    finisher = GENERATION_FINISHERS.get(context["action"])
+    if finisher is not None:
+        finisher(result, context)
+    st.rerun()
+
+# While the model API is rate limited or its circuit breaker is open, serve a cached or stale result
+def serve_degraded(prompt, framework, device, model, cache_key, error):
+    cached = get_cached_result(prompt, framework, device, model, cache_key)
+    if cached is None:
+        cached = response_cache.get_stale(cache_key)
+        if cached is not None:
+            cached["metadata"]["cache_hit"] = True
+            cached["metadata"]["stale"] = True
+    if cached is not None:
+        st.warning(f"The model API is unavailable right now ({str(error)}); showing a previously generated result.")
+        return cached
+    st.error(f"The model API is unavailable right now ({str(error)}). Try again in {int(error.retry_after) + 1} seconds.")
+    return fallback_response()
+
+# Function to report missing fields and cache complete results
+def store_result(cache_key, model, json_result, missing_fields):
+    json_result["metadata"]["cache_hit"] = False
+    recovery = json_result["metadata"].get("parse")
+    if recovery:
+        st.info(f"Recovered {len(recovery['recovered_fields'])} fields from a malformed response ({recovery['method']}).")
+    if missing_fields:
+        st.warning(f"Response missing fields: {', '.join(missing_fields)}. Using fallback values for those fields.")
+    return validate_and_cache(cache_key, model, json_result, missing_fields)
+
+# Quality-check a fresh result on the validation pool without waiting for it, then cache the checked
+# result if it is complete; returns the result to show now. No Streamlit calls are allowed here.
+def validate_and_cache(cache_key, model, json_result, missing_fields, endpoint="generate"):
+    # Only complete responses are worth serving again
+    def finished(checked):
+        if not missing_fields:
+            cache_result(cache_key, checked, model)
+
+    if validation_pool is None:
+        finished(json_result)
+        return json_result
+    framework = json_result["metadata"]["framework"]
+    device = json_result["metadata"]["device"]
+    repair = None
+    if validation_auto_repair:
+        repair = lambda result, instruction: refine_code(result, instruction, framework, device)
+    return validation_pool.check_later(json_result, framework, device, finished, repair=repair, endpoint=endpoint)
+
+# Swap in the checked (possibly repaired) version of the shown result once its validation is done
+def refresh_validation(result):
+    checked = validation_pool.checked(result) if validation_pool is not None else None
+    if checked is None:
+        return result
+    st.session_state.result = checked
+    if st.session_state.current_entry_id is not None:
+        history_store.add_variant(st.session_state.current_entry_id, checked["metadata"]["device"], checked)
+    return checked
+
+# Redraw the page once the background validation of the shown result is done
+@st.fragment(run_every=1.0)
+def await_validation(result):
+    if not validation_pool.is_checking(result):
+        st.rerun()
+    st.caption("Validating the generated code...")
+
+# Look up a result by exact key, then by prompt similarity among results of the same model (safe to call from worker threads)
+def get_cached_result(prompt, framework, device, model, cache_key):
+    cached = response_cache.get(cache_key)
+    metrics.CACHE_LOOKUPS.inc({"layer": "exact", "result": "hit" if cached is not None else "miss"})
+    if cached is not None:
+        cached["metadata"]["cache_hit"] = True
+        return cached
+    
+    if semantic_cache is None:
+        return None
+    match = semantic_cache.lookup(prompt, framework, device, model)
+    cached = response_cache.get(match[0]) if match is not None else None
+    metrics.CACHE_LOOKUPS.inc({"layer": "semantic", "result": "hit" if cached is not None else "miss"})
+    if match is None:
+        return None
+    
+    matched_key, similarity, matched_prompt = match
+    if cached is None:
+        # The payload expired from the response cache; drop the stale index entry
+        semantic_cache.discard(framework, device, model, matched_key)
+        return None
+    cached["metadata"]["cache_hit"] = True
+    cached["metadata"]["semantic_match"] = {
+        "matched_prompt": matched_prompt,
+        "similarity": round(similarity, 3)
+    }
+    return cached
+
+# Store a complete result in the response cache and index its prompt for similarity lookups
+def cache_result(cache_key, json_result, model):
+    response_cache.set(cache_key, json_result)
+    if semantic_cache is not None:
+        metadata = json_result["metadata"]
+        semantic_cache.add(metadata["prompt"], metadata["framework"], metadata["device"], model, cache_key)
+
+# Function run on the speculative pool; no Streamlit calls are allowed here
+def generate_variant(prompt, framework, device, use_cache=True):
+    route = router.route(prompt, framework, device)
+    cache_key = make_cache_key(prompt, framework, device, route["model"], TEMPERATURE)
+    cached = get_cached_result(prompt, framework, device, route["model"], cache_key) if use_cache else None
+    if cached is not None:
+        return cached
+    
+    return generate_and_cache(prompt, framework, device, route, cache_key, endpoint="speculative")[0]
+
+# Generate with a known route and cache complete results; no Streamlit calls are allowed here
+def generate_and_cache(prompt, framework, device, route, cache_key, endpoint="generate"):
+    json_result, missing_fields = generate_result(
+        get_client(), route["model"], prompt, framework, device,
+        temperature=TEMPERATURE, max_tokens=route["max_tokens"], endpoint=endpoint
+    )
+    router.observe(route, json_result)
+    json_result["metadata"]["cache_hit"] = False
+    return validate_and_cache(cache_key, route["model"], json_result, missing_fields, endpoint), missing_fields
+
+# Whether a prompt is already in the response cache for the model the router would pick
+def is_prompt_warm(prompt, framework, device):
+    route = router.route(prompt, framework, device)
+    return response_cache.contains(make_cache_key(prompt, framework, device, route["model"], TEMPERATURE))
+
+# Warm-up job for one library prompt; returns False when the result was incomplete and not cached
+def warm_library_job(job):
+    route = router.route(job["prompt"], job["framework"], job["device"])
+    cache_key = make_cache_key(job["prompt"], job["framework"], job["device"], route["model"], TEMPERATURE)
+    _, missing_fields = generate_and_cache(job["prompt"], job["framework"], job["device"], route, cache_key, endpoint="warmup")
+    return not missing_fields
+
+# Compare worker: one framework on the shared compare pool; no Streamlit calls are allowed here
+def generate_for_compare(prompt, framework, device, use_cache):
+    started = time.perf_counter()
+    route = router.route(prompt, framework, device)
+    cache_key = make_cache_key(prompt, framework, device, route["model"], TEMPERATURE)
+    result = get_cached_result(prompt, framework, device, route["model"], cache_key) if use_cache else None
+    if result is None:
+        try:
+            result = generate_and_cache(prompt, framework, device, route, cache_key, endpoint="compare")[0]
+        except UpstreamUnavailable:
+            result = response_cache.get_stale(cache_key)
+            if result is None:
+                raise
+            result["metadata"]["cache_hit"] = True
+            result["metadata"]["stale"] = True
+    return result, time.perf_counter() - started
+
+# Function to run one prompt in several frameworks at once and fill a column as each one finishes
+def handle_compare():
+    prompt = st.session_state.prompt_input
+    frameworks = st.session_state.compare_frameworks
+    if not prompt:
+        st.warning("Please enter a prompt first.")
+        return
+    if not frameworks:
+        st.warning("Select at least one framework to compare in the sidebar.")
+        return
+    
+    device = st.session_state.current_device
+    use_cache = not st.session_state.bypass_cache
+    supersede_generation()
+    started = time.perf_counter()
+    futures = {
+        compare_pool.submit(generate_for_compare, prompt, framework, device, use_cache): framework
+        for framework in frameworks
+    }
+    
+    st.subheader("Framework Comparison")
+    placeholders = {}
+    for column, framework in zip(st.columns(len(frameworks)), frameworks):
+        with column:
+            placeholders[framework] = st.empty()
+            placeholders[framework].info(f"Generating {framework}...")
+    
+    comparison = {}
+    for future in as_completed(futures):
+        framework = futures[future]
+        try:
+            result, elapsed = future.result()
+        except Exception as e:
+            placeholders[framework].error(f"{framework}: {str(e)}")
+            continue
+        entry_id = history_store.add_entry(st.session_state.session_id, prompt, framework, device, result)
+        comparison[framework] = {"result": result, "elapsed": elapsed, "entry_id": entry_id}
+        with placeholders[framework].container():
+            render_compare_column(framework, comparison[framework], device)
+    
+    st.session_state.comparison = {
+        "prompt": prompt,
+        "device": device,
+        "frameworks": [framework for framework in frameworks if framework in comparison],
+        "results": comparison,
+        "wall_s": time.perf_counter() - started
+    }
+    st.session_state.show_compare = bool(comparison)
+    st.session_state.show_result = False
+    st.session_state.history_page = 0
+    # Rerun so the finished comparison is drawn once, below, with working "Open" buttons
+    st.rerun()
+
+# One column of the comparison: preview, timing and a button to open it in the full view
+def render_compare_column(framework, item, device):
+    result = item["result"]
+    st.markdown(f"**{framework}**")
+    source = "cached" if result.get("metadata", {}).get("cache_hit") else "generated"
+    st.caption(f"{source} in {item['elapsed']:.1f}s")
+    st.components.v1.iframe(get_html_display(result["interactive_code"]), height=min(DEVICES[device]["height"], 600), scrolling=True)
+    if st.button("Open", key=f"compare_open_{framework}", use_container_width=True):
         st.session_state.result = result
+        st.session_state.current_framework = framework
+        st.session_state.current_entry_id = item["entry_id"]
         st.session_state.show_result = True
+        st.session_state.show_compare = False
+        st.rerun()
+
+# One warmer per process; it runs on its own thread so startup is never blocked
+@st.cache_resource
+def get_catalog_warmer():
+    if not warmup_enabled:
+        return None
+    warmer = create_catalog_warmer(
+        warmup_frameworks,
+        warmup_devices,
+        is_warm=lambda job: is_prompt_warm(job["prompt"], job["framework"], job["device"]),
+        warm=warm_library_job,
+        concurrency=warmup_concurrency,
+        interval_seconds=warmup_interval_seconds
+    )
+    return warmer.start()
 
-# Function to generate code from Claude
-def generate_code(prompt, framework, device):
+catalog_warmer = get_catalog_warmer()
+
+# Start the other device variants of a new generation; identical variants already running are shared
+def start_speculative_variants(prompt, framework, primary_device, use_cache=True):
+    variants = {"prompt": prompt, "framework": framework, "entry_id": None, "futures": {}, "results": {}}
+    for device in DEVICES:
+        if device == primary_device:
+            continue
+        key = (prompt, framework, device)
+        with pending_variants_lock:
+            future = pending_variants.get(key)
+            if future is None:
+                future = speculative_pool.submit(generate_variant, prompt, framework, device, use_cache)
+                pending_variants[key] = future
+        variants["futures"][device] = future
+        future.add_done_callback(lambda done, device=device: finish_speculative_variant(variants, device, done))
+    st.session_state.speculative = variants
+
+# Done callback on the worker thread: keep the variant, and persist it once its history entry exists
+def finish_speculative_variant(variants, device, future):
+    with pending_variants_lock:
+        key = (variants["prompt"], variants["framework"], device)
+        if pending_variants.get(key) is future:
+            del pending_variants[key]
+        if future.exception() is not None:
+            print(f"Speculative {device} variant failed: {str(future.exception())}")
+            return
+        variants["results"][device] = future.result()
+        entry_id = variants["entry_id"]
+    if entry_id is not None:
+        history_store.add_variant(entry_id, device, future.result())
+
+# File the variants of a finished generation under its history entry; later ones are added as they finish
+def attach_speculative_variants(variants, entry_id):
+    with pending_variants_lock:
+        variants["entry_id"] = entry_id
+        finished = dict(variants["results"])
+    for device, variant in finished.items():
+        history_store.add_variant(entry_id, device, variant)
+
+# Return the variant for a device from a history entry, waiting for it if it is still running
+def get_device_variant(entry_id, framework, device):
+    entry = history_store.get_entry(entry_id) if entry_id is not None else None
+    if entry is None or entry['framework'] != framework:
+        return None
+    if device in entry['devices']:
+        return history_store.load(entry_id, device)
+    
+    variants = st.session_state.speculative
+    if variants is None or variants["entry_id"] != entry_id:
+        return None
+    future = variants["futures"].get(device)
+    if future is None:
+        return None
     try:
-        # System message for Claude
-        system_message = f"""
-        You are CodePilot AI, an expert UI developer. Generate:
-        1. Complete, functional code for an interactive UI based on the user's prompt
-        2. The code should be specifically optimized for {device} devices
-        3. Use the {framework} framework/technology
-
-        Your response MUST be a valid JSON object with EXACTLY these fields (all are required):
-        - "interactive_code": A complete self-contained code that can be rendered directly
-        - "separate_code": The code in separate files format
-        - "explanation": Detailed explanation of how the code works and its features
-        - "css_code": Just the CSS/styling component
-        - "framework_specific_code": The main code specific to the chosen framework
-        - "additional_files": Any additional files or components needed
-        """
-        
-        # Default fallback response (simplified for space)
-        fallback_response = {
-            "interactive_code": "<html><body><p>Simple example</p><button>Click me</button></body></html>",
-            "separate_code": {"html": "<button>Click me</button>", "css": "button { padding: 10px; }", "js": "// JS code"},
-            "explanation": "This is a simple example.",
-            "css_code": "button { padding: 10px; background-color: blue; color: white; }",
-            "framework_specific_code": "// Framework code would go here",
-            "additional_files": {}
-        }
-        
-        # Call Claude API
-        response = client.chat.completions.create(
-            model=model_id,
-            messages=[
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": f"Create an interactive UI for: {prompt}. Make it professional, modern, and optimized for {device} with {framework}."}
-            ],
-            response_format={"type": "json_object"},
-            max_tokens=4000,
-            temperature=0.7
-        )
-        
-        # Parse the response
-        result = response.choices[0].message.content
-        
-        try:
-            json_result = json.loads(result)
-            
-            # Check for required fields
-            required_fields = ['interactive_code', 'separate_code', 'explanation', 'css_code', 'framework_specific_code', 'additional_files']
-            missing_fields = [field for field in required_fields if field not in json_result]
-            
-            if missing_fields:
-                st.warning(f"Response missing fields: {', '.join(missing_fields)}. Using fallback values for those fields.")
-                
-                # Add any missing fields with default values
-                for field in missing_fields:
-                    json_result[field] = fallback_response[field]
-                
-            # Add generation metadata
-            json_result["metadata"] = {
-                "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                "prompt": prompt,
-                "framework": framework,
-                "device": device
-            }
-            
-            return json_result
-            
-        except json.JSONDecodeError as e:
-            st.error(f"Error parsing JSON response: {str(e)}")
-            return fallback_response
-            
+        return future.result()
+    except Exception:
+        return None
+
+# Function to apply a small change as model-proposed edits; returns None when a full generation is needed
+def refine_code(result, instruction, framework, device):
+    if result.get("metadata", {}).get("framework") != framework:
+        return None
+    try:
+        return refine_result(get_client(), model_id, result, instruction, framework, device)
     except Exception as e:
-        st.error(f"Error generating code: {str(e)}")
-        return fallback_response
+        print(f"Refinement failed, falling back to full generation: {str(e)}")
+        return None
+
+# Function to handle the refine form: edit the current result and record it as a new history entry
+def handle_refine(instruction):
+    result = st.session_state.result
+    prompt = result.get("metadata", {}).get("prompt", "")
+    framework = st.session_state.current_framework
+    device = st.session_state.current_device
+    context = {"action": "refine", "title": f"{prompt} ({instruction})"}
+    supersede_generation(f"{prompt}. {instruction}", framework, device)
+    
+    with st.spinner("Applying your changes..."):
+        refined = refine_code(result, instruction, framework, device)
+        if refined is None:
+            st.toast("Couldn't apply that as a small edit, so the full UI was regenerated.")
+            refined = generate_code(f"{prompt}. {instruction}", framework, device, use_cache=not st.session_state.bypass_cache, context=context)
+    finish_refine(refined, dict(context, framework=framework, device=device))
+
+# Record a refined result as a new history entry
+def finish_refine(result, context):
+    entry_id = history_store.add_entry(st.session_state.session_id, context["title"], context["framework"], context["device"], result)
+    st.session_state.current_entry_id = entry_id
+    st.session_state.history_page = 0
+    st.session_state.result = result
+
+# Show a device variant and store it with its history entry
+def finish_device_switch(result, context):
+    entry_id, framework, device = context["entry_id"], context["framework"], context["device"]
+    st.session_state.result = result
+    entry = history_store.get_entry(entry_id) if entry_id is not None else None
+    if entry is not None and entry['framework'] == framework and "metadata" in result:
+        history_store.add_variant(entry_id, device, result)
+        history_store.set_device(entry_id, device)
+
+# How resume_generation finishes each kind of tracked generation
+GENERATION_FINISHERS = {"generate": finish_generation, "refine": finish_refine, "device": finish_device_switch}
+
+# Cancel the session's in-flight generation unless it is for this same prompt, framework and device
+def supersede_generation(prompt=None, framework=None, device=None):
+    ticket = generation_tracker.pending(st.session_state.session_id)
+    if ticket is None:
+        return
+    context = ticket.context
+    if (context["prompt"], context["framework"], context["device"]) != (prompt, framework, device):
+        generation_tracker.cancel(st.session_state.session_id)
 
 # Function to create an HTML display for the interactive code
-def get_html_display(html_code):
+def get_html_display(html_code, inline=False):
+    # Point the iframe at a stable, cacheable artifact URL when the server is available.
+    # Partial previews while streaming stay inline: each one would be a new artifact that is never shown again.
+    if artifact_store is not None and not inline:
+        name = artifact_store.put(html_code)
+        return f"{artifact_public_url}{ARTIFACT_PREFIX}{name}"
+    
     # Encode the HTML to display in an iframe
     encoded = base64.b64encode(html_code.encode()).decode()
     return f'data:text/html;base64,{encoded}'
 
+# Download button for a single file; the content is only handed to Streamlit when clicked
+def file_download_button(label, content, file_name, mime):
+    st.download_button(label, lambda: content, file_name, mime)
+
 # Sidebar for settings and history
 with st.sidebar:
     st.title("CodePilot AI")
@@ -230,20 +602,82 @@ with st.sidebar:
     if selected_category:
         prompts = PROMPT_LIBRARY[selected_category]
         selected_prompt = st.selectbox("Select Prompt", prompts)
+        if is_prompt_warm(selected_prompt, st.session_state.current_framework, st.session_state.current_device):
+            st.caption(f"⚡ Pre-warmed for {st.session_state.current_framework} / {st.session_state.current_device}: serves instantly")
+        else:
+            st.caption(f"Not cached yet for {st.session_state.current_framework} / {st.session_state.current_device}")
         
         # Button to use the selected prompt
         if st.button("Use This Prompt", use_container_width=True):
             st.session_state.prompt_text = selected_prompt
     
-    # History section (if exists)
-    if st.session_state.history:
-        st.subheader("History")
-        for idx, item in enumerate(st.session_state.history):
-            if st.button(f"{item['prompt'][:30]}...", key=f"history_{idx}", use_container_width=True):
-                st.session_state.result = item['result']
+    # Generation and response cache controls
+    st.subheader("Generation Settings")
+    st.checkbox("Stream results", key="stream_results", help="Show the explanation, CSS and preview as soon as each part arrives")
+    st.checkbox("Bypass cache", key="bypass_cache", help="Always call the model, even for repeated requests")
+    st.multiselect("Compare frameworks", FRAMEWORKS, key="compare_frameworks",
+                   help="Frameworks generated side by side by the Compare button")
+    cache_stats = response_cache.stats()
+    st.caption(f"Hits: {cache_stats['hits']} · Misses: {cache_stats['misses']} · Hit rate: {cache_stats['hit_rate']:.0%}")
+    if semantic_cache is not None:
+        semantic_stats = semantic_cache.stats()
+        st.caption(f"Similar-prompt hits: {semantic_stats['hits']} · Indexed prompts: {semantic_stats['entries']}")
+    if catalog_warmer is not None:
+        warmup_status = catalog_warmer.status()
+        st.caption(f"Library warm-up ({warmup_status['state']}): {warmup_status['warmed']} generated · "
+                   f"{warmup_status['skipped']} already cached · {warmup_status['failed']} failed of {warmup_status['total']}")
+    if breaker.state != "closed":
+        st.caption(f"⚠️ Model API circuit breaker is {breaker.state.replace('_', '-')}; serving cached results where possible")
+    
+    # Upstream call metrics for this server process
+    with st.expander("Metrics"):
+        metric_rows = metrics.summary()
+        if metric_rows:
+            st.dataframe(metric_rows, hide_index=True, use_container_width=True)
+        else:
+            st.caption("No model calls yet.")
+        route_stats = router.stats()
+        if route_stats:
+            st.caption("Learned completion tokens per category")
+            st.dataframe([dict(category=category, **stats) for category, stats in route_stats.items()],
+                         hide_index=True, use_container_width=True)
+    
+    # History section: summaries come from the store, full results load on click
+    st.subheader("History")
+    history_query = st.text_input("Search history", key="history_query", placeholder="Filter by prompt")
+    if history_query != st.session_state.get("last_history_query", ""):
+        st.session_state.last_history_query = history_query
+        st.session_state.history_page = 0
+    
+    entries, total_entries = history_store.list_entries(
+        st.session_state.session_id,
+        query=history_query,
+        offset=st.session_state.history_page * HISTORY_PAGE_SIZE,
+        limit=HISTORY_PAGE_SIZE
+    )
+    for entry in entries:
+        if st.button(entry['preview'], key=f"history_{entry['id']}", use_container_width=True):
+            loaded = history_store.load(entry['id'])
+            if loaded is not None:
+                supersede_generation()
+                st.session_state.result = loaded
                 st.session_state.show_result = True
-                st.session_state.current_framework = item['framework']
-                st.session_state.current_device = item['device']
+                st.session_state.current_entry_id = entry['id']
+                st.session_state.current_framework = entry['framework']
+                st.session_state.current_device = entry['device']
+    
+    if total_entries > HISTORY_PAGE_SIZE:
+        page_count = (total_entries + HISTORY_PAGE_SIZE - 1) // HISTORY_PAGE_SIZE
+        prev_col, page_col, next_col = st.columns([1, 2, 1])
+        if prev_col.button("‹", key="history_prev", disabled=st.session_state.history_page == 0):
+            st.session_state.history_page -= 1
+            st.rerun()
+        page_col.caption(f"Page {st.session_state.history_page + 1} of {page_count}")
+        if next_col.button("›", key="history_next", disabled=st.session_state.history_page >= page_count - 1):
+            st.session_state.history_page += 1
+            st.rerun()
+    elif not entries:
+        st.caption("No matching history." if history_query else "No history yet.")
 
 # Main content area
 st.title("CodePilot AI")
@@ -263,8 +697,9 @@ with st.container():
     with col2:
         st.write("")
         st.write("")
-        if st.button("Generate UI", type="primary", use_container_width=True):
-            handle_form_submit()
+        generate_clicked = st.button("Generate UI", type="primary", use_container_width=True)
+        compare_clicked = st.button("Compare", use_container_width=True,
+                                    help="Generate the prompt in every framework selected in the sidebar at once")
         
         if st.button("Clear", use_container_width=True):
             clear_input()
@@ -275,9 +710,26 @@ with st.container():
     with col2:
         st.info(f"Device: {st.session_state.current_device}")
 
+# Run the generation outside the narrow button column so streamed output gets the full width
+if generate_clicked:
+    handle_form_submit()
+elif compare_clicked:
+    handle_compare()
+
+# Display the last comparison until a single result is opened or generated
+if st.session_state.show_compare and 'comparison' in st.session_state:
+    comparison = st.session_state.comparison
+    st.subheader("Framework Comparison")
+    total_s = sum(item["elapsed"] for item in comparison["results"].values())
+    st.caption(f"{comparison['prompt'][:80]} · {comparison['device']} · "
+               f"{comparison['wall_s']:.1f}s wall time for {total_s:.1f}s of generation")
+    for column, framework in zip(st.columns(len(comparison["frameworks"])), comparison["frameworks"]):
+        with column:
+            render_compare_column(framework, comparison["results"][framework], comparison["device"])
+
 # Display results if available
 if 'show_result' in st.session_state and st.session_state.show_result and 'result' in st.session_state:
-    result = st.session_state.result
+    result = refresh_validation(st.session_state.result)
     
     # Create tabs for different sections
     preview_tab, code_tab, explanation_tab = st.tabs(["UI Preview", "Code", "Explanation"])
@@ -294,14 +746,24 @@ if 'show_result' in st.session_state and st.session_state.show_result and 'resul
                 if 'result' in st.session_state and st.session_state.result:
                     prompt = st.session_state.result["metadata"]["prompt"]
                     framework = st.session_state.current_framework
+                    entry_id = st.session_state.current_entry_id
+                    supersede_generation(prompt, framework, device)
                     with st.spinner(f"Optimizing for {device}..."):
-                        new_result = generate_code(prompt, framework, device)
-                        st.session_state.result = new_result
-                        result = new_result
+                        # Prefer the speculatively generated variant over a fresh call
+                        new_result = get_device_variant(entry_id, framework, device)
+                        if new_result is None and refine_device_switch:
+                            new_result = refine_code(
+                                st.session_state.result,
+                                f"Adapt the layout for {device} devices with a {DEVICES[device]['width']}px wide viewport",
+                                framework,
+                                device
+                            )
+                        if new_result is None:
+                            new_result = generate_code(prompt, framework, device, use_cache=not st.session_state.bypass_cache,
+                                                       context={"action": "device", "entry_id": entry_id})
                         # Update history
-                        if st.session_state.history:
-                            st.session_state.history[0]['result'] = new_result
-                            st.session_state.history[0]['device'] = device
+                        finish_device_switch(new_result, {"entry_id": entry_id, "framework": framework, "device": device})
+                        result = new_result
         
         # Create a centered container for the preview
         col1, preview_col, col2 = st.columns([1, 10, 1])
@@ -312,13 +774,9 @@ if 'show_result' in st.session_state and st.session_state.show_result and 'resul
             
             # Add device frame styling
             if st.session_state.current_device == "Mobile":
-                st.markdown("""
-                <div style="margin: 0 auto; max-width: 375px; border: 12px solid #222; border-radius: 25px; overflow: hidden;">
-                """, unsafe_allow_html=True)
+                st.markdown(DEVICE_FRAME_HTML["Mobile"], unsafe_allow_html=True)
             elif st.session_state.current_device == "Tablet":
-                st.markdown("""
-                <div style="margin: 0 auto; max-width: 768px; border: 16px solid #222; border-radius: 25px; overflow: hidden;">
-                """, unsafe_allow_html=True)
+                st.markdown(DEVICE_FRAME_HTML["Tablet"], unsafe_allow_html=True)
             
             # Display the iframe with proper integer dimensions
             st.components.v1.iframe(
@@ -331,6 +789,35 @@ if 'show_result' in st.session_state and st.session_state.show_result and 'resul
             # Close the device frame div
             if st.session_state.current_device in ["Mobile", "Tablet"]:
                 st.markdown("</div>", unsafe_allow_html=True)
+        
+        # Problems found by the validation pool when the result was generated
+        report = result.get("metadata", {}).get("validation")
+        if validation_pool is not None and validation_pool.is_checking(result):
+            await_validation(result)
+        if report and report.get("repair"):
+            if report["repair"]["errors_after"] is None:
+                st.warning(f"Found {report['errors']} problems in the generated code; the automatic repair did not fix them.")
+            else:
+                st.info(f"Automatically repaired the generated code ({report['repair']['errors_before']} problems found).")
+        if report and report.get("issues"):
+            with st.expander(f"Quality report: {report['errors']} errors, {report['warnings']} warnings"):
+                for item in report["issues"]:
+                    st.markdown(f"- **{item['severity']}** `{item['field']}`: {item['message']}")
+        
+        # Small tweaks are sent as edits to the current code instead of a full regeneration
+        if "metadata" in result:
+            refine_col, refine_button_col = st.columns([4, 1])
+            with refine_col:
+                refine_instruction = st.text_input("Refine this UI",
+                                                   placeholder="E.g., change the button color to green",
+                                                   key="refine_instruction")
+            with refine_button_col:
+                st.write("")
+                st.write("")
+                refine_clicked = st.button("Refine", use_container_width=True)
+            if refine_clicked and refine_instruction:
+                handle_refine(refine_instruction)
+                st.rerun()
     
     with code_tab:
         framework = st.session_state.current_framework
@@ -341,48 +828,42 @@ if 'show_result' in st.session_state and st.session_state.show_result and 'resul
             
             with html_tab:
                 st.code(result["separate_code"].get("html", ""), language="html")
-                st.download_button("Download HTML", result["separate_code"].get("html", ""), "index.html", "text/html")
+                file_download_button("Download HTML", result["separate_code"].get("html", ""), "index.html", "text/html")
             
             with css_tab:
                 st.code(result["css_code"], language="css")
-                st.download_button("Download CSS", result["css_code"], "styles.css", "text/css")
+                file_download_button("Download CSS", result["css_code"], "styles.css", "text/css")
             
             with js_tab:
                 st.code(result["separate_code"].get("js", ""), language="javascript")
-                st.download_button("Download JavaScript", result["separate_code"].get("js", ""), "script.js", "text/javascript")
+                file_download_button("Download JavaScript", result["separate_code"].get("js", ""), "script.js", "text/javascript")
         
         elif framework == "React":
             component_tab, css_tab = st.tabs(["React Component", "CSS/Styling"])
             
             with component_tab:
                 st.code(result["framework_specific_code"], language="jsx")
-                st.download_button("Download Component", result["framework_specific_code"], "Component.jsx", "text/plain")
+                file_download_button("Download Component", result["framework_specific_code"], "Component.jsx", "text/plain")
             
             with css_tab:
                 st.code(result["css_code"], language="css")
-                st.download_button("Download CSS", result["css_code"], "styles.css", "text/css")
+                file_download_button("Download CSS", result["css_code"], "styles.css", "text/css")
         
         elif framework in ["Vue.js", "Angular", "Svelte"]:
             st.code(result["framework_specific_code"], language="javascript")
-            st.download_button(f"Download {framework} Component", result["framework_specific_code"], f"Component.{framework.lower().replace('.', '')}", "text/plain")
+            file_download_button(f"Download {framework} Component", result["framework_specific_code"], f"Component.{framework.lower().replace('.', '')}", "text/plain")
             
             st.subheader("CSS/Styling")
             st.code(result["css_code"], language="css")
-            st.download_button("Download CSS", result["css_code"], "styles.css", "text/css")
+            file_download_button("Download CSS", result["css_code"], "styles.css", "text/css")
         
-        # Download complete code package
+        # Download the whole project; the ZIP is only built when the button is clicked
         st.subheader("Download Complete Code")
         st.download_button(
-            label=f"Download {framework} Package",
-            data=json.dumps({
-                "metadata": result["metadata"],
-                "files": result["separate_code"],
-                "css_code": result["css_code"],
-                "framework_specific_code": result["framework_specific_code"],
-                "additional_files": result["additional_files"]
-            }, indent=2),
-            file_name=f"codepilot_package.json",
-            mime="application/json",
+            label=f"Download {framework} Project (.zip)",
+            data=lambda: project_exporter.build(result, framework),
+            file_name=f"{project_slug(framework)}.zip",
+            mime="application/zip",
         )
     
     with explanation_tab:
@@ -393,44 +874,12 @@ if 'show_result' in st.session_state and st.session_state.show_result and 'resul
         st.subheader(f"{framework} Implementation Details")
         st.info(f"This implementation uses {framework} with best practices for {st.session_state.current_device} devices.")
 
+# Pick up a generation whose page run was interrupted by an unrelated click
+resume_generation()
+
 # Add footer
 st.markdown("---")
-st.markdown("""
-<footer>
-    <p style="text-align: center; color: #888; font-size: 0.8em;">© 2025 CodePilot AI - Powered by Claude 3.7 Sonnet</p>
-</footer>
-""", unsafe_allow_html=True)
+st.markdown(FOOTER_HTML, unsafe_allow_html=True)
 
 # Custom CSS for cleaner UI
-st.markdown("""
-<style>
-    /* Clean, modern UI styling */
-    .main .block-container {
-        padding-top: 1rem;
-    }
-    
-    .stButton button {
-        border-radius: 4px;
-        font-weight: 500;
-    }
-    
-    .stTabs [data-baseweb="tab-list"] {
-        gap: 2px;
-    }
-    
-    .stTabs [data-baseweb="tab"] {
-        height: 40px;
-        border-radius: 4px 4px 0px 0px;
-        padding: 10px 16px;
-    }
-    
-    [data-testid="stCodeBlock"] {
-        max-height: 500px;
-    }
-    
-    iframe {
-        border: none;
-        background-color: white;
-    }
-</style>
-""", unsafe_allow_html=True)
+st.markdown(APP_CSS, unsafe_allow_html=True)
@@ -0,0 +1,157 @@
+# app_resources.py - Settings and process-wide resources of the Streamlit app
+# Streamlit re-executes app.py on every interaction but imports this module once per process,
+# so the settings are read and the cached factories are defined only once.
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from response_cache import ResponseCache
+import semantic_cache as semantic
+from history_store import create_history_store
+from artifact_server import ArtifactStore, is_serving, start_artifact_server
+from project_export import ProjectExporter
+from validation import ValidationPool
+from generation_tracker import GenerationTracker
+
+# Stream results into the page while the model is still generating
+streaming_enabled = os.getenv("STREAMING_ENABLED", "true").lower() == "true"
+
+# Response cache settings (set CACHE_DB_PATH to an empty string to keep the cache in memory only)
+cache_max_bytes = int(os.getenv("CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+cache_ttl_seconds = int(os.getenv("CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+cache_db_path = os.getenv("CACHE_DB_PATH", ".codepilot_cache.sqlite3")
+# Expired results are kept this much longer to serve while the model API is unavailable
+cache_stale_seconds = int(os.getenv("CACHE_STALE_SECONDS", str(7 * 24 * 3600)))
+
+# Optional near-duplicate prompt matching in front of the exact cache (requires numpy)
+semantic_cache_enabled = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+semantic_cache_threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.85"))
+semantic_cache_max_entries = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "500"))
+
+# History backend ("sqlite" or "memory"); payloads are stored compressed and shared across sessions
+history_backend = os.getenv("HISTORY_BACKEND", "sqlite")
+history_db_path = os.getenv("HISTORY_DB_PATH", ".codepilot_history.sqlite3")
+history_retention_days = float(os.getenv("HISTORY_RETENTION_DAYS", "30"))
+HISTORY_PAGE_SIZE = 10
+
+# Serve previews from a content-addressed artifact server instead of data: URIs. Off by default:
+# ARTIFACT_PUBLIC_URL must be reachable from the browser, which "localhost" is only for local use.
+artifact_server_enabled = os.getenv("ARTIFACT_SERVER_ENABLED", "false").lower() == "true"
+artifact_dir = os.getenv("ARTIFACT_DIR", ".codepilot_artifacts")
+artifact_host = os.getenv("ARTIFACT_HOST", "127.0.0.1")
+artifact_port = int(os.getenv("ARTIFACT_PORT", "8502"))
+artifact_public_url = os.getenv("ARTIFACT_PUBLIC_URL", f"http://localhost:{artifact_port}")
+# Previews unused this long, and the oldest beyond the size cap, are deleted
+artifact_max_bytes = int(float(os.getenv("ARTIFACT_MAX_MB", "256")) * 1024 * 1024)
+artifact_max_age_seconds = float(os.getenv("ARTIFACT_MAX_AGE_DAYS", "7")) * 24 * 3600
+
+# Compare mode: frameworks preselected and the process-wide cap on concurrent compare calls
+compare_default_frameworks = [name.strip() for name in os.getenv("COMPARE_FRAMEWORKS", "React,Vue.js,Svelte").split(",") if name.strip()]
+compare_max_concurrency = int(os.getenv("COMPARE_MAX_CONCURRENCY", "3"))
+
+# Upstream generations run off the page thread so a newer click can cancel or join them; this caps them per process
+generation_max_concurrency = int(os.getenv("GENERATION_MAX_CONCURRENCY", "32"))
+# Finished generations nobody collected (the session went away) are dropped after this long
+generation_result_ttl_seconds = float(os.getenv("GENERATION_RESULT_TTL_SECONDS", "600"))
+
+# Check generated HTML, CSS and JS on worker processes; optionally make one repair call for broken output
+validation_enabled = os.getenv("VALIDATION_ENABLED", "true").lower() == "true"
+validation_workers = int(os.getenv("VALIDATION_WORKERS", "2"))
+validation_timeout_seconds = float(os.getenv("VALIDATION_TIMEOUT_SECONDS", "5"))
+validation_auto_repair = os.getenv("VALIDATION_AUTO_REPAIR", "false").lower() == "true"
+
+# Memory kept for recently exported project ZIPs
+export_cache_max_bytes = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Switch devices by asking for edits to the current result instead of regenerating it
+refine_device_switch = os.getenv("REFINE_DEVICE_SWITCH", "true").lower() == "true"
+
+# Pre-generate the prompt library into the response cache in the background at startup
+warmup_enabled = os.getenv("WARMUP_ENABLED", "false").lower() == "true"
+warmup_frameworks = [name.strip() for name in os.getenv("WARMUP_FRAMEWORKS", "HTML/CSS/JS").split(",") if name.strip()]
+warmup_devices = [name.strip() for name in os.getenv("WARMUP_DEVICES", "Desktop").split(",") if name.strip()]
+warmup_concurrency = int(os.getenv("WARMUP_CONCURRENCY", "2"))
+# Re-check the library this often to refill expired entries (0 = warm once at startup)
+warmup_interval_seconds = float(os.getenv("WARMUP_INTERVAL_SECONDS", "0"))
+
+# Generate the other device variants in the background alongside each new generation, so switching devices is
+# instant. Each variant is a full generation: an uncached prompt then costs three upstream calls instead of one.
+speculative_variants = os.getenv("SPECULATIVE_VARIANTS", "false").lower() == "true"
+speculative_max_concurrency = int(os.getenv("SPECULATIVE_MAX_CONCURRENCY", "2"))
+
+# The cache has to outlive Streamlit reruns, so build it once per process
+@st.cache_resource
+def get_response_cache():
+    return ResponseCache(
+        max_bytes=cache_max_bytes,
+        ttl_seconds=cache_ttl_seconds,
+        db_path=cache_db_path or None,
+        stale_ttl_seconds=cache_stale_seconds
+    )
+
+@st.cache_resource
+def get_semantic_cache():
+    if not semantic_cache_enabled:
+        return None
+    if not semantic.is_available():
+        print("SEMANTIC_CACHE_ENABLED is set but numpy is not installed; semantic cache disabled")
+        return None
+    return semantic.SemanticCache(
+        threshold=semantic_cache_threshold,
+        max_entries=semantic_cache_max_entries
+    )
+
+# Shared worker pool for speculative device variants; its size caps concurrent speculative calls
+@st.cache_resource
+def get_speculative_pool():
+    return ThreadPoolExecutor(max_workers=max(1, speculative_max_concurrency), thread_name_prefix="speculative")
+
+# Worker processes are started on the first validation, not at startup
+@st.cache_resource
+def get_validation_pool():
+    if not validation_enabled:
+        return None
+    return ValidationPool(workers=validation_workers, timeout=validation_timeout_seconds)
+
+# Shared by every session, so concurrent comparisons queue instead of multiplying upstream calls
+@st.cache_resource
+def get_compare_pool():
+    return ThreadPoolExecutor(max_workers=max(1, compare_max_concurrency), thread_name_prefix="compare")
+
+# Each session's in-flight generation, shared by all sessions of the process
+@st.cache_resource
+def get_generation_tracker():
+    executor = ThreadPoolExecutor(max_workers=max(1, generation_max_concurrency), thread_name_prefix="generation")
+    return GenerationTracker(executor, result_ttl=generation_result_ttl_seconds)
+
+@st.cache_resource
+def get_history_store():
+    store = create_history_store(history_backend, history_db_path)
+    store.prune(history_retention_days * 24 * 3600)
+    return store
+
+# Start the artifact server once per process; returns the store, or None to fall back to data: URIs
+@st.cache_resource
+def get_artifact_store():
+    if not artifact_server_enabled:
+        return None
+    store = ArtifactStore(artifact_dir, max_bytes=artifact_max_bytes, max_age=artifact_max_age_seconds)
+    try:
+        start_artifact_server(store, artifact_host, artifact_port)
+    except OSError as e:
+        # Fine when another app process already serves the same directory on this port
+        if not is_serving(store, artifact_host, artifact_port):
+            print(f"Artifact server not started ({str(e)}) and nothing serves artifacts on port {artifact_port}; "
+                  f"previews use data: URIs")
+            return None
+    return store
+
+# Speculative variants still running, keyed by (prompt, framework, device); shared by all sessions
+@st.cache_resource
+def get_pending_variants():
+    return {}, threading.Lock()
+
+# Project ZIPs are built on the first download click and reused by content hash
+@st.cache_resource
+def get_project_exporter():
+    return ProjectExporter(max_bytes=export_cache_max_bytes)
@@ -0,0 +1,208 @@
+# artifact_server.py - Content-addressed store and static server for generated previews
+import os
+import gzip
+import time
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+ARTIFACT_PREFIX = "/artifacts/"
+
+
+class ArtifactStore:
+    """Write each artifact once under its SHA-256, with precompressed copies.
+
+    Files are named `<hash>.html` (plus `.gz` and, when brotli is installed,
+    `.br`), so a URL never changes meaning and can be cached forever.
+    Artifacts unused for `max_age` seconds, and the least recently used
+    ones beyond `max_bytes`, are deleted; `put` checks at most once every
+    `prune_interval` seconds. A pruned preview is written again the next
+    time it is shown.
+    """
+
+    def __init__(self, directory, max_bytes=256 * 1024 * 1024, max_age=7 * 24 * 3600, prune_interval=60.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.prune_interval = prune_interval
+        self._pruned_at = 0.0
+        self._prune_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def put(self, content):
+        """Store `content` (str) if needed and return its artifact name"""
+        data = content.encode("utf-8")
+        name = hashlib.sha256(data).hexdigest() + ".html"
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            # Mark it as recently used, so pruning removes older previews first
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        else:
+            self._write(path + ".gz", gzip.compress(data, compresslevel=6))
+            if brotli is not None:
+                self._write(path + ".br", brotli.compress(data))
+            # The plain file is written last and marks the artifact as complete
+            self._write(path, data)
+        if time.time() - self._pruned_at >= self.prune_interval:
+            self.prune()
+        return name
+
+    def prune(self):
+        """Delete expired artifacts, then the least recently used ones until under `max_bytes`"""
+        if not self._prune_lock.acquire(blocking=False):
+            return
+        try:
+            self._pruned_at = time.time()
+            artifacts = []
+            for name in os.listdir(self.directory):
+                if not is_artifact_name(name):
+                    continue
+                try:
+                    used = os.path.getmtime(os.path.join(self.directory, name))
+                    size = sum(os.path.getsize(self.path_for(name, encoding))
+                               for encoding in (None, "gzip", "br") if os.path.exists(self.path_for(name, encoding)))
+                except OSError:
+                    continue
+                artifacts.append((used, size, name))
+            artifacts.sort()
+            total = sum(size for _, size, _ in artifacts)
+            cutoff = time.time() - self.max_age
+            for used, size, name in artifacts:
+                if used >= cutoff and total <= self.max_bytes:
+                    break
+                # The plain file goes first, so a half-deleted artifact is never served
+                for encoding in (None, "gzip", "br"):
+                    try:
+                        os.remove(self.path_for(name, encoding))
+                    except OSError:
+                        pass
+                total -= size
+        finally:
+            self._prune_lock.release()
+
+    def path_for(self, name, encoding=None):
+        suffix = {"br": ".br", "gzip": ".gz"}.get(encoding, "")
+        return os.path.join(self.directory, name + suffix)
+
+    def _write(self, path, data):
+        # Write to a temp file and rename so readers never see a partial artifact
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_path, path)
+
+
+def is_artifact_name(name):
+    stem, _, extension = name.partition(".")
+    return extension == "html" and len(stem) == 64 and all(c in "0123456789abcdef" for c in stem)
+
+
+def make_handler(store, max_age=31536000):
+    class ArtifactHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def do_HEAD(self):
+            self._serve(send_body=False)
+
+        def do_GET(self):
+            self._serve(send_body=True)
+
+        def _serve(self, send_body):
+            name = self.path.split("?", 1)[0]
+            if not name.startswith(ARTIFACT_PREFIX) or not is_artifact_name(name[len(ARTIFACT_PREFIX):]):
+                self._send_status(404)
+                return
+            name = name[len(ARTIFACT_PREFIX):]
+            if not os.path.exists(store.path_for(name)):
+                self._send_status(404)
+                return
+
+            etag = f'"{name[:-5]}"'
+            if etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.send_header("Cache-Control", f"public, max-age={max_age}, immutable")
+                self.end_headers()
+                return
+
+            accepted = self.headers.get("Accept-Encoding", "")
+            encoding = None
+            if "br" in accepted and os.path.exists(store.path_for(name, "br")):
+                encoding = "br"
+            elif "gzip" in accepted:
+                encoding = "gzip"
+
+            with open(store.path_for(name, encoding), "rb") as f:
+                data = f.read()
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", f"public, max-age={max_age}, immutable")
+            self.send_header("Vary", "Accept-Encoding")
+            if encoding:
+                self.send_header("Content-Encoding", encoding)
+            self.end_headers()
+            if send_body:
+                self.wfile.write(data)
+
+        def _send_status(self, status):
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+    return ArtifactHandler
+
+
+def is_serving(store, host, port, timeout=2.0):
+    """Whether an artifact server for `store` answers on host:port (e.g. one started by another process)"""
+    import http.client
+    name = store.put("<!-- artifact server check -->")
+    try:
+        connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        connection.request("HEAD", ARTIFACT_PREFIX + name)
+        return connection.getresponse().status == 200
+    except OSError:
+        return False
+
+
+def start_artifact_server(store, host="127.0.0.1", port=8502):
+    """Serve `store` on a background thread and return the server"""
+    server = ThreadingHTTPServer((host, port), make_handler(store))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="artifact-server", daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve generated preview artifacts")
+    parser.add_argument("--directory", default=os.getenv("ARTIFACT_DIR", ".codepilot_artifacts"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("ARTIFACT_PORT", "8502")))
+    args = parser.parse_args()
+
+    server = start_artifact_server(ArtifactStore(args.directory), args.host, args.port)
+    print(f"Serving artifacts from {args.directory} on http://{args.host}:{server.server_address[1]}{ARTIFACT_PREFIX}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+# batch_generate.py - Headless batch generation over the PROMPT_LIBRARY matrix
+import os
+import json
+import time
+import random
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import upstream_guard
+from llm_client import get_client, model_id
+from metrics import percentile
+from codegen import TEMPERATURE, generate_result
+from routing import get_router
+from prompt_library import DEVICES, FRAMEWORKS, PROMPT_LIBRARY
+from response_cache import ResponseCache, make_cache_key
+
+
+def build_jobs(categories=None, frameworks=None, devices=None):
+    """Expand the category x prompt x framework x device matrix into job dicts"""
+    jobs = []
+    for category, prompts in PROMPT_LIBRARY.items():
+        if categories and category not in categories:
+            continue
+        for prompt in prompts:
+            for framework in FRAMEWORKS:
+                if frameworks and framework not in frameworks:
+                    continue
+                for device in DEVICES:
+                    if devices and device not in devices:
+                        continue
+                    jobs.append({
+                        "category": category,
+                        "prompt": prompt,
+                        "framework": framework,
+                        "device": device
+                    })
+    return jobs
+
+
+def load_completed(output_path):
+    """Return the job ids that already finished successfully in a previous run"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A partial last line from an interrupted run
+                continue
+            if record.get("status") == "ok":
+                completed.add(record["id"])
+    return completed
+
+
+def run_job(client, model_id, job, max_retries, backoff_base, max_tokens):
+    """Generate one job, retrying only what another attempt can fix.
+
+    upstream_guard already retries transient provider errors, so a job is
+    only retried here when the guard refused the call (rate limit or open
+    breaker, after waiting its `retry_after`) or the response could not be
+    parsed. Waiting for quota does not use up a retry; anything else fails
+    the job at once. With `max_tokens` set, every attempt uses `model_id`
+    and that budget; otherwise the router picks both from the job's category.
+    """
+    router = get_router()
+    attempts = 0
+    retries = 0
+    while True:
+        attempts += 1
+        started = time.perf_counter()
+        route = router.route(job["prompt"], job["framework"], job["device"])
+        if max_tokens:
+            route = dict(route, model=model_id, max_tokens=max_tokens)
+        try:
+            result, missing_fields = generate_result(
+                client, route["model"], job["prompt"], job["framework"], job["device"],
+                temperature=TEMPERATURE, max_tokens=route["max_tokens"], endpoint="batch"
+            )
+            router.observe(route, result)
+        except (upstream_guard.UpstreamUnavailable, json.JSONDecodeError) as e:
+            if not isinstance(e, upstream_guard.RateLimitExceeded):
+                retries += 1
+            if retries > max_retries:
+                return failed_job(attempts, started, e)
+            if isinstance(e, upstream_guard.UpstreamUnavailable):
+                time.sleep(e.retry_after)
+            else:
+                time.sleep(backoff_base * (2 ** (retries - 1)) * (0.5 + random.random()))
+            continue
+        except Exception as e:
+            return failed_job(attempts, started, e)
+
+        return {
+            "status": "ok",
+            "attempts": attempts,
+            "latency_s": time.perf_counter() - started,
+            "missing_fields": missing_fields,
+            "usage": result["metadata"].get("usage", {}),
+            "result": result
+        }
+
+
+def failed_job(attempts, started, error):
+    return {
+        "status": "error",
+        "attempts": attempts,
+        "latency_s": time.perf_counter() - started,
+        "error": str(error)
+    }
+
+
+def run_batch(client, model_id, output_path, jobs, concurrency=4, requests_per_minute=0,
+              tokens_per_minute=0, max_retries=3, backoff_base=2.0, max_tokens=None,
+              cache=None, log=print):
+    """Run `jobs`, appending one JSONL record per job to `output_path`.
+
+    Jobs that already succeeded in `output_path` are skipped, so an interrupted
+    run can be resumed with the same arguments. Complete results are also
+    written to `cache` when one is given. A request or token limit replaces
+    the process-wide limiter of upstream_guard, so the runner is paced by the
+    same buckets as every other upstream call. Returns a summary dict.
+    """
+    if requests_per_minute or tokens_per_minute:
+        upstream_guard.limiter = upstream_guard.RateLimiter(
+            requests_per_minute or upstream_guard.requests_per_minute,
+            tokens_per_minute or upstream_guard.tokens_per_minute
+        )
+
+    completed = load_completed(output_path)
+    router = get_router()
+    pending = []
+    for job in jobs:
+        # Key by the model that will answer, so warmed cache entries match the app's lookups
+        job_model = model_id if max_tokens else router.route(job["prompt"], job["framework"], job["device"])["model"]
+        job_id = make_cache_key(job["prompt"], job["framework"], job["device"], job_model, TEMPERATURE)
+        if job_id not in completed:
+            pending.append(dict(job, id=job_id))
+
+    log(f"{len(jobs)} jobs in matrix, {len(jobs) - len(pending)} already done, {len(pending)} to run")
+
+    latencies = []
+    counts = {"ok": 0, "error": 0}
+    tokens_used = 0
+    started = time.perf_counter()
+
+    with open(output_path, "a", encoding="utf-8") as output, \
+            ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        # Start on a fresh line if the previous run was cut off mid-record
+        if output.tell() > 0:
+            with open(output_path, "rb") as existing:
+                existing.seek(-1, os.SEEK_END)
+                if existing.read(1) != b"\n":
+                    output.write("\n")
+
+        futures = {
+            pool.submit(run_job, client, model_id, job, max_retries, backoff_base, max_tokens): job
+            for job in pending
+        }
+        for future in as_completed(futures):
+            job = futures[future]
+            outcome = future.result()
+            record = dict(job, **outcome)
+
+            if outcome["status"] == "ok":
+                latencies.append(outcome["latency_s"])
+                tokens_used += outcome["usage"].get("total_tokens", 0)
+                if cache is not None and not outcome["missing_fields"]:
+                    cache.set(job["id"], outcome["result"])
+
+            output.write(json.dumps(record) + "\n")
+            output.flush()
+            counts[outcome["status"]] += 1
+            done = counts["ok"] + counts["error"]
+            log(f"[{done}/{len(pending)}] {outcome['status']} {job['framework']} / {job['device']}: {job['prompt'][:50]}")
+
+    elapsed = time.perf_counter() - started
+    return {
+        "jobs": len(pending),
+        "ok": counts["ok"],
+        "errors": counts["error"],
+        "skipped": len(jobs) - len(pending),
+        "elapsed_s": elapsed,
+        "throughput_per_min": (len(pending) / elapsed * 60) if elapsed > 0 else 0.0,
+        "p50_latency_s": percentile(latencies, 50) if latencies else 0.0,
+        "p95_latency_s": percentile(latencies, 95) if latencies else 0.0,
+        "total_tokens": tokens_used
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate the PROMPT_LIBRARY matrix headlessly")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file to write (and resume from)")
+    parser.add_argument("--categories", nargs="*", choices=list(PROMPT_LIBRARY), help="Limit to these categories")
+    parser.add_argument("--frameworks", nargs="*", choices=FRAMEWORKS, help="Limit to these frameworks")
+    parser.add_argument("--devices", nargs="*", choices=list(DEVICES), help="Limit to these devices")
+    parser.add_argument("--concurrency", type=int, default=4, help="Parallel upstream calls")
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute limit (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="Tokens per minute limit (0 = unlimited)")
+    parser.add_argument("--retries", type=int, default=3, help="Job retries after a refused call or an unparseable response")
+    parser.add_argument("--backoff", type=float, default=2.0, help="Base backoff delay in seconds")
+    parser.add_argument("--max-tokens", type=int, default=None,
+                        help="Fixed completion token budget per call (default: routed per category)")
+    parser.add_argument("--warm-cache", action="store_true", help="Also store results in the app's response cache")
+    args = parser.parse_args()
+
+    client = get_client()
+
+    cache = None
+    if args.warm_cache:
+        cache_db_path = os.getenv("CACHE_DB_PATH", ".codepilot_cache.sqlite3")
+        if cache_db_path:
+            cache = ResponseCache(
+                db_path=cache_db_path,
+                stale_ttl_seconds=int(os.getenv("CACHE_STALE_SECONDS", str(7 * 24 * 3600)))
+            )
+        else:
+            print("CACHE_DB_PATH is empty; --warm-cache has nothing to write to")
+
+    jobs = build_jobs(args.categories, args.frameworks, args.devices)
+    summary = run_batch(
+        client, model_id, args.output, jobs,
+        concurrency=args.concurrency,
+        requests_per_minute=args.rpm,
+        tokens_per_minute=args.tpm,
+        max_retries=args.retries,
+        backoff_base=args.backoff,
+        max_tokens=args.max_tokens,
+        cache=cache
+    )
+
+    print("\nBatch summary:")
+    print(f"  Jobs run: {summary['jobs']} ({summary['ok']} ok, {summary['errors']} errors, {summary['skipped']} skipped)")
+    print(f"  Elapsed: {summary['elapsed_s']:.1f}s")
+    print(f"  Throughput: {summary['throughput_per_min']:.1f} jobs/min")
+    print(f"  Latency p50: {summary['p50_latency_s']:.2f}s  p95: {summary['p95_latency_s']:.2f}s")
+    print(f"  Tokens used: {summary['total_tokens']}")
+
+
+if __name__ == "__main__":
+    main()
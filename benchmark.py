@@ -0,0 +1,161 @@
+# benchmark.py - Offline load benchmark against the local mock LLM server
+import os
+import json
+import time
+import argparse
+import resource
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from metrics import percentile
+from mock_llm_server import add_config_arguments, config_from_args, start_mock_server
+
+TARGETS = ["generate", "generate-stream", "flask-generate", "flask-stream", "troubleshoot-api-test", "troubleshoot-simple-test"]
+
+BENCH_PROMPT = "Create a login form with email and password fields"
+
+
+def make_target(name, same_prompt):
+    """Return a callable(i) that performs one request and raises on failure"""
+    def prompt_for(i):
+        # Unique prompts by default so request coalescing does not hide upstream load
+        return BENCH_PROMPT if same_prompt else f"{BENCH_PROMPT} #{i}"
+
+    if name in ("generate", "generate-stream"):
+        from codegen import generate_result, stream_generation
+        from llm_client import get_client, model_id
+        client = get_client()
+
+        if name == "generate":
+            def run(i):
+                generate_result(client, model_id, prompt_for(i), "React", "Desktop")
+        else:
+            def run(i):
+                for event in stream_generation(client, model_id, prompt_for(i), "React", "Desktop"):
+                    pass
+        return run
+
+    if name in ("flask-generate", "flask-stream"):
+        import minimal_app
+        http = minimal_app.app.test_client()
+
+        if name == "flask-generate":
+            def run(i):
+                response = http.post("/api/generate", json={"prompt": prompt_for(i)})
+                if response.status_code != 202:
+                    raise RuntimeError(f"HTTP {response.status_code}")
+                job_url = response.get_json()["status_url"]
+                while True:
+                    job = http.get(job_url).get_json()
+                    if job["status"] == "done":
+                        return
+                    if job["status"] == "error":
+                        raise RuntimeError(job.get("error", "job failed"))
+                    time.sleep(0.02)
+        else:
+            def run(i):
+                response = http.post("/api/generate/stream", json={"prompt": prompt_for(i)})
+                if response.status_code != 200:
+                    raise RuntimeError(f"HTTP {response.status_code}")
+                body = response.get_data(as_text=True)
+                if "event: done" not in body:
+                    raise RuntimeError("stream ended without a result")
+        return run
+
+    if name in ("troubleshoot-api-test", "troubleshoot-simple-test"):
+        import troubleshoot_app
+        http = troubleshoot_app.app.test_client()
+        path = "/api-test" if name == "troubleshoot-api-test" else "/simple-test"
+
+        def run(i):
+            response = http.post(path, json={"prompt": prompt_for(i)})
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}")
+        return run
+
+    raise ValueError(f"Unknown target {name}")
+
+
+def run_level(run, requests, concurrency):
+    """Fire `requests` calls with `concurrency` workers and collect latency stats"""
+    latencies = []
+    errors = {}
+
+    def timed(i):
+        started = time.perf_counter()
+        try:
+            run(i)
+        except Exception as e:
+            return None, type(e).__name__
+        return time.perf_counter() - started, None
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for latency, error in pool.map(timed, range(requests)):
+            if error is None:
+                latencies.append(latency)
+            else:
+                errors[error] = errors.get(error, 0) + 1
+    elapsed = time.perf_counter() - started
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "concurrency": concurrency,
+        "requests": requests,
+        "ok": len(latencies),
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed > 0 else 0.0,
+        "p50_s": round(percentile(latencies, 50), 4) if latencies else 0.0,
+        "p95_s": round(percentile(latencies, 95), 4) if latencies else 0.0,
+        "p99_s": round(percentile(latencies, 99), 4) if latencies else 0.0,
+        "max_s": round(max(latencies), 4) if latencies else 0.0,
+        "peak_traced_mb": round(peak_bytes / 1024 / 1024, 2),
+        "max_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark generation paths against a local mock LLM server")
+    parser.add_argument("--targets", nargs="*", choices=TARGETS, default=["generate", "flask-generate", "troubleshoot-api-test"])
+    parser.add_argument("--concurrency", nargs="*", type=int, default=[1, 4, 16], help="Concurrency levels to run")
+    parser.add_argument("--requests", type=int, default=50, help="Requests per concurrency level")
+    parser.add_argument("--same-prompt", action="store_true", help="Send identical prompts (exercises coalescing)")
+    parser.add_argument("--base-url", help="Use an already running mock server instead of starting one")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server, base_url = start_mock_server(config_from_args(args))
+
+    # Must be set before the app modules create the shared client
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "mock-key")
+    os.environ.setdefault("MODEL_ID", "mock-model")
+    os.environ.setdefault("OPENAI_MAX_RETRIES", "0")
+
+    results = []
+    for target in args.targets:
+        run = make_target(target, args.same_prompt)
+        for concurrency in args.concurrency:
+            stats = run_level(run, args.requests, concurrency)
+            stats["target"] = target
+            results.append(stats)
+            print(f"{target:26} c={concurrency:<3} ok={stats['ok']:<4} err={sum(stats['errors'].values()):<3} "
+                  f"rps={stats['throughput_rps']:<8} p50={stats['p50_s']:<7} p95={stats['p95_s']:<7} "
+                  f"p99={stats['p99_s']:<7} peak={stats['peak_traced_mb']}MB")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"base_url": base_url, "results": results}, f, indent=2)
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+# codegen.py - Prompt construction, response validation and streaming parsing shared by the apps
+import os
+import json
+import time
+from datetime import datetime
+from llm_client import chat_completion, usage_to_dict
+from response_parser import StreamingFieldParser, parse_response
+from prompt_builder import build_generation_messages
+from generation_tracker import GenerationCancelled
+import metrics
+
+# Fields every generation response must contain
+REQUIRED_FIELDS = [
+    'interactive_code',
+    'separate_code',
+    'explanation',
+    'css_code',
+    'framework_specific_code',
+    'additional_files'
+]
+
+# Default fallback response (simplified for space)
+FALLBACK_RESPONSE = {
+    "interactive_code": "<html><body><p>Simple example</p><button>Click me</button></body></html>",
+    "separate_code": {"html": "<button>Click me</button>", "css": "button { padding: 10px; }", "js": "// JS code"},
+    "explanation": "This is a simple example.",
+    "css_code": "button { padding: 10px; background-color: blue; color: white; }",
+    "framework_specific_code": "// Framework code would go here",
+    "additional_files": {}
+}
+
+MAX_TOKENS = 4000
+
+# Ask for a final usage chunk on streamed responses; token metrics, cost and routing need it.
+# Set to false for OpenAI-compatible providers that reject stream_options.
+STREAM_INCLUDE_USAGE = os.getenv("STREAM_INCLUDE_USAGE", "true").lower() == "true"
+
+# Sampling temperature used for every generation (part of the response cache key)
+TEMPERATURE = 0.7
+
+
+def build_messages(prompt, framework, device):
+    """Build the chat messages for a UI generation request (static system prefix, variable user message)"""
+    return build_generation_messages(prompt, framework, device)[0]
+
+
+def fallback_response():
+    """Return a fresh copy of the fallback response"""
+    return json.loads(json.dumps(FALLBACK_RESPONSE))
+
+
+def finalize_result(json_result, prompt, framework, device):
+    """Fill missing fields from the fallback and attach generation metadata.
+
+    Returns the completed result and the list of fields that were missing.
+    """
+    missing_fields = [field for field in REQUIRED_FIELDS if field not in json_result]
+    if missing_fields:
+        defaults = fallback_response()
+        for field in missing_fields:
+            json_result[field] = defaults[field]
+
+    # Add generation metadata
+    json_result["metadata"] = {
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "prompt": prompt,
+        "framework": framework,
+        "device": device
+    }
+    return json_result, missing_fields
+
+
+def note_recovery(labels, result, recovery):
+    """Record that a result came from a repaired or partially salvaged response"""
+    metrics.JSON_REPAIRS.inc(dict(labels, method=recovery["method"]))
+    result["metadata"]["parse"] = recovery
+
+
+def generate_result(client, model_id, prompt, framework, device, temperature=TEMPERATURE, max_tokens=MAX_TOKENS,
+                    endpoint="generate"):
+    """Run a blocking generation and return (result, missing_fields).
+
+    Malformed or truncated JSON is repaired where possible, keeping every
+    complete field. API errors and json.JSONDecodeError (nothing recoverable)
+    are left to the caller, so this can run on worker threads that have no
+    UI to report to. `endpoint` labels the call in metrics.
+    """
+    labels = metrics.call_labels(endpoint, framework, device)
+    messages, prompt_tokens = build_generation_messages(prompt, framework, device)
+    response = chat_completion(
+        client,
+        metric_labels=labels,
+        model=model_id,
+        messages=messages,
+        response_format={"type": "json_object"},
+        max_tokens=max_tokens,
+        temperature=temperature
+    )
+    
+    parse_started = time.perf_counter()
+    try:
+        json_result, recovery = parse_response(response.choices[0].message.content)
+    except json.JSONDecodeError:
+        metrics.FALLBACKS.inc(dict(labels, reason="parse_error"))
+        raise
+    finally:
+        metrics.JSON_PARSE.observe(labels, time.perf_counter() - parse_started)
+    
+    json_result, missing_fields = finalize_result(json_result, prompt, framework, device)
+    if recovery:
+        note_recovery(labels, json_result, recovery)
+    if missing_fields:
+        metrics.FALLBACKS.inc(dict(labels, reason="missing_fields"))
+    json_result["metadata"]["usage"] = usage_to_dict(response.usage)
+    json_result["metadata"]["prompt_tokens"] = prompt_tokens
+    json_result["metadata"]["finish_reason"] = response.choices[0].finish_reason
+    return json_result, missing_fields
+
+
+def stream_generation(client, model_id, prompt, framework, device, temperature=TEMPERATURE, max_tokens=MAX_TOKENS,
+                      endpoint="generate_stream", cancel=None):
+    """Stream a generation, yielding events as the response arrives.
+
+    Yields ("field", name, value) for every top-level field as soon as it is
+    complete, then a single ("done", result, missing_fields) event with the
+    validated result. If the streamed text is not valid JSON, it is repaired
+    or its complete fields are salvaged and the rest is filled from the
+    fallback. When the `cancel` event is set, the upstream stream is closed
+    at the next chunk and GenerationCancelled is raised.
+    """
+    labels = metrics.call_labels(endpoint, framework, device)
+    extra_params = {"stream_options": {"include_usage": True}} if STREAM_INCLUDE_USAGE else {}
+    messages, prompt_tokens = build_generation_messages(prompt, framework, device)
+    stream = chat_completion(
+        client,
+        metric_labels=labels,
+        model=model_id,
+        messages=messages,
+        response_format={"type": "json_object"},
+        max_tokens=max_tokens,
+        temperature=temperature,
+        stream=True,
+        **extra_params
+    )
+
+    parser = StreamingFieldParser()
+    finish_reason = None
+    for chunk in stream:
+        if cancel is not None and cancel.is_set():
+            # Closing the response drops the connection, so the provider stops generating
+            stream.close()
+            raise GenerationCancelled("Generation cancelled while streaming")
+        if not chunk.choices:
+            continue
+        finish_reason = chunk.choices[0].finish_reason or finish_reason
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            continue
+        for field, value in parser.feed(delta):
+            yield ("field", field, value)
+
+    parse_started = time.perf_counter()
+    try:
+        json_result, recovery = parse_response(parser.buffer)
+    except json.JSONDecodeError:
+        metrics.FALLBACKS.inc(dict(labels, reason="parse_error"))
+        json_result, recovery = dict(parser.fields), None
+    metrics.JSON_PARSE.observe(labels, time.perf_counter() - parse_started)
+
+    result, missing_fields = finalize_result(json_result, prompt, framework, device)
+    if recovery:
+        note_recovery(labels, result, recovery)
+    if missing_fields:
+        metrics.FALLBACKS.inc(dict(labels, reason="missing_fields"))
+    result["metadata"]["usage"] = stream.usage
+    result["metadata"]["prompt_tokens"] = prompt_tokens
+    result["metadata"]["finish_reason"] = finish_reason
+    yield ("done", result, missing_fields)
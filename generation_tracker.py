@@ -0,0 +1,120 @@
+# generation_tracker.py - One in-flight generation per session: newer requests cancel older ones, repeats join them
+import time
+import threading
+import metrics
+
+
+class GenerationCancelled(Exception):
+    """A newer request from the same session replaced this generation"""
+
+
+class GenerationTicket:
+    """One tracked generation: its future, the fields streamed so far and its cancel flag"""
+
+    def __init__(self, session_id, key, labels, context):
+        self.session_id = session_id
+        self.key = key
+        self.labels = labels
+        # What the app does with the result; lets a later page run finish it
+        self.context = context
+        self.cancelled = threading.Event()
+        # Set whenever a field arrives, so waiters can redraw without polling the dict
+        self.changed = threading.Event()
+        self.fields = {}
+        self.future = None
+        self.joined = 0
+        self.started_at = time.time()
+        self.finished_at = None
+
+    def publish(self, field, value):
+        """Called by the worker for every field parsed from the stream"""
+        self.fields[field] = value
+        self.changed.set()
+
+    def check(self):
+        if self.cancelled.is_set():
+            raise GenerationCancelled(f"Generation {self.key[:12]} was superseded")
+
+    def running(self):
+        return self.future is not None and not self.future.done()
+
+
+class GenerationTracker:
+    """Tracks the generation each session is waiting for.
+
+    `submit` with the key of the session's in-flight generation returns
+    that ticket (a double click makes one call). Any other key cancels the
+    in-flight generation first: the worker sees `ticket.cancelled`, closes
+    the upstream stream at the next chunk and raises GenerationCancelled.
+    Work runs on `executor` so the page run can be interrupted without
+    losing the call; `pending` hands an unfinished ticket to the next run.
+    A finished ticket that no run collects within `result_ttl` seconds
+    (its session was closed) is dropped.
+    """
+
+    def __init__(self, executor, result_ttl=600.0):
+        self.executor = executor
+        self.result_ttl = result_ttl
+        self._tickets = {}
+        self._lock = threading.Lock()
+
+    def submit(self, session_id, key, work, labels, context=None):
+        """Start `work(ticket)` for the session, or join its identical generation"""
+        with self._lock:
+            self._prune()
+            current = self._tickets.get(session_id)
+            # Also join a finished generation nobody has collected: its page run was interrupted by this click
+            if current is not None and current.key == key and not current.cancelled.is_set():
+                current.joined += 1
+                metrics.GENERATIONS_DEDUPED.inc(labels)
+                return current
+            if current is not None and current.running():
+                self._cancel(current, "superseded")
+
+            ticket = GenerationTicket(session_id, key, labels, context or {})
+            ticket.future = self.executor.submit(self._run, work, ticket)
+            ticket.future.add_done_callback(lambda _: setattr(ticket, "finished_at", time.time()))
+            self._tickets[session_id] = ticket
+            return ticket
+
+    def pending(self, session_id):
+        """The session's generation that no page run has collected yet, or None"""
+        with self._lock:
+            return self._tickets.get(session_id)
+
+    def release(self, session_id, ticket):
+        """Forget `ticket` once its result has been collected"""
+        with self._lock:
+            if self._tickets.get(session_id) is ticket:
+                del self._tickets[session_id]
+
+    def cancel(self, session_id, reason="superseded"):
+        """Cancel the session's in-flight generation, if any; returns True when one was cancelled"""
+        with self._lock:
+            ticket = self._tickets.pop(session_id, None)
+            if ticket is None or not ticket.running():
+                return False
+            self._cancel(ticket, reason)
+            return True
+
+    def stats(self):
+        with self._lock:
+            self._prune()
+            return {"sessions": len(self._tickets), "running": sum(ticket.running() for ticket in self._tickets.values())}
+
+    def _prune(self):
+        # Called with the lock held, on every submit, so abandoned sessions cannot pile up
+        cutoff = time.time() - self.result_ttl
+        for session_id in [session_id for session_id, ticket in self._tickets.items()
+                           if ticket.finished_at is not None and ticket.finished_at < cutoff]:
+            del self._tickets[session_id]
+
+    def _cancel(self, ticket, reason):
+        ticket.cancelled.set()
+        metrics.GENERATIONS_CANCELLED.inc(dict(ticket.labels, reason=reason))
+
+    @staticmethod
+    def _run(work, ticket):
+        # Cancelled while still queued: never call upstream
+        ticket.check()
+        return work(ticket)
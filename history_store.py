@@ -0,0 +1,298 @@
+# history_store.py - Generation history backends with compressed, deduplicated payloads
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from abc import ABC, abstractmethod
+
+
+def split_result(result):
+    """Split a result into (payload, metadata) so identical code dedupes across requests"""
+    payload = {key: value for key, value in result.items() if key != "metadata"}
+    return payload, result.get("metadata")
+
+
+def payload_hash(payload):
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest(), encoded
+
+
+def prompt_preview(prompt, length=30):
+    return prompt if len(prompt) <= length else f"{prompt[:length]}..."
+
+
+class HistoryStore(ABC):
+    """Interface for history backends.
+
+    An entry is one generation request in a session; it holds one result per
+    device variant and remembers which device is current. Listing returns
+    lightweight summaries only, full results are loaded on demand.
+    """
+
+    @abstractmethod
+    def add_entry(self, session_id, prompt, framework, device, result):
+        """Create an entry with its first result and return the entry id"""
+
+    @abstractmethod
+    def add_variant(self, entry_id, device, result):
+        """Store (or replace) the result for one device of an entry"""
+
+    @abstractmethod
+    def set_device(self, entry_id, device):
+        """Make `device` the current variant of an entry"""
+
+    @abstractmethod
+    def get_entry(self, entry_id):
+        """Return the entry summary (with its stored `devices`), or None"""
+
+    @abstractmethod
+    def load(self, entry_id, device=None):
+        """Return the full result for `device` (default: the current device), or None"""
+
+    @abstractmethod
+    def list_entries(self, session_id, query=None, offset=0, limit=10):
+        """Return (summaries, total) for a session, newest first, optionally filtered by prompt text"""
+
+    @abstractmethod
+    def prune(self, older_than_seconds):
+        """Drop entries older than the given age and payloads nothing refers to"""
+
+
+class MemoryHistoryStore(HistoryStore):
+    """Process-local backend, mainly for tests and single-user runs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._payloads = {}
+        self._next_id = 1
+
+    def add_entry(self, session_id, prompt, framework, device, result):
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = {
+                "id": entry_id,
+                "session_id": session_id,
+                "prompt": prompt,
+                "framework": framework,
+                "device": device,
+                "created_at": time.time(),
+                "variants": {}
+            }
+        self.add_variant(entry_id, device, result)
+        return entry_id
+
+    def add_variant(self, entry_id, device, result):
+        payload, metadata = split_result(result)
+        digest, encoded = payload_hash(payload)
+        with self._lock:
+            self._payloads.setdefault(digest, zlib.compress(encoded))
+            self._entries[entry_id]["variants"][device] = (digest, metadata)
+
+    def set_device(self, entry_id, device):
+        with self._lock:
+            self._entries[entry_id]["device"] = device
+
+    def get_entry(self, entry_id):
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            return None if entry is None else self._summary(entry)
+
+    def load(self, entry_id, device=None):
+        with self._lock:
+            entry = self._entries.get(entry_id)
+            if entry is None:
+                return None
+            variant = entry["variants"].get(device or entry["device"])
+            if variant is None:
+                return None
+            digest, metadata = variant
+            result = json.loads(zlib.decompress(self._payloads[digest]))
+        if metadata is not None:
+            result["metadata"] = metadata
+        return result
+
+    def list_entries(self, session_id, query=None, offset=0, limit=10):
+        with self._lock:
+            matches = [
+                entry for entry in self._entries.values()
+                if entry["session_id"] == session_id
+                and (not query or query.lower() in entry["prompt"].lower())
+            ]
+            matches.sort(key=lambda entry: entry["id"], reverse=True)
+            return [self._summary(entry) for entry in matches[offset:offset + limit]], len(matches)
+
+    def prune(self, older_than_seconds):
+        cutoff = time.time() - older_than_seconds
+        with self._lock:
+            for entry_id in [key for key, entry in self._entries.items() if entry["created_at"] < cutoff]:
+                del self._entries[entry_id]
+            used = {digest for entry in self._entries.values() for digest, _ in entry["variants"].values()}
+            for digest in [key for key in self._payloads if key not in used]:
+                del self._payloads[digest]
+
+    @staticmethod
+    def _summary(entry):
+        return {
+            "id": entry["id"],
+            "prompt": entry["prompt"],
+            "preview": prompt_preview(entry["prompt"]),
+            "framework": entry["framework"],
+            "device": entry["device"],
+            "created_at": entry["created_at"],
+            "devices": sorted(entry["variants"])
+        }
+
+
+class SQLiteHistoryStore(HistoryStore):
+    """SQLite backend shared by every session of the server.
+
+    Payloads are zlib-compressed JSON stored once per content hash, so the
+    same generated code (e.g. a cached result shown in many sessions) takes
+    space only once.
+    """
+
+    def __init__(self, db_path):
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        # WAL lets the workers of a multi-process server read while one of them writes
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS payloads (
+                hash TEXT PRIMARY KEY,
+                data BLOB NOT NULL,
+                raw_size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                prompt TEXT NOT NULL,
+                framework TEXT NOT NULL,
+                device TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS entries_session ON entries (session_id, id);
+            CREATE TABLE IF NOT EXISTS variants (
+                entry_id INTEGER NOT NULL,
+                device TEXT NOT NULL,
+                payload_hash TEXT NOT NULL,
+                metadata TEXT,
+                PRIMARY KEY (entry_id, device)
+            );
+        """)
+        self._db.commit()
+
+    def add_entry(self, session_id, prompt, framework, device, result):
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO entries (session_id, prompt, framework, device, created_at) VALUES (?, ?, ?, ?, ?)",
+                (session_id, prompt, framework, device, time.time())
+            )
+            entry_id = cursor.lastrowid
+            self._store_variant(entry_id, device, result)
+            self._db.commit()
+        return entry_id
+
+    def add_variant(self, entry_id, device, result):
+        with self._lock:
+            self._store_variant(entry_id, device, result)
+            self._db.commit()
+
+    def set_device(self, entry_id, device):
+        with self._lock:
+            self._db.execute("UPDATE entries SET device = ? WHERE id = ?", (device, entry_id))
+            self._db.commit()
+
+    def get_entry(self, entry_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT id, prompt, framework, device, created_at FROM entries WHERE id = ?", (entry_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            return self._summary(row)
+
+    def load(self, entry_id, device=None):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT p.data, v.metadata FROM entries e "
+                "JOIN variants v ON v.entry_id = e.id AND v.device = COALESCE(?, e.device) "
+                "JOIN payloads p ON p.hash = v.payload_hash WHERE e.id = ?",
+                (device, entry_id)
+            ).fetchone()
+        if row is None:
+            return None
+        data, metadata = row
+        result = json.loads(zlib.decompress(data))
+        if metadata is not None:
+            result["metadata"] = json.loads(metadata)
+        return result
+
+    def list_entries(self, session_id, query=None, offset=0, limit=10):
+        where = "session_id = ?"
+        params = [session_id]
+        if query:
+            where += " AND prompt LIKE ? ESCAPE '\\'"
+            escaped = query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            params.append(f"%{escaped}%")
+        with self._lock:
+            total = self._db.execute(f"SELECT COUNT(*) FROM entries WHERE {where}", params).fetchone()[0]
+            rows = self._db.execute(
+                f"SELECT id, prompt, framework, device, created_at FROM entries WHERE {where} "
+                "ORDER BY id DESC LIMIT ? OFFSET ?",
+                params + [limit, offset]
+            ).fetchall()
+            return [self._summary(row) for row in rows], total
+
+    def prune(self, older_than_seconds):
+        cutoff = time.time() - older_than_seconds
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM variants WHERE entry_id IN (SELECT id FROM entries WHERE created_at < ?)", (cutoff,)
+            )
+            self._db.execute("DELETE FROM entries WHERE created_at < ?", (cutoff,))
+            self._db.execute("DELETE FROM payloads WHERE hash NOT IN (SELECT payload_hash FROM variants)")
+            self._db.commit()
+
+    # Internal helpers (caller holds the lock)
+    def _store_variant(self, entry_id, device, result):
+        payload, metadata = split_result(result)
+        digest, encoded = payload_hash(payload)
+        self._db.execute(
+            "INSERT OR IGNORE INTO payloads (hash, data, raw_size) VALUES (?, ?, ?)",
+            (digest, zlib.compress(encoded), len(encoded))
+        )
+        self._db.execute(
+            "INSERT OR REPLACE INTO variants (entry_id, device, payload_hash, metadata) VALUES (?, ?, ?, ?)",
+            (entry_id, device, digest, None if metadata is None else json.dumps(metadata))
+        )
+
+    def _summary(self, row):
+        entry_id, prompt, framework, device, created_at = row
+        devices = [device_row[0] for device_row in self._db.execute(
+            "SELECT device FROM variants WHERE entry_id = ? ORDER BY device", (entry_id,)
+        )]
+        return {
+            "id": entry_id,
+            "prompt": prompt,
+            "preview": prompt_preview(prompt),
+            "framework": framework,
+            "device": device,
+            "created_at": created_at,
+            "devices": devices
+        }
+
+
+def create_history_store(backend="sqlite", db_path=".codepilot_history.sqlite3"):
+    """Build the configured history backend ("sqlite" or "memory")"""
+    if backend == "memory":
+        return MemoryHistoryStore()
+    if backend == "sqlite":
+        return SQLiteHistoryStore(db_path)
+    raise ValueError(f"Unknown history backend: {backend}")
@@ -0,0 +1,285 @@
+# job_queue.py - Bounded generation job queue served by a worker thread pool
+import math
+import time
+import uuid
+import queue
+import threading
+
+
+class QueueFull(Exception):
+    """Raised by JobQueue.submit when no queue slot is free"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Generation queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class QueueClosed(QueueFull):
+    """Raised by JobQueue.submit while the queue drains for shutdown"""
+
+    def __init__(self, retry_after=5):
+        Exception.__init__(self, "Server is shutting down, retry on another worker")
+        self.retry_after = retry_after
+
+
+class Job:
+    """A queued generation with its status, result and the events published while it ran"""
+
+    def __init__(self, payload, store=None):
+        self.store = store
+        self.id = uuid.uuid4().hex
+        self.payload = payload
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.revised = False
+        self.events = []
+        self._cond = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in ("done", "error")
+
+    def publish(self, event, data):
+        """Record an event for streaming clients"""
+        with self._cond:
+            self.events.append((event, data))
+            seq = len(self.events)
+            self._cond.notify_all()
+        if self.store is not None:
+            self.store.add_event(self.id, seq, event, data)
+
+    def revise(self, result):
+        """Replace the job's result, e.g. with a version checked in the background; kept even if the job is still finishing"""
+        with self._cond:
+            self.result = result
+            self.revised = True
+            finished = self.finished
+        if finished and self.store is not None:
+            self.store.save(self)
+
+    def iter_events(self, timeout=None):
+        """Yield every event published so far, then new ones until the job finishes.
+
+        With a `timeout`, gives up after that many seconds without progress.
+        """
+        index = 0
+        while True:
+            with self._cond:
+                while index >= len(self.events) and not self.finished:
+                    if not self._cond.wait(timeout):
+                        return
+                pending = self.events[index:]
+                index = len(self.events)
+                finished = self.finished
+            for event in pending:
+                yield event
+            if finished and index >= len(self.events):
+                return
+
+    def to_dict(self, include_result=True):
+        data = {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if self.error is not None:
+            data["error"] = self.error
+        if include_result and self.result is not None:
+            data["result"] = self.result
+        return data
+
+    def _start(self):
+        with self._cond:
+            self.status = "running"
+            self.started_at = time.time()
+            self._cond.notify_all()
+        if self.store is not None:
+            self.store.save(self)
+
+    def _finish(self, result=None, error=None):
+        with self._cond:
+            if not self.revised:
+                self.result = result
+            self.error = error
+            self.status = "error" if error is not None else "done"
+            self.finished_at = time.time()
+            if error is not None:
+                self.events.append(("error", {"message": error}))
+            seq = len(self.events)
+            self._cond.notify_all()
+        if self.store is not None:
+            if error is not None:
+                self.store.add_event(self.id, seq, "error", {"message": error})
+            self.store.save(self)
+
+
+class StoredJob:
+    """Read-only view of a job run by another worker process, loaded from the shared job store"""
+
+    def __init__(self, store, record, poll_interval=0.2):
+        self.store = store
+        self.poll_interval = poll_interval
+        self.id = record["id"]
+        self.payload = record["payload"]
+        self._apply(record)
+
+    @property
+    def finished(self):
+        return self.status in ("done", "error")
+
+    def iter_events(self, timeout=None):
+        """Yield the job's events from the store, polling until it finishes (same contract as Job.iter_events)"""
+        seq = 0
+        last_progress = time.time()
+        while True:
+            events = self.store.events_after(self.id, seq)
+            for seq, event, data in events:
+                yield event, data
+            if events:
+                last_progress = time.time()
+            elif self.finished:
+                return
+            elif timeout is not None and time.time() - last_progress > timeout:
+                return
+            else:
+                time.sleep(self.poll_interval)
+                record = self.store.load(self.id)
+                if record is None:
+                    return
+                self._apply(record)
+
+    def to_dict(self, include_result=True):
+        return Job.to_dict(self, include_result)
+
+    def _apply(self, record):
+        self.status = record["status"]
+        self.created_at = record["created_at"]
+        self.started_at = record["started_at"]
+        self.finished_at = record["finished_at"]
+        self.result = record["result"]
+        self.error = record["error"]
+
+
+class JobQueue:
+    """Run `handler(job)` for submitted jobs on a fixed pool of worker threads.
+
+    The queue is bounded: when it is full, `submit` raises QueueFull with a
+    Retry-After estimate based on recent job durations. Finished jobs are kept
+    for `job_ttl` seconds so clients can poll for the result. With a shared
+    `store` (see shared_state), jobs are also visible to the other worker
+    processes of the server.
+    """
+
+    def __init__(self, handler, workers=4, max_queue=32, job_ttl=600, store=None):
+        self.handler = handler
+        self.workers = workers
+        self.max_queue = max_queue
+        self.job_ttl = job_ttl
+        self.store = store
+        self.draining = False
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._avg_duration = None
+        self._threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f"generate-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, payload):
+        """Queue a job for `payload` and return it, or raise QueueFull"""
+        if self.draining:
+            raise QueueClosed()
+        job = Job(payload, self.store)
+        self._prune()
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._lock:
+                del self._jobs[job.id]
+            raise QueueFull(self.retry_after())
+        if self.store is not None:
+            self.store.save(job)
+        return job
+
+    def get(self, job_id):
+        """Return the job, from this process or, with a shared store, from another worker"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.store is not None:
+            record = self.store.load(job_id)
+            if record is not None:
+                job = StoredJob(self.store, record)
+        return job
+
+    def drain(self, timeout):
+        """Refuse new jobs and wait up to `timeout` seconds for queued and running ones; returns True if idle"""
+        self.draining = True
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            # Counts jobs from submit until their handler returned
+            if not self._queue.unfinished_tasks:
+                return True
+            time.sleep(0.1)
+        return False
+
+    def retry_after(self):
+        """Seconds until a queue slot is likely to free up"""
+        average = self._avg_duration or 10.0
+        waves = self._queue.qsize() / max(1, self.workers)
+        return max(1, math.ceil(average * max(1.0, waves)))
+
+    def stats(self):
+        with self._lock:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "queued": self._queue.qsize(),
+            "running": statuses.count("running"),
+            "tracked_jobs": len(statuses),
+            "avg_duration_s": self._avg_duration
+        }
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            job._start()
+            try:
+                result = self.handler(job)
+            except Exception as e:
+                print(f"Job {job.id} failed: {str(e)}")
+                job._finish(error=str(e))
+            else:
+                job._finish(result=result)
+            finally:
+                self._record_duration(time.time() - job.started_at)
+                self._queue.task_done()
+
+    def _record_duration(self, duration):
+        with self._lock:
+            if self._avg_duration is None:
+                self._avg_duration = duration
+            else:
+                # Exponential moving average so the estimate follows recent load
+                self._avg_duration = 0.8 * self._avg_duration + 0.2 * duration
+
+    def _prune(self):
+        cutoff = time.time() - self.job_ttl
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished and job.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+        if self.store is not None:
+            self.store.prune(cutoff)
@@ -0,0 +1,391 @@
+# llm_client.py - Shared, pooled OpenAI clients with request coalescing
+import os
+import json
+import time
+import hashlib
+import threading
+from concurrent.futures import Future
+from dotenv import load_dotenv
+import metrics
+import admission
+import replay_log
+from upstream_guard import (UpstreamUnavailable, async_guarded_call, estimate_prompt_tokens, estimate_tokens,
+                            guarded_call, settle_tokens)
+
+# Load environment variables
+load_dotenv()
+api_key = os.getenv("OPENAI_API_KEY")
+base_url = os.getenv("OPENAI_BASE_URL")
+model_id = os.getenv("MODEL_ID")
+
+# HTTP connection pool settings
+max_connections = int(os.getenv("OPENAI_MAX_CONNECTIONS", "50"))
+max_keepalive_connections = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "20"))
+keepalive_expiry = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "120"))
+connect_timeout = float(os.getenv("OPENAI_CONNECT_TIMEOUT", "10"))
+request_timeout = float(os.getenv("OPENAI_REQUEST_TIMEOUT", "180"))
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+# In-flight request coalescing: request key -> Future (sync) or Task (async)
+_inflight = {}
+_inflight_lock = threading.Lock()
+_async_inflight = {}
+
+
+# openai and httpx take a few hundred milliseconds to import, so they are loaded with the first client
+def _http_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry
+    )
+
+
+def _http_timeout():
+    import httpx
+    return httpx.Timeout(request_timeout, connect=connect_timeout)
+
+
+def get_client():
+    """Return the process-wide OpenAI client backed by a keep-alive connection pool"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                import httpx
+                from openai import OpenAI
+                http_client = httpx.Client(limits=_http_limits(), timeout=_http_timeout())
+                _client = OpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    http_client=http_client,
+                    # Retries are done by upstream_guard, which shares one backoff and breaker per process
+                    max_retries=0
+                )
+    return _client
+
+
+def get_async_client():
+    """Return the process-wide AsyncOpenAI client.
+
+    The underlying httpx pool belongs to the event loop it is first used on,
+    so use it from one long-lived loop.
+    """
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                import httpx
+                from openai import AsyncOpenAI
+                http_client = httpx.AsyncClient(limits=_http_limits(), timeout=_http_timeout())
+                _async_client = AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    http_client=http_client,
+                    # Retries are done by upstream_guard, which shares one backoff and breaker per process
+                    max_retries=0
+                )
+    return _async_client
+
+
+def preload_client():
+    """Create the shared client on a background thread so importing openai does not delay startup"""
+    if _client is None:
+        threading.Thread(target=get_client, name="client-preload", daemon=True).start()
+
+
+def request_key(params):
+    """Hash the parameters of a completion request"""
+    payload = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def usage_to_dict(usage):
+    """Convert an API usage object into a plain dict (empty when the API sent none)"""
+    if usage is None:
+        return {}
+    # Prompt tokens the provider served from its prefix cache (0 when it does not report them)
+    details = getattr(usage, "prompt_tokens_details", None)
+    return {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+        "total_tokens": getattr(usage, "total_tokens", 0) or 0,
+        "cached_prompt_tokens": getattr(details, "cached_tokens", 0) or 0
+    }
+
+
+class InstrumentedStream:
+    """Wrap a streaming response to record time to first token, wall time and usage.
+
+    `release` gives the admission slot back when the stream ends or is closed,
+    and the unused part of the `estimated_tokens` reservation goes back to
+    the rate limiter. With `record_params`, the exchange is written to the
+    replay log (see replay_log) once the stream ends.
+    """
+
+    def __init__(self, stream, labels, started, release=None, record_params=None, estimated_tokens=0, prompt_tokens=0):
+        self.stream = stream
+        self.labels = labels
+        self.started = started
+        self.release = release
+        self.record_params = record_params
+        self.estimated_tokens = estimated_tokens
+        self.prompt_tokens = prompt_tokens
+        self.usage = {}
+        self._reading = False
+        self._settled = False
+        self._ttft = None
+        self._parts = []
+        self._completion_chars = 0
+        self._finish_reason = None
+
+    def __iter__(self):
+        self._reading = True
+        status = "ok"
+        try:
+            for chunk in self.stream:
+                self._observe(chunk)
+                yield chunk
+        except GeneratorExit:
+            # The consumer stopped reading before the stream ended
+            status = "cancelled"
+            raise
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self._finish(status)
+
+    def close(self):
+        self.stream.close()
+        self._closed()
+
+    def settle(self):
+        """Settle the token reservation once: with the reported usage, else an estimate of the streamed text"""
+        if self._settled:
+            return
+        self._settled = True
+        usage = self.usage if self.usage.get("total_tokens") else \
+            {"total_tokens": self.prompt_tokens + (self._completion_chars + 3) // 4}
+        settle_tokens(self.estimated_tokens, usage)
+
+    def _observe(self, chunk):
+        if getattr(chunk, "usage", None) is not None:
+            self.usage = usage_to_dict(chunk.usage)
+        if not chunk.choices:
+            return
+        self._finish_reason = chunk.choices[0].finish_reason or self._finish_reason
+        content = chunk.choices[0].delta.content
+        if content:
+            if self._ttft is None:
+                self._ttft = time.perf_counter() - self.started
+            self._completion_chars += len(content)
+            if self.record_params is not None:
+                self._parts.append(content)
+
+    def _finish(self, status):
+        elapsed = time.perf_counter() - self.started
+        metrics.record_call(self.labels, elapsed, status=status, ttft=self._ttft, usage=self.usage)
+        self.settle()
+        if self.release is not None:
+            # Time to first token is what tells admission control the provider is slow
+            self.release(self._ttft if self._ttft is not None else elapsed)
+        if self.record_params is not None:
+            replay_log.record_exchange(self.labels, self.record_params, status, time.time() - elapsed, elapsed,
+                                       content="".join(self._parts), usage=self.usage, ttft=self._ttft,
+                                       finish_reason=self._finish_reason, chunks=len(self._parts))
+
+    def _closed(self):
+        if not self._reading:
+            # Closed before it was read: nothing was generated. Otherwise the reader settles what it saw.
+            self.settle()
+        if self.release is not None:
+            self.release()
+
+
+class AsyncInstrumentedStream(InstrumentedStream):
+    """Async counterpart of InstrumentedStream for AsyncOpenAI streams"""
+
+    def __iter__(self):
+        raise TypeError("Use `async for` with an async stream")
+
+    async def __aiter__(self):
+        self._reading = True
+        status = "ok"
+        try:
+            async for chunk in self.stream:
+                self._observe(chunk)
+                yield chunk
+        except GeneratorExit:
+            status = "cancelled"
+            raise
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self._finish(status)
+
+    async def close(self):
+        await self.stream.close()
+        self._closed()
+
+
+def chat_completion(client=None, metric_labels=None, **params):
+    """Create a chat completion, sharing one upstream call between identical in-flight requests.
+
+    Streaming requests are passed straight through, since a stream can only be
+    consumed once. Every upstream call first takes a slot from the admission
+    controller for its endpoint's priority class (see admission), then goes
+    through the process-wide rate limiter, retry policy and circuit breaker
+    (see upstream_guard); both raise UpstreamUnavailable instead of calling a
+    provider that is down, over quota or overloaded. Calls are recorded in
+    `metrics` under `metric_labels` (see metrics.call_labels), and in the
+    replay log when REPLAY_RECORD_DIR is set.
+    """
+    client = client or get_client()
+    labels = metric_labels or metrics.call_labels("unknown")
+    estimated_tokens = estimate_tokens(params)
+    if params.get("stream"):
+        started = time.perf_counter()
+        release = None
+        try:
+            release = admission.acquire(labels["endpoint"])
+            started = time.perf_counter()
+            stream = guarded_call(lambda: client.chat.completions.create(**params), labels, estimated_tokens)
+        except Exception as e:
+            if release is not None:
+                release()
+            metrics.record_call(labels, time.perf_counter() - started, status=_error_status(e))
+            record_failure(labels, params, e, started)
+            raise
+        recording = replay_log.get_recorder() is not None
+        return InstrumentedStream(stream, labels, started, release, record_params=params if recording else None,
+                                  estimated_tokens=estimated_tokens, prompt_tokens=estimate_prompt_tokens(params))
+
+    key = request_key(params)
+    with _inflight_lock:
+        future = _inflight.get(key)
+        leader = future is None
+        if leader:
+            future = Future()
+            _inflight[key] = future
+
+    if not leader:
+        metrics.LLM_COALESCED.inc(labels)
+        return future.result()
+
+    started = time.perf_counter()
+    release = None
+    try:
+        # Followers above share this slot; the wait for it is not part of the call latency
+        release = admission.acquire(labels["endpoint"])
+        started = time.perf_counter()
+        response = guarded_call(lambda: client.chat.completions.create(**params), labels, estimated_tokens)
+    except BaseException as e:
+        metrics.record_call(labels, time.perf_counter() - started, status=_error_status(e))
+        record_failure(labels, params, e, started)
+        future.set_exception(e)
+        raise
+    else:
+        usage = usage_to_dict(response.usage)
+        settle_tokens(estimated_tokens, usage)
+        metrics.record_call(labels, time.perf_counter() - started, usage=usage)
+        record_response(labels, params, response, usage, started)
+        future.set_result(response)
+        return response
+    finally:
+        if release is not None:
+            release(time.perf_counter() - started)
+        with _inflight_lock:
+            _inflight.pop(key, None)
+
+
+async def async_chat_completion(client=None, metric_labels=None, **params):
+    """Async counterpart of `chat_completion` for the shared AsyncOpenAI client"""
+    # Only async callers need asyncio, and they have already imported it
+    import asyncio
+    client = client or get_async_client()
+    labels = metric_labels or metrics.call_labels("unknown")
+    if params.get("stream"):
+        # The slot is held until the stream ends or is closed, as for sync streams
+        estimated_tokens = estimate_tokens(params)
+        started = time.perf_counter()
+        release = None
+        try:
+            release = await asyncio.to_thread(admission.acquire, labels["endpoint"])
+            started = time.perf_counter()
+            stream = await async_guarded_call(lambda: client.chat.completions.create(**params), labels, estimated_tokens)
+        except BaseException as e:
+            if release is not None:
+                release()
+            metrics.record_call(labels, time.perf_counter() - started, status=_error_status(e))
+            record_failure(labels, params, e, started)
+            raise
+        recording = replay_log.get_recorder() is not None
+        return AsyncInstrumentedStream(stream, labels, started, release, record_params=params if recording else None,
+                                       estimated_tokens=estimated_tokens, prompt_tokens=estimate_prompt_tokens(params))
+
+    loop = asyncio.get_running_loop()
+    key = (id(loop), request_key(params))
+    task = _async_inflight.get(key)
+    if task is None:
+        task = loop.create_task(_timed_async_create(client, labels, params))
+        _async_inflight[key] = task
+        task.add_done_callback(lambda _: _async_inflight.pop(key, None))
+    else:
+        metrics.LLM_COALESCED.inc(labels)
+    # Shield so one cancelled waiter does not cancel the call for the others
+    return await asyncio.shield(task)
+
+
+async def _timed_async_create(client, labels, params):
+    import asyncio
+    estimated_tokens = estimate_tokens(params)
+    started = time.perf_counter()
+    release = None
+    try:
+        # Waiting for a slot blocks, so it happens off the event loop
+        release = await asyncio.to_thread(admission.acquire, labels["endpoint"])
+        started = time.perf_counter()
+        response = await async_guarded_call(lambda: client.chat.completions.create(**params), labels, estimated_tokens)
+    except BaseException as e:
+        metrics.record_call(labels, time.perf_counter() - started, status=_error_status(e))
+        record_failure(labels, params, e, started)
+        raise
+    finally:
+        if release is not None:
+            release(time.perf_counter() - started)
+    usage = usage_to_dict(response.usage)
+    settle_tokens(estimated_tokens, usage)
+    metrics.record_call(labels, time.perf_counter() - started, usage=usage)
+    record_response(labels, params, response, usage, started)
+    return response
+
+
+def record_response(labels, params, response, usage, started):
+    """Write a completed blocking call to the replay log (no-op unless recording)"""
+    if replay_log.get_recorder() is None:
+        return
+    latency = time.perf_counter() - started
+    choice = response.choices[0] if response.choices else None
+    replay_log.record_exchange(labels, params, "ok", time.time() - latency, latency,
+                               content=choice.message.content if choice else None, usage=usage,
+                               finish_reason=choice.finish_reason if choice else None)
+
+
+def record_failure(labels, params, error, started):
+    """Write a failed call to the replay log; calls refused before reaching the provider are skipped"""
+    if replay_log.get_recorder() is None or isinstance(error, UpstreamUnavailable):
+        return
+    latency = time.perf_counter() - started
+    replay_log.record_exchange(labels, params, "error", time.time() - latency, latency,
+                               error=f"{type(error).__name__}: {str(error)}")
+
+
+def _error_status(error):
+    # Calls refused before reaching the provider are reported apart from upstream errors
+    return "rejected" if isinstance(error, UpstreamUnavailable) else "error"
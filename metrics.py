@@ -0,0 +1,227 @@
+# metrics.py - In-process metrics for upstream LLM calls with Prometheus text export
+import math
+import bisect
+import threading
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+PARSE_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5)
+
+# Label set shared by the per-call metrics
+CALL_LABELS = ("endpoint", "framework", "device")
+
+
+class Counter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, value=1):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def samples(self):
+        with self._lock:
+            return dict(self._values)
+
+    def export(self):
+        return [[list(key), value] for key, value in self.samples().items()]
+
+    @staticmethod
+    def merge(exports):
+        """Sum exported values from several processes into one samples dict"""
+        values = {}
+        for exported in exports:
+            for key, value in exported:
+                values[tuple(key)] = values.get(tuple(key), 0) + value
+        return values
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        values = self.samples() if values is None else values
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{format_labels(self.label_names, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._values = {}  # key -> [bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+
+    def samples(self):
+        """Return {label key: (count, sum, per-bucket counts)}"""
+        with self._lock:
+            return {
+                key: (sum(series[:-1]), series[-1], list(series[:-1]))
+                for key, series in self._values.items()
+            }
+
+    def export(self):
+        with self._lock:
+            return [[list(key), list(series)] for key, series in self._values.items()]
+
+    @staticmethod
+    def merge(exports):
+        """Add up exported series from several processes into one samples dict"""
+        merged = {}
+        for exported in exports:
+            for key, series in exported:
+                current = merged.get(tuple(key))
+                merged[tuple(key)] = series if current is None else [a + b for a, b in zip(current, series)]
+        return {key: (sum(series[:-1]), series[-1], series[:-1]) for key, series in merged.items()}
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        values = self.samples() if values is None else values
+        for key, (count, total, counts) in sorted(values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                labels = format_labels(self.label_names + ("le",), key + (str(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+# Upstream call metrics
+LLM_REQUESTS = Counter("codepilot_llm_requests_total", "Upstream LLM calls by outcome", CALL_LABELS + ("status",))
+LLM_LATENCY = Histogram("codepilot_llm_latency_seconds", "Wall time of upstream LLM calls", CALL_LABELS)
+LLM_TTFT = Histogram("codepilot_llm_time_to_first_token_seconds", "Time to first streamed token", CALL_LABELS)
+LLM_TOKENS = Counter("codepilot_llm_tokens_total", "Tokens reported by the upstream API", CALL_LABELS + ("kind",))
+LLM_COALESCED = Counter("codepilot_llm_coalesced_total", "Requests served by an identical in-flight call", CALL_LABELS)
+LLM_RETRIES = Counter("codepilot_llm_retries_total", "Upstream calls retried after a retryable error", CALL_LABELS + ("reason",))
+UPSTREAM_REJECTIONS = Counter("codepilot_upstream_rejections_total", "Calls refused by the rate limiter or circuit breaker", CALL_LABELS + ("reason",))
+BREAKER_TRANSITIONS = Counter("codepilot_breaker_transitions_total", "Circuit breaker state changes", ("state",))
+
+# Response handling metrics
+JSON_PARSE = Histogram("codepilot_json_parse_seconds", "Time spent parsing generation responses", CALL_LABELS, PARSE_BUCKETS)
+FALLBACKS = Counter("codepilot_fallback_total", "Generations that used fallback values", CALL_LABELS + ("reason",))
+JSON_REPAIRS = Counter("codepilot_json_repairs_total", "Malformed responses recovered by the tolerant parser", CALL_LABELS + ("method",))
+CACHE_LOOKUPS = Counter("codepilot_cache_lookups_total", "Response cache lookups", ("layer", "result"))
+OUTPUT_VALIDATIONS = Counter("codepilot_output_validations_total", "Generated results checked by the validation pool", CALL_LABELS + ("status",))
+OUTPUT_REPAIRS = Counter("codepilot_output_repairs_total", "Automatic repair calls for results that failed validation", CALL_LABELS + ("outcome",))
+
+# Generations a session no longer needs
+GENERATIONS_CANCELLED = Counter("codepilot_generations_cancelled_total", "Generations cancelled by a newer request from the same session", CALL_LABELS + ("reason",))
+GENERATIONS_DEDUPED = Counter("codepilot_generations_deduped_total", "Repeated requests joined to the same session's identical in-flight generation", CALL_LABELS)
+
+# Admission control (see admission.py)
+ADMISSION_DECISIONS = Counter("codepilot_admission_decisions_total", "Upstream calls admitted, shed or timed out waiting for a slot", ("priority", "outcome"))
+ADMISSION_WAIT = Histogram("codepilot_admission_wait_seconds", "Time admitted calls waited for an upstream slot", ("priority",))
+
+ALL_METRICS = [LLM_REQUESTS, LLM_LATENCY, LLM_TTFT, LLM_TOKENS, LLM_COALESCED, LLM_RETRIES, UPSTREAM_REJECTIONS,
+               BREAKER_TRANSITIONS, JSON_PARSE, FALLBACKS, JSON_REPAIRS, CACHE_LOOKUPS, OUTPUT_VALIDATIONS,
+               OUTPUT_REPAIRS, GENERATIONS_CANCELLED, GENERATIONS_DEDUPED, ADMISSION_DECISIONS, ADMISSION_WAIT]
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered), math.ceil(pct / 100 * len(ordered))) - 1)
+    return ordered[index]
+
+
+def call_labels(endpoint, framework="", device=""):
+    return {"endpoint": endpoint, "framework": framework or "", "device": device or ""}
+
+
+def record_call(labels, duration, status="ok", ttft=None, usage=None):
+    """Record one finished upstream call"""
+    LLM_REQUESTS.inc(dict(labels, status=status))
+    LLM_LATENCY.observe(labels, duration)
+    if ttft is not None:
+        LLM_TTFT.observe(labels, ttft)
+    if usage:
+        LLM_TOKENS.inc(dict(labels, kind="prompt"), usage.get("prompt_tokens", 0))
+        LLM_TOKENS.inc(dict(labels, kind="completion"), usage.get("completion_tokens", 0))
+        if usage.get("cached_prompt_tokens"):
+            LLM_TOKENS.inc(dict(labels, kind="cached_prompt"), usage["cached_prompt_tokens"])
+
+
+def snapshot():
+    """JSON-serializable values of every metric in this process (see shared_state)"""
+    return {metric.name: metric.export() for metric in ALL_METRICS}
+
+
+def render_prometheus(snapshots=None):
+    """Render every metric in the Prometheus text exposition format.
+
+    With `snapshots` (from several worker processes), the values are summed
+    across them instead of read from this process.
+    """
+    lines = []
+    for metric in ALL_METRICS:
+        if snapshots is None:
+            lines.extend(metric.render())
+        else:
+            lines.extend(metric.render(metric.merge([entry.get(metric.name, []) for entry in snapshots])))
+    return "\n".join(lines) + "\n"
+
+
+def summary():
+    """Per endpoint/framework/device rows for dashboards"""
+    rows = {}
+
+    def row(key):
+        if key not in rows:
+            rows[key] = {
+                "endpoint": key[0], "framework": key[1], "device": key[2],
+                "calls": 0, "errors": 0, "avg_latency_s": None, "avg_ttft_s": None,
+                "prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0, "fallbacks": 0, "repairs": 0, "invalid": 0,
+                "cancelled": 0, "deduped": 0
+            }
+        return rows[key]
+
+    for key, value in LLM_REQUESTS.samples().items():
+        entry = row(key[:3])
+        entry["calls"] += value
+        # Cancelled calls were stopped on purpose and have their own column
+        if key[3] not in ("ok", "cancelled"):
+            entry["errors"] += value
+    for key, (count, total, _) in LLM_LATENCY.samples().items():
+        row(key)["avg_latency_s"] = round(total / count, 3) if count else None
+    for key, (count, total, _) in LLM_TTFT.samples().items():
+        row(key)["avg_ttft_s"] = round(total / count, 3) if count else None
+    for key, value in LLM_TOKENS.samples().items():
+        row(key[:3])[f"{key[3]}_tokens"] += value
+    for key, value in FALLBACKS.samples().items():
+        row(key[:3])["fallbacks"] += value
+    for key, value in JSON_REPAIRS.samples().items():
+        row(key[:3])["repairs"] += value
+    for key, value in OUTPUT_VALIDATIONS.samples().items():
+        if key[3] == "errors":
+            row(key[:3])["invalid"] += value
+    for key, value in GENERATIONS_CANCELLED.samples().items():
+        row(key[:3])["cancelled"] += value
+    for key, value in GENERATIONS_DEDUPED.samples().items():
+        row(key)["deduped"] += value
+    return sorted(rows.values(), key=lambda entry: (entry["endpoint"], entry["framework"], entry["device"]))
@@ -1,9 +1,21 @@
 # minimal_app.py - Simplified version to fix 400 error
 import os
 import json
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, Response, request, jsonify, render_template_string, stream_with_context
 from dotenv import load_dotenv
-from openai import OpenAI
+from llm_client import chat_completion, get_client, preload_client
+import metrics
+import admission
+from codegen import TEMPERATURE, stream_generation
+from response_cache import ResponseCache, make_cache_key
+from routing import get_router
+from upstream_guard import UpstreamUnavailable
+from job_queue import JobQueue, QueueClosed, QueueFull
+from project_export import ProjectExporter
+from refine import refine_result
+from validation import ValidationPool
+from shared_state import get_job_store, get_shared_metrics, get_state, render_metrics
+from serving import lifecycle
 
 # Load environment variables
 load_dotenv()
@@ -16,8 +28,40 @@ print(f"API Key exists: {bool(api_key)}")
 print(f"Base URL: {base_url}")
 print(f"Model ID: {model_id}")
 
-# Initialize the OpenAI client
-client = OpenAI(api_key=api_key, base_url=base_url)
+# Generation worker pool and queue settings
+generate_workers = int(os.getenv("GENERATE_WORKERS", "4"))
+generate_queue_size = int(os.getenv("GENERATE_QUEUE_SIZE", "32"))
+job_ttl_seconds = int(os.getenv("JOB_TTL_SECONDS", "600"))
+job_stream_timeout = float(os.getenv("JOB_STREAM_TIMEOUT", "300"))
+
+# Response cache; its SQLite file is shared by all workers (and with the Streamlit app when paths match)
+cache_max_bytes = int(os.getenv("CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+cache_ttl_seconds = int(os.getenv("CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+cache_db_path = os.getenv("CACHE_DB_PATH", ".codepilot_cache.sqlite3")
+
+# Check generated HTML, CSS and JS on worker processes; optionally make one repair call for broken output
+validation_enabled = os.getenv("VALIDATION_ENABLED", "true").lower() == "true"
+validation_workers = int(os.getenv("VALIDATION_WORKERS", "2"))
+validation_timeout_seconds = float(os.getenv("VALIDATION_TIMEOUT_SECONDS", "5"))
+validation_auto_repair = os.getenv("VALIDATION_AUTO_REPAIR", "false").lower() == "true"
+
+# Memory kept for recently exported project ZIPs
+export_cache_max_bytes = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Create the shared, pooled OpenAI client in the background so startup is not held up by importing openai
+preload_client()
+
+# Per-request model and token budget, learned from completed generations
+router = get_router()
+
+validation_pool = ValidationPool(validation_workers, validation_timeout_seconds) if validation_enabled else None
+
+response_cache = ResponseCache(max_bytes=cache_max_bytes, ttl_seconds=cache_ttl_seconds, db_path=cache_db_path or None)
+
+# Under serve.py the workers share job status, rate limits and metrics through this file
+shared_state = get_state()
+# Publish this worker's metrics from the start, not only once it has been scraped
+get_shared_metrics()
 
 app = Flask(__name__)
 
@@ -77,6 +121,14 @@ MINIMAL_HTML = """
                     return;
                 }
                 
+                // The job runs in the background; poll until it finishes
+                while (response.status === 202 && data.status !== 'done' && data.status !== 'error') {
+                    await new Promise(resolve => setTimeout(resolve, 1000));
+                    const statusResponse = await fetch('/api/jobs/' + data.job_id);
+                    data = await statusResponse.json();
+                    if (!statusResponse.ok) break;
+                }
+                
                 document.getElementById('output').textContent = JSON.stringify(data, null, 2);
                 document.getElementById('result').style.display = 'block';
             } catch (error) {
@@ -95,8 +147,78 @@ MINIMAL_HTML = """
 def index():
     return render_template_string(MINIMAL_HTML)
 
-@app.route('/api/generate', methods=['POST'])
-def generate():
+# Worker function: stream the generation and publish each field on the job as it arrives
+def run_generation_job(job):
+    payload = job.payload
+    route = router.route(payload['prompt'], payload['framework'], payload['device'])
+    cache_key = make_cache_key(payload['prompt'], payload['framework'], payload['device'], route["model"], TEMPERATURE)
+    if payload.get('use_cache', True):
+        cached = response_cache.get(cache_key)
+        metrics.CACHE_LOOKUPS.inc({"layer": "exact", "result": "hit" if cached is not None else "miss"})
+        if cached is not None:
+            cached["metadata"]["cache_hit"] = True
+            job.publish("done", {"result": cached, "missing_fields": []})
+            return cached
+    
+    for event in stream_generation(get_client(), route["model"], payload['prompt'], payload['framework'], payload['device'],
+                                   max_tokens=route["max_tokens"]):
+        if event[0] == "field":
+            job.publish("field", {"field": event[1], "value": event[2]})
+        else:
+            router.observe(route, event[1])
+            result = event[1]
+            result["metadata"]["cache_hit"] = False
+            result = validate_job_result(job, result, event[2], cache_key, route, payload['framework'], payload['device'])
+            job.publish("done", {"result": result, "missing_fields": event[2]})
+            return result
+    raise RuntimeError("Generation stream ended without a result")
+
+# Check a result in the background without holding up the job; once checked (and, when enabled, repaired)
+# it replaces the job's result and is cached if complete. Returns the result to publish now.
+def validate_job_result(job, result, missing_fields, cache_key, route, framework, device):
+    def finished(checked):
+        if not missing_fields:
+            response_cache.set(cache_key, checked)
+        if checked is not result:
+            job.revise(checked)
+    
+    if validation_pool is None:
+        finished(result)
+        return result
+    
+    def repair(broken, instruction):
+        try:
+            return refine_result(get_client(), route["model"], broken, instruction, framework, device)
+        except Exception as e:
+            print(f"Automatic repair failed: {str(e)}")
+            return None
+    
+    return validation_pool.check_later(result, framework, device, finished,
+                                       repair=repair if validation_auto_repair else None, endpoint="generate_stream")
+
+generation_queue = JobQueue(
+    run_generation_job,
+    workers=generate_workers,
+    max_queue=generate_queue_size,
+    job_ttl=job_ttl_seconds,
+    store=get_job_store()
+)
+
+# On shutdown, stop taking jobs and let the running ones finish (see serve.py)
+lifecycle.on_drain(generation_queue.drain)
+if validation_pool is not None:
+    # After the queue, so jobs still finishing can validate; forked pool processes would outlive the worker
+    lifecycle.on_drain(validation_pool.shutdown)
+lifecycle.add_check("queue", generation_queue.stats)
+lifecycle.add_check("admission", admission.stats)
+if shared_state is not None:
+    lifecycle.add_check("shared_state", lambda: shared_state.ping() or "ok")
+
+# Project ZIPs are streamed on request and reused by content hash
+project_exporter = ProjectExporter(max_bytes=export_cache_max_bytes)
+
+# Validate a generation request body; returns (payload, None) or (None, error response)
+def parse_generation_request():
     # Print request details
     print("\n--- REQUEST DETAILS ---")
     print(f"Content-Type: {request.content_type}")
@@ -106,7 +228,7 @@ def generate():
     if not request.is_json:
         error_msg = f"Expected application/json Content-Type but got {request.content_type}"
         print(f"Error: {error_msg}")
-        return jsonify({"error": error_msg}), 400
+        return None, (jsonify({"error": error_msg}), 400)
     
     # Parse JSON
     try:
@@ -114,27 +236,131 @@ def generate():
         prompt = data.get('prompt', '')
         
         if not prompt:
-            return jsonify({"error": "Prompt is required"}), 400
+            return None, (jsonify({"error": "Prompt is required"}), 400)
             
         print(f"Prompt: {prompt}")
     except Exception as e:
         error_msg = f"Error parsing JSON: {str(e)}"
         print(f"Error: {error_msg}")
-        return jsonify({"error": error_msg}), 400
+        return None, (jsonify({"error": error_msg}), 400)
     
-    # Create a simple response without calling the API
-    simple_response = {
-        "message": "Received prompt: " + prompt,
-        "sample_output": {
-            "interactive_code": "<html><body><button>Click Me</button></body></html>",
-            "html_code": "<button>Click Me</button>",
-            "css_code": "button { padding: 10px; background-color: blue; color: white; }",
-            "js_code": "document.querySelector('button').addEventListener('click', function() { alert('Button clicked!'); });",
-            "explanation": "This is a simple button example."
-        }
+    payload = {
+        "prompt": prompt,
+        "framework": data.get('framework', 'HTML/CSS/JS'),
+        "device": data.get('device', 'Desktop'),
+        "use_cache": bool(data.get('use_cache', True))
     }
+    return payload, None
+
+# Response for a full or draining queue: tell the client when to come back
+def queue_full_response(error):
+    response = jsonify({"error": str(error), "retry_after": error.retry_after})
+    response.status_code = 503 if isinstance(error, QueueClosed) else 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+# Format one server-sent event
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# Stream a job's events as server-sent events
+def job_event_stream(job):
+    def events():
+        for event, data in job.iter_events(timeout=job_stream_timeout):
+            yield sse_event(event, data)
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/generate', methods=['POST'])
+def generate():
+    """Queue a generation and return its job ID right away"""
+    payload, error_response = parse_generation_request()
+    if error_response:
+        return error_response
+    
+    try:
+        job = generation_queue.submit(payload)
+    except QueueFull as e:
+        return queue_full_response(e)
+    
+    response = jsonify({
+        "job_id": job.id,
+        "status": job.status,
+        "status_url": f"/api/jobs/{job.id}",
+        "stream_url": f"/api/jobs/{job.id}/stream"
+    })
+    response.status_code = 202
+    response.headers['Location'] = f"/api/jobs/{job.id}"
+    return response
+
+@app.route('/api/generate/stream', methods=['POST'])
+def generate_stream():
+    """Queue a generation and stream it as server-sent events: one `field` event per completed field, then `done`"""
+    payload, error_response = parse_generation_request()
+    if error_response:
+        return error_response
+    
+    try:
+        job = generation_queue.submit(payload)
+    except QueueFull as e:
+        return queue_full_response(e)
     
-    return jsonify(simple_response)
+    return job_event_stream(job)
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Poll a generation job; the result is included once it is done"""
+    job = generation_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job {job_id}"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/stream', methods=['GET'])
+def job_stream(job_id):
+    """Stream a generation job's events, replaying the ones already published"""
+    job = generation_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job {job_id}"}), 404
+    return job_event_stream(job)
+
+@app.route('/api/jobs/<job_id>/export.zip', methods=['GET'])
+def job_export(job_id):
+    """Stream a finished job's result as a runnable project ZIP"""
+    job = generation_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job {job_id}"}), 404
+    if job.result is None:
+        return jsonify({"error": f"Job {job_id} has no result yet", "status": job.status}), 409
+    
+    key, root, files = project_exporter.prepare(job.result, job.payload['framework'])
+    etag = f'"{key}"'
+    if etag in [tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')]:
+        return Response(status=304, headers={'ETag': etag})
+    
+    return Response(
+        project_exporter.stream(key, root, files),
+        mimetype='application/zip',
+        headers={
+            'Content-Disposition': f'attachment; filename="{root}.zip"',
+            'ETag': etag,
+            'Cache-Control': 'private, max-age=3600'
+        }
+    )
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition of the upstream call metrics (summed over all workers under serve.py)"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness for load balancers: 503 while this worker drains for shutdown"""
+    ready, details = lifecycle.readiness()
+    return jsonify(details), 200 if ready else 503
 
 @app.route('/api/test-claude', methods=['POST'])
 def test_claude():
@@ -143,7 +369,9 @@ def test_claude():
         prompt = data.get('prompt', 'Hello')
         
         # Make a simple API call to test connectivity
-        response = client.chat.completions.create(
+        response = chat_completion(
+            get_client(),
+            metric_labels=metrics.call_labels("test_claude"),
             model=model_id,
             messages=[{"role": "user", "content": prompt}],
             max_tokens=50
@@ -155,6 +383,14 @@ def test_claude():
             "status": "success",
             "api_response": response_text
         })
+    except UpstreamUnavailable as e:
+        response = jsonify({
+            "status": "error",
+            "message": f"The model API is unavailable right now: {str(e)}"
+        })
+        response.status_code = 503
+        response.headers["Retry-After"] = str(int(e.retry_after) + 1)
+        return response
     except Exception as e:
         print(f"Claude API error: {str(e)}")
         return jsonify({
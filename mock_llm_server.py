@@ -0,0 +1,272 @@
+# mock_llm_server.py - Local OpenAI-compatible stand-in for offline load tests
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class MockConfig:
+    """Latency, streaming and fault-injection settings for the mock server.
+
+    Latency is drawn per request from `latency_dist` ("fixed", "uniform" or
+    "lognormal") around `latency_mean` seconds. Each fault rate is the
+    probability (0-1) that a request gets that fault. With `replay` (see
+    replay.RecordedResponses), requests that match a recorded exchange get
+    its content, usage and timing instead; the rest are answered as usual.
+    """
+
+    def __init__(self, latency_dist="lognormal", latency_mean=1.0, latency_spread=0.5,
+                 chunk_chars=40, chunk_delay=0.02, malformed_rate=0.0, missing_field_rate=0.0,
+                 rate_limit_rate=0.0, error_rate=0.0, retry_after=1, seed=None, replay=None):
+        self.latency_dist = latency_dist
+        self.latency_mean = latency_mean
+        self.latency_spread = latency_spread
+        self.chunk_chars = chunk_chars
+        self.chunk_delay = chunk_delay
+        self.malformed_rate = malformed_rate
+        self.missing_field_rate = missing_field_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.replay = replay
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+
+    def roll(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def latency(self):
+        with self.lock:
+            if self.latency_dist == "fixed":
+                return self.latency_mean
+            if self.latency_dist == "uniform":
+                return max(0.0, self.random.uniform(self.latency_mean - self.latency_spread,
+                                                    self.latency_mean + self.latency_spread))
+            # Lognormal with the requested mean; `latency_spread` is sigma
+            sigma = self.latency_spread
+            mu = -sigma * sigma / 2
+            return self.latency_mean * self.random.lognormvariate(mu, sigma)
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def build_ui_content(prompt_text, drop_field=False):
+    """A generation response shaped like the one codegen asks for"""
+    content = {
+        "interactive_code": f"<html><body><h1>Mock UI</h1><p>{prompt_text[:80]}</p><button>Go</button></body></html>",
+        "separate_code": {"html": "<h1>Mock UI</h1><button>Go</button>", "css": "h1 { color: #333; }", "js": "console.log('mock');"},
+        "explanation": "Mock response generated locally for benchmarking. " * 20,
+        "css_code": "body { font-family: sans-serif; } button { padding: 8px 16px; }\n" * 10,
+        "framework_specific_code": "export default function Component() { return null; }\n" * 10,
+        "additional_files": {}
+    }
+    if drop_field:
+        del content["framework_specific_code"]
+    return json.dumps(content)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = MockConfig()
+
+    def log_message(self, format, *args):
+        # Keep benchmark output readable
+        pass
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock-model", "object": "model"}]})
+        else:
+            self._send_json(404, {"error": {"message": "Not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+
+        config = self.config
+        with config.lock:
+            config.requests += 1
+
+        recorded = config.replay.match(body) if config.replay is not None else None
+        if recorded is not None:
+            self._replay(recorded, body)
+            return
+
+        if config.roll(config.rate_limit_rate):
+            self._send_json(429, {"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}},
+                            headers={"Retry-After": str(config.retry_after)})
+            return
+        if config.roll(config.error_rate):
+            self._send_json(500, {"error": {"message": "Injected server error", "type": "server_error"}})
+            return
+
+        messages = body.get("messages", [])
+        prompt_text = messages[-1]["content"] if messages else ""
+        if body.get("response_format", {}).get("type") == "json_object":
+            content = build_ui_content(prompt_text, drop_field=config.roll(config.missing_field_rate))
+        else:
+            content = f"Mock reply to: {prompt_text[:200]}"
+        if config.roll(config.malformed_rate):
+            # Cut the JSON off mid-way, like a truncated completion
+            content = content[:len(content) // 2]
+
+        usage = {
+            "prompt_tokens": sum(estimate_tokens(m.get("content", "")) for m in messages),
+            "completion_tokens": estimate_tokens(content)
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        model = body.get("model") or "mock-model"
+
+        if body.get("stream"):
+            chunks = [content[i:i + config.chunk_chars] for i in range(0, len(content), config.chunk_chars)]
+            # Spend the sampled latency before the first token, then pace the chunks
+            first_token_delay = max(0.0, config.latency() - config.chunk_delay * len(chunks))
+            self._stream(chunks, model, usage, body.get("stream_options", {}).get("include_usage"),
+                         first_token_delay, config.chunk_delay)
+            return
+
+        time.sleep(config.latency())
+        self._send_json(200, {
+            "id": f"chatcmpl-mock-{config.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": usage
+        })
+
+    def _replay(self, recorded, body):
+        """Answer with a recorded exchange: same content and usage, timing as recorded (scaled)"""
+        model = body.get("model") or "mock-model"
+        if recorded["status"] == "error":
+            time.sleep(recorded["latency_s"])
+            self._send_json(500, {"error": {"message": recorded.get("error") or "Recorded error", "type": "server_error"}})
+            return
+        content = recorded["content"] or ""
+        usage = recorded.get("usage") or {}
+        if body.get("stream"):
+            count = max(1, recorded.get("chunks") or 1)
+            size = max(1, -(-len(content) // count))
+            chunks = [content[i:i + size] for i in range(0, len(content), size)]
+            first_token_delay = recorded["ttft_s"] if recorded.get("ttft_s") is not None else recorded["latency_s"]
+            chunk_delay = max(0.0, recorded["latency_s"] - first_token_delay) / max(1, len(chunks))
+            self._stream(chunks, model, usage, body.get("stream_options", {}).get("include_usage") and usage,
+                         first_token_delay, chunk_delay)
+            return
+        time.sleep(recorded["latency_s"])
+        self._send_json(200, {
+            "id": f"chatcmpl-replay-{self.config.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": recorded.get("finish_reason") or "stop"}],
+            "usage": usage or None
+        })
+
+    def _stream(self, chunks, model, usage, include_usage, first_token_delay, chunk_delay):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        time.sleep(first_token_delay)
+        base = {"id": "chatcmpl-mock-stream", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+        try:
+            for index, text in enumerate(chunks):
+                delta = {"role": "assistant", "content": text} if index == 0 else {"content": text}
+                self._write_event(dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}]))
+                time.sleep(chunk_delay)
+            self._write_event(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+            if include_usage:
+                self._write_event(dict(base, choices=[], usage=usage))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the stream
+            pass
+
+    def _write_event(self, data):
+        self.wfile.write(f"data: {json.dumps(data)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _send_json(self, status, data, headers=None):
+        payload = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def start_mock_server(config=None, host="127.0.0.1", port=0):
+    """Start the mock server on a background thread and return (server, base_url)"""
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"config": config or MockConfig()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="mock-llm-server", daemon=True)
+    thread.start()
+    return server, f"http://{host}:{server.server_address[1]}/v1"
+
+
+def add_config_arguments(parser):
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--latency-mean", type=float, default=1.0, help="Mean response latency in seconds")
+    parser.add_argument("--latency-spread", type=float, default=0.5, help="Uniform half-width or lognormal sigma")
+    parser.add_argument("--chunk-chars", type=int, default=40, help="Characters per streamed chunk")
+    parser.add_argument("--chunk-delay", type=float, default=0.02, help="Seconds between streamed chunks")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of responses with truncated JSON")
+    parser.add_argument("--missing-field-rate", type=float, default=0.0, help="Share of responses missing a field")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Share of requests answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 500")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible runs")
+
+
+def config_from_args(args):
+    return MockConfig(
+        latency_dist=args.latency_dist,
+        latency_mean=args.latency_mean,
+        latency_spread=args.latency_spread,
+        chunk_chars=args.chunk_chars,
+        chunk_delay=args.chunk_delay,
+        malformed_rate=args.malformed_rate,
+        missing_field_rate=args.missing_field_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        error_rate=args.error_rate,
+        retry_after=args.retry_after,
+        seed=args.seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local OpenAI-compatible mock server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_mock_server(config_from_args(args), args.host, args.port)
+    print(f"Mock LLM server listening; set OPENAI_BASE_URL={base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
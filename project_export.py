@@ -0,0 +1,320 @@
+# project_export.py - Lay out a generated result as a runnable project and export it as a ZIP
+import json
+import hashlib
+import zipfile
+import threading
+import posixpath
+from collections import OrderedDict
+
+# Fixed timestamp so the same files always produce the same archive bytes
+ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+VITE_SCRIPTS = {"dev": "vite", "build": "vite build", "preview": "vite preview"}
+
+HTML_SHELL = """<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <meta name="viewport" content="width=device-width, initial-scale=1.0">
+    <title>{title}</title>
+{head}</head>
+<body>
+{body}
+</body>
+</html>
+"""
+
+
+def project_slug(framework):
+    return "codepilot-" + "".join(c if c.isalnum() else "-" for c in framework.lower()).strip("-")
+
+
+def _package_json(name, dependencies, dev_dependencies, scripts):
+    return json.dumps({
+        "name": name,
+        "private": True,
+        "version": "0.1.0",
+        "type": "module",
+        "scripts": scripts,
+        "dependencies": dependencies,
+        "devDependencies": dev_dependencies
+    }, indent=2) + "\n"
+
+
+def _vite_index(title, mount_id, entry):
+    return HTML_SHELL.format(title=title, head="",
+                             body=f'    <div id="{mount_id}"></div>\n    <script type="module" src="{entry}"></script>')
+
+
+def _mapping(result, field):
+    """A dict-valued field of the result; anything else the model sent there (a string, a list) is skipped"""
+    value = result.get(field)
+    return value if isinstance(value, dict) else {}
+
+
+def _text(value):
+    if value is None:
+        return ""
+    return value if isinstance(value, str) else json.dumps(value, indent=2)
+
+
+def _html_project(result, name):
+    separate = _mapping(result, "separate_code")
+    html = _text(separate.get("html"))
+    if "<html" not in html.lower():
+        # A fragment: wrap it in a page that loads the other two files
+        html = HTML_SHELL.format(title=name, head='    <link rel="stylesheet" href="styles.css">\n',
+                                 body=html + '\n<script src="script.js"></script>')
+    return {
+        "index.html": html,
+        "styles.css": result.get("css_code") or separate.get("css", ""),
+        "script.js": separate.get("js", "")
+    }, "Open `index.html` in a browser."
+
+
+def _react_project(result, name):
+    return {
+        "package.json": _package_json(name, {"react": "^18.3.1", "react-dom": "^18.3.1"},
+                                      {"vite": "^5.4.0", "@vitejs/plugin-react": "^4.3.0"}, VITE_SCRIPTS),
+        "vite.config.js": "import { defineConfig } from 'vite';\nimport react from '@vitejs/plugin-react';\n\n"
+                          "export default defineConfig({ plugins: [react()] });\n",
+        "index.html": _vite_index(name, "root", "/src/main.jsx"),
+        "src/main.jsx": "import React from 'react';\nimport { createRoot } from 'react-dom/client';\n"
+                        "import App from './App.jsx';\nimport './styles.css';\n\n"
+                        "createRoot(document.getElementById('root')).render(<App />);\n",
+        "src/App.jsx": result.get("framework_specific_code", ""),
+        "src/styles.css": result.get("css_code", "")
+    }, "Run `npm install` and `npm run dev`. `src/App.jsx` must default-export the component."
+
+
+def _vue_project(result, name):
+    return {
+        "package.json": _package_json(name, {"vue": "^3.4.0"},
+                                      {"vite": "^5.4.0", "@vitejs/plugin-vue": "^5.1.0"}, VITE_SCRIPTS),
+        "vite.config.js": "import { defineConfig } from 'vite';\nimport vue from '@vitejs/plugin-vue';\n\n"
+                          "export default defineConfig({ plugins: [vue()] });\n",
+        "index.html": _vite_index(name, "app", "/src/main.js"),
+        "src/main.js": "import { createApp } from 'vue';\nimport App from './App.vue';\nimport './styles.css';\n\n"
+                       "createApp(App).mount('#app');\n",
+        "src/App.vue": result.get("framework_specific_code", ""),
+        "src/styles.css": result.get("css_code", "")
+    }, "Run `npm install` and `npm run dev`."
+
+
+def _svelte_project(result, name):
+    return {
+        "package.json": _package_json(name, {},
+                                      {"svelte": "^4.2.0", "vite": "^5.4.0", "@sveltejs/vite-plugin-svelte": "^3.1.0"},
+                                      VITE_SCRIPTS),
+        "vite.config.js": "import { defineConfig } from 'vite';\nimport { svelte } from '@sveltejs/vite-plugin-svelte';\n\n"
+                          "export default defineConfig({ plugins: [svelte()] });\n",
+        "index.html": _vite_index(name, "app", "/src/main.js"),
+        "src/main.js": "import App from './App.svelte';\nimport './styles.css';\n\n"
+                       "export default new App({ target: document.getElementById('app') });\n",
+        "src/App.svelte": result.get("framework_specific_code", ""),
+        "src/styles.css": result.get("css_code", "")
+    }, "Run `npm install` and `npm run dev`."
+
+
+def _angular_project(result, name):
+    angular = "^17.3.0"
+    package = json.loads(_package_json(
+        name,
+        {"@angular/common": angular, "@angular/compiler": angular, "@angular/core": angular,
+         "@angular/platform-browser": angular, "rxjs": "^7.8.0", "tslib": "^2.6.0", "zone.js": "^0.14.0"},
+        {"@angular/cli": angular, "@angular-devkit/build-angular": angular,
+         "@angular/compiler-cli": angular, "typescript": "~5.4.0"},
+        {"start": "ng serve", "build": "ng build"}
+    ))
+    del package["type"]
+    angular_json = {
+        "version": 1,
+        "projects": {
+            name: {
+                "projectType": "application",
+                "root": "",
+                "sourceRoot": "src",
+                "architect": {
+                    "build": {
+                        "builder": "@angular-devkit/build-angular:application",
+                        "options": {
+                            "outputPath": "dist",
+                            "index": "src/index.html",
+                            "browser": "src/main.ts",
+                            "tsConfig": "tsconfig.json",
+                            "styles": ["src/styles.css"]
+                        }
+                    },
+                    "serve": {
+                        "builder": "@angular-devkit/build-angular:dev-server",
+                        "options": {"buildTarget": f"{name}:build"}
+                    }
+                }
+            }
+        }
+    }
+    tsconfig = {
+        "compilerOptions": {
+            "target": "ES2022",
+            "module": "ES2022",
+            "moduleResolution": "node",
+            "strict": True,
+            "experimentalDecorators": True,
+            "useDefineForClassFields": False,
+            "lib": ["ES2022", "dom"]
+        },
+        "files": ["src/main.ts"]
+    }
+    return {
+        "package.json": json.dumps(package, indent=2) + "\n",
+        "angular.json": json.dumps(angular_json, indent=2) + "\n",
+        "tsconfig.json": json.dumps(tsconfig, indent=2) + "\n",
+        "src/index.html": HTML_SHELL.format(title=name, head="", body="    <app-root></app-root>"),
+        "src/main.ts": "import 'zone.js';\nimport { bootstrapApplication } from '@angular/platform-browser';\n"
+                       "import { AppComponent } from './app/app.component';\n\n"
+                       "bootstrapApplication(AppComponent).catch((err) => console.error(err));\n",
+        "src/app/app.component.ts": result.get("framework_specific_code", ""),
+        "src/styles.css": result.get("css_code", "")
+    }, ("Run `npm install` and `npm start`. `src/app/app.component.ts` must export a standalone "
+        "`AppComponent` with the `app-root` selector.")
+
+
+PROJECT_LAYOUTS = {
+    "HTML/CSS/JS": _html_project,
+    "React": _react_project,
+    "Vue.js": _vue_project,
+    "Angular": _angular_project,
+    "Svelte": _svelte_project
+}
+
+
+def _safe_path(path):
+    """Normalize a model-supplied file name so it stays inside the project"""
+    parts = [part for part in posixpath.normpath(str(path).replace("\\", "/")).split("/")
+             if part not in ("", ".", "..")]
+    return "/".join(parts)
+
+
+def project_files(result, framework):
+    """Return the project tree for `result` as an ordered {relative path: text} mapping"""
+    name = project_slug(framework)
+    files, run_hint = PROJECT_LAYOUTS.get(framework, _html_project)(result, name)
+    files = OrderedDict((path, _text(content)) for path, content in files.items())
+
+    # Generated files never overwrite the scaffold
+    for path, content in _mapping(result, "additional_files").items():
+        path = _safe_path(path)
+        if path and path not in files:
+            files[path] = _text(content)
+
+    if "README.md" not in files:
+        files["README.md"] = (f"# {name}\n\n{_text(result.get('explanation')).strip()}\n\n"
+                              f"## Running\n\n{run_hint}\n")
+    return files
+
+
+def content_hash(files):
+    """SHA-256 over the paths and contents of a project tree"""
+    digest = hashlib.sha256()
+    for path, content in files.items():
+        digest.update(path.encode("utf-8") + b"\0")
+        digest.update(content.encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+class _ChunkSink:
+    """Write-only file object that hands each write to the ZIP generator"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+
+def iter_zip(files, root):
+    """Yield a ZIP archive of `files` under the folder `root` in chunks, one entry at a time.
+
+    The sink is not seekable, so zipfile writes data descriptors and never
+    needs the whole archive in memory.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for path, content in files.items():
+            info = zipfile.ZipInfo(f"{root}/{path}", date_time=ZIP_DATE_TIME)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.external_attr = 0o644 << 16
+            archive.writestr(info, content.encode("utf-8"))
+            yield from sink.drain()
+    # Closing writes the central directory
+    yield from sink.drain()
+
+
+class ProjectExporter:
+    """Build project ZIPs on demand and keep recent ones, keyed by content hash.
+
+    Regenerating or revisiting a result with the same files reuses the
+    archive. The cache is an LRU bounded by total archive bytes.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._archives = OrderedDict()  # hash -> archive bytes
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, result, framework):
+        """Return (hash, root folder, files) without building the archive"""
+        files = project_files(result, framework)
+        return content_hash(files), project_slug(framework), files
+
+    def build(self, result, framework):
+        """Return the ZIP for `result` as bytes, from the cache when possible"""
+        key, root, files = self.prepare(result, framework)
+        archive = self._get(key)
+        if archive is None:
+            archive = b"".join(iter_zip(files, root))
+            self._put(key, archive)
+        return archive
+
+    def stream(self, key, root, files, chunk_size=64 * 1024):
+        """Yield the archive for prepared files, storing it once it is complete"""
+        archive = self._get(key)
+        if archive is not None:
+            # WSGI servers accept only bytes, so slice the bytes object rather than a memoryview
+            for start in range(0, len(archive), chunk_size):
+                yield archive[start:start + chunk_size]
+            return
+
+        chunks = []
+        for chunk in iter_zip(files, root):
+            chunks.append(chunk)
+            yield chunk
+        self._put(key, b"".join(chunks))
+
+    def _get(self, key):
+        with self._lock:
+            archive = self._archives.get(key)
+            if archive is not None:
+                self._archives.move_to_end(key)
+            return archive
+
+    def _put(self, key, archive):
+        if len(archive) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._archives:
+                return
+            self._archives[key] = archive
+            self._bytes += len(archive)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._archives.popitem(last=False)
+                self._bytes -= len(evicted)
@@ -0,0 +1,87 @@
+# prompt_builder.py - Generation prompts laid out as a static prefix plus a short variable suffix
+from functools import lru_cache
+from prompt_library import DEVICES
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional; token counts are estimated without it
+    tiktoken = None
+
+TOKEN_COUNTER = "tiktoken" if tiktoken is not None else "estimate"
+
+# Byte-identical for every request, so providers with prefix caching can reuse it.
+# Anything that varies (framework, device, prompt) belongs after it, never inside.
+SYSTEM_PREFIX = (
+    "You are CodePilot AI, an expert UI developer. Generate:\n"
+    "1. Complete, functional code for an interactive UI based on the user's prompt\n"
+    "2. The code should be specifically optimized for the target device\n"
+    "3. Use the target framework/technology\n"
+    "\n"
+    "Your response MUST be a valid JSON object with EXACTLY these fields (all are required):\n"
+    "- \"interactive_code\": A complete self-contained code that can be rendered directly\n"
+    "- \"separate_code\": The code in separate files format\n"
+    "- \"explanation\": Detailed explanation of how the code works and its features\n"
+    "- \"css_code\": Just the CSS/styling component\n"
+    "- \"framework_specific_code\": The main code specific to the chosen framework\n"
+    "- \"additional_files\": Any additional files or components needed\n"
+    "\n"
+    "The target framework and device are given at the start of the user message."
+)
+
+
+def _encoding():
+    return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text):
+    """Token count with tiktoken when installed, otherwise characters / 4"""
+    if tiktoken is not None:
+        return len(_encoding().encode(text))
+    return (len(text) + 3) // 4
+
+
+@lru_cache(maxsize=1)
+def prefix_tokens():
+    return count_tokens(SYSTEM_PREFIX)
+
+
+@lru_cache(maxsize=64)
+def target_parts(framework, device):
+    """Rendered text around the user prompt for one (framework, device), computed once"""
+    dims = DEVICES.get(device)
+    viewport = f" ({dims['width']}px wide viewport)" if dims and device != "Desktop" else ""
+    head = f"Target framework: {framework}\nTarget device: {device}{viewport}\n\nCreate an interactive UI for: "
+    tail = f". Make it professional, modern, and optimized for {device} with {framework}."
+    return head, tail, count_tokens(head + tail)
+
+
+def build_generation_messages(prompt, framework, device):
+    """Return (messages, token counts) for a generation request.
+
+    The system message is always SYSTEM_PREFIX; the user message is the
+    memoized target text with the prompt in the middle. Token counts are
+    {"static_prefix", "variable", "total", "counter"}.
+    """
+    head, tail, template_tokens = target_parts(framework, device)
+    variable_tokens = template_tokens + count_tokens(prompt)
+    messages = [
+        {"role": "system", "content": SYSTEM_PREFIX},
+        {"role": "user", "content": head + prompt + tail}
+    ]
+    return messages, {
+        "static_prefix": prefix_tokens(),
+        "variable": variable_tokens,
+        "total": prefix_tokens() + variable_tokens,
+        "counter": TOKEN_COUNTER
+    }
+
+
+def prompt_from_messages(messages, framework, device):
+    """Recover the user prompt from messages built by build_generation_messages, or None"""
+    head, tail, _ = target_parts(framework, device)
+    for message in messages:
+        content = message.get("content")
+        if message.get("role") == "user" and isinstance(content, str) \
+                and content.startswith(head) and content.endswith(tail) and len(content) >= len(head) + len(tail):
+            return content[len(head):len(content) - len(tail)]
+    return None
@@ -0,0 +1,56 @@
+# prompt_library.py - Frameworks, devices and canned prompts shared by the apps and batch tools
+
+# Define frontend frameworks
+FRAMEWORKS = [
+    "HTML/CSS/JS",
+    "React",
+    "Vue.js",
+    "Angular",
+    "Svelte"
+]
+
+# Define device types - All dimensions are integers
+DEVICES = {
+    "Desktop": {"width": 1200, "height": 600},
+    "Tablet": {"width": 768, "height": 600},
+    "Mobile": {"width": 375, "height": 600}
+}
+
+# Prompt library organized by categories
+PROMPT_LIBRARY = {
+    "Form Components": [
+        "Create a login form with email and password fields",
+        "Create a sign-up form with name, email, password fields",
+        "Create a contact form with name, email, message, and submit button",
+        "Create a checkout form with billing address and payment details",
+        "Create a search form with filters and search button"
+    ],
+    "Navigation Components": [
+        "Create a responsive navbar with logo and links",
+        "Create a sidebar navigation with categories",
+        "Create a bottom navigation bar for mobile with icons",
+        "Create a mega menu with dropdown categories",
+        "Create a breadcrumb navigation for a product page"
+    ],
+    "Interactive Elements": [
+        "Create an image carousel with navigation arrows",
+        "Create a modal popup with form inside",
+        "Create an accordion FAQ section",
+        "Create a tabbed interface for content",
+        "Create a star rating component"
+    ],
+    "Data Display": [
+        "Create a responsive data table with sorting",
+        "Create a pricing table with multiple tiers",
+        "Create a dashboard with key metrics",
+        "Create a product grid with cards",
+        "Create a timeline component for events"
+    ],
+    "Complete Layouts": [
+        "Create a landing page with hero section",
+        "Create a product page with images and details",
+        "Create a blog layout with featured post",
+        "Create a portfolio gallery with filtering",
+        "Create an admin dashboard with sidebar navigation"
+    ]
+}
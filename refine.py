@@ -0,0 +1,130 @@
+# refine.py - Incremental refinement of a generated UI through structured edits
+import copy
+import json
+from datetime import datetime
+from llm_client import chat_completion, usage_to_dict
+from response_parser import parse_response
+import metrics
+
+# Small edits need a fraction of the full generation budget
+REFINE_MAX_TOKENS = 1200
+
+# Fields the model may edit
+EDITABLE_FIELDS = ["interactive_code", "css_code", "framework_specific_code"]
+
+
+class RefineError(Exception):
+    """Raised when the model's edits cannot be applied cleanly"""
+
+
+# Static, like prompt_builder.SYSTEM_PREFIX; the framework and device go in the user message
+REFINE_SYSTEM_PREFIX = (
+    "You are CodePilot AI, an expert UI developer editing existing code for the target framework and device.\n"
+    "Do NOT rewrite the code. Respond with a JSON object with exactly these fields:\n"
+    f"- \"edits\": a list of {{\"field\": one of {json.dumps(EDITABLE_FIELDS)}, \"find\": exact text copied from that field, "
+    "\"replace\": new text}\n"
+    "- \"summary\": one sentence describing the change\n"
+    "Each \"find\" must match the current code exactly once. Keep edits as small as possible."
+)
+
+
+def build_refine_messages(result, instruction, framework, device):
+    """Build the chat messages asking for a JSON list of search/replace edits"""
+    current_code = {field: result.get(field, "") for field in EDITABLE_FIELDS}
+    return [
+        {"role": "system", "content": REFINE_SYSTEM_PREFIX},
+        {"role": "user", "content": f"Target framework: {framework}\nTarget device: {device}\n\n"
+                                    f"Current code:\n{json.dumps(current_code)}\n\nChange request: {instruction}"}
+    ]
+
+
+def apply_edits(result, edits):
+    """Return a copy of `result` with the edits applied, or raise RefineError.
+
+    A CSS edit whose text also appears in interactive_code is applied there
+    too, so the preview stays in sync with the stylesheet.
+    """
+    if not isinstance(edits, list) or not edits:
+        raise RefineError("The model returned no edits")
+
+    refined = copy.deepcopy(result)
+    for index, edit in enumerate(edits):
+        if not isinstance(edit, dict):
+            raise RefineError(f"Edit {index} is not an object")
+        field = edit.get("field")
+        find = edit.get("find")
+        replace = edit.get("replace")
+        if field not in EDITABLE_FIELDS or not isinstance(find, str) or not isinstance(replace, str) or not find:
+            raise RefineError(f"Edit {index} is malformed")
+
+        current = refined.get(field)
+        if not isinstance(current, str):
+            raise RefineError(f"Field {field} is not editable text")
+        occurrences = current.count(find)
+        if occurrences != 1:
+            raise RefineError(f"Edit {index} matched {occurrences} times in {field}")
+        refined[field] = current.replace(find, replace, 1)
+
+        if field == "css_code":
+            preview = refined.get("interactive_code")
+            if isinstance(preview, str) and preview.count(find) == 1:
+                refined["interactive_code"] = preview.replace(find, replace, 1)
+            if isinstance(refined.get("separate_code"), dict):
+                separate_css = refined["separate_code"].get("css")
+                if isinstance(separate_css, str) and separate_css.count(find) == 1:
+                    refined["separate_code"]["css"] = separate_css.replace(find, replace, 1)
+
+    if not refined.get("interactive_code", "").strip():
+        raise RefineError("Edits left the preview empty")
+    return refined
+
+
+def refine_result(client, model_id, result, instruction, framework, device, max_tokens=REFINE_MAX_TOKENS):
+    """Ask the model for edits to `result` and apply them locally.
+
+    Returns the refined result; its metadata records the instruction, the
+    number of edits and the token usage. Raises RefineError (or the API
+    error) when the refinement cannot be used, so the caller can fall back
+    to a full generation.
+    """
+    labels = metrics.call_labels("refine", framework, device)
+    response = chat_completion(
+        client,
+        metric_labels=labels,
+        model=model_id,
+        messages=build_refine_messages(result, instruction, framework, device),
+        response_format={"type": "json_object"},
+        max_tokens=max_tokens,
+        temperature=0.2
+    )
+
+    try:
+        patch, _ = parse_response(response.choices[0].message.content)
+    except json.JSONDecodeError as e:
+        metrics.FALLBACKS.inc(dict(labels, reason="parse_error"))
+        raise RefineError(f"Could not parse edits: {str(e)}")
+    if not isinstance(patch, dict):
+        raise RefineError("The model did not return an edit object")
+
+    try:
+        refined = apply_edits(result, patch.get("edits"))
+    except RefineError:
+        metrics.FALLBACKS.inc(dict(labels, reason="edit_rejected"))
+        raise
+
+    metadata = dict(result.get("metadata") or {})
+    metadata.update({
+        "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "framework": framework,
+        "device": device,
+        "cache_hit": False,
+        "refinement": {
+            "instruction": instruction,
+            "summary": patch.get("summary", ""),
+            "edits": len(patch["edits"]),
+            "usage": usage_to_dict(response.usage)
+        }
+    })
+    metadata.pop("semantic_match", None)
+    refined["metadata"] = metadata
+    return refined
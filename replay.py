@@ -0,0 +1,378 @@
+# replay.py - Replay recorded upstream traffic through the app against the local mock LLM server
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import replay_log
+from metrics import percentile
+from mock_llm_server import add_config_arguments, config_from_args, start_mock_server
+
+TARGETS = ["pipeline", "flask"]
+
+# Endpoints whose requests are full generations and are replayed through the generation path
+GENERATION_ENDPOINTS = ("generate", "generate_stream", "warmup", "speculative")
+
+
+def messages_key(messages):
+    return hashlib.sha256(json.dumps(messages, sort_keys=True, separators=(",", ":")).encode("utf-8")).hexdigest()
+
+
+class RecordedResponses:
+    """Recorded answers for the mock server (MockConfig.replay), keyed by the request messages.
+
+    Identical requests get the recorded answers in recording order and cycle
+    through them when replayed more often than recorded (e.g. with caching
+    off). Recorded latency and time to first token are multiplied by
+    `latency_scale`.
+    """
+
+    def __init__(self, records, latency_scale=1.0):
+        self.latency_scale = latency_scale
+        self.matched = 0
+        self.unmatched = 0
+        self._answers = {}
+        self._next = {}
+        self._lock = threading.Lock()
+        for record in records:
+            messages = (record.get("params") or {}).get("messages")
+            if messages and record["status"] in ("ok", "error"):
+                self._answers.setdefault(messages_key(messages), []).append(record)
+
+    def match(self, body):
+        """The recorded answer for a request body, or None to let the mock answer it"""
+        key = messages_key(body.get("messages") or [])
+        with self._lock:
+            answers = self._answers.get(key)
+            if not answers:
+                self.unmatched += 1
+                return None
+            index = self._next.get(key, 0)
+            self._next[key] = index + 1
+            self.matched += 1
+        record = answers[index % len(answers)]
+        timing = record.get("timing") or {}
+        ttft = timing.get("ttft_s")
+        return {
+            "status": record["status"],
+            "content": record.get("content"),
+            "usage": record.get("usage"),
+            "finish_reason": record.get("finish_reason"),
+            "error": record.get("error"),
+            "latency_s": (timing.get("latency_s") or 0.0) * self.latency_scale,
+            "ttft_s": ttft * self.latency_scale if ttft is not None else None,
+            "chunks": timing.get("chunks")
+        }
+
+
+def load_records(paths, endpoints=None):
+    """Records from log files and directories, in the order they were sent"""
+    files = []
+    for path in paths:
+        files.extend(replay_log.log_files(path) if os.path.isdir(path) else [path])
+    records = [record for record in replay_log.iter_records(files)
+               if record.get("v") == replay_log.RECORD_VERSION and (not endpoints or record.get("endpoint") in endpoints)]
+    # Several workers write their own files; interleave them by start time
+    records.sort(key=lambda record: record["ts"])
+    return records
+
+
+def is_generation(record):
+    return record["endpoint"] in GENERATION_ENDPOINTS
+
+
+def recorded_prompt(record):
+    from prompt_builder import prompt_from_messages
+    return prompt_from_messages(record["params"].get("messages") or [], record["framework"], record["device"])
+
+
+def send_raw(record):
+    """Send a recorded request unchanged through chat_completion"""
+    import metrics
+    from llm_client import chat_completion, get_client
+    labels = metrics.call_labels(record["endpoint"], record["framework"], record["device"])
+    response = chat_completion(get_client(), metric_labels=labels, **record["params"])
+    if record["params"].get("stream"):
+        for _ in response:
+            pass
+    return "raw"
+
+
+def make_pipeline_target(use_cache):
+    """Replay generations through the same steps as app.generate_code: route, cache lookup, generate, cache.
+
+    generate_code itself runs inside the Streamlit script, so the steps are
+    repeated here on the same modules without the page around them.
+    """
+    from codegen import TEMPERATURE, generate_result, stream_generation
+    from llm_client import get_client
+    from routing import get_router
+    from response_cache import ResponseCache, make_cache_key
+    router = get_router()
+    cache = ResponseCache()
+
+    def run(record):
+        prompt = recorded_prompt(record) if is_generation(record) else None
+        if prompt is None:
+            return send_raw(record)
+        framework, device = record["framework"], record["device"]
+        route = router.route(prompt, framework, device)
+        cache_key = make_cache_key(prompt, framework, device, route["model"], TEMPERATURE)
+        if use_cache and cache.get(cache_key) is not None:
+            return "cache_hit"
+        if record["params"].get("stream"):
+            result = missing_fields = None
+            for event in stream_generation(get_client(), route["model"], prompt, framework, device,
+                                           temperature=TEMPERATURE, max_tokens=route["max_tokens"],
+                                           endpoint=record["endpoint"]):
+                if event[0] == "done":
+                    _, result, missing_fields = event
+            if result is None:
+                raise RuntimeError("Generation stream ended without a result")
+        else:
+            result, missing_fields = generate_result(get_client(), route["model"], prompt, framework, device,
+                                                     temperature=TEMPERATURE, max_tokens=route["max_tokens"],
+                                                     endpoint=record["endpoint"])
+        router.observe(route, result)
+        if not missing_fields:
+            cache.set(cache_key, result)
+        return "generated"
+
+    return run, cache
+
+
+def make_flask_target(use_cache):
+    """Replay through the Flask routes: generations as /api/generate jobs, diagnostics on their test routes"""
+    import minimal_app
+    import troubleshoot_app
+    minimal = minimal_app.app.test_client()
+    troubleshoot = troubleshoot_app.app.test_client()
+
+    def run(record):
+        prompt = recorded_prompt(record) if is_generation(record) else None
+        messages = record["params"].get("messages") or []
+        if prompt is not None:
+            payload = {"prompt": prompt, "framework": record["framework"], "device": record["device"], "use_cache": use_cache}
+            if record["params"].get("stream"):
+                response = minimal.post("/api/generate/stream", json=payload)
+                if response.status_code != 200:
+                    raise RuntimeError(f"HTTP {response.status_code}")
+                body = response.get_data(as_text=True)
+                if "event: done" not in body:
+                    raise RuntimeError("stream ended without a result")
+                return "cache_hit" if '"cache_hit": true' in body else "generated"
+            response = minimal.post("/api/generate", json=payload)
+            if response.status_code != 202:
+                raise RuntimeError(f"HTTP {response.status_code}")
+            job_url = response.get_json()["status_url"]
+            while True:
+                job = minimal.get(job_url).get_json()
+                if job["status"] == "done":
+                    return "cache_hit" if job["result"]["metadata"].get("cache_hit") else "generated"
+                if job["status"] == "error":
+                    raise RuntimeError(job.get("error", "job failed"))
+                time.sleep(0.02)
+        if record["endpoint"] in ("api_test", "test_claude") and len(messages) == 1:
+            http, path = (troubleshoot, "/api-test") if record["endpoint"] == "api_test" else (minimal, "/api/test-claude")
+            response = http.post(path, json={"prompt": messages[0]["content"]})
+            if response.status_code != 200:
+                raise RuntimeError(f"HTTP {response.status_code}")
+            return "route"
+        return send_raw(record)
+
+    return run, minimal_app.response_cache
+
+
+def replay(records, run, speed, concurrency):
+    """Send every record at its recorded offset divided by `speed` (0 = back to back); returns per-record results"""
+    results = []
+    results_lock = threading.Lock()
+    first = records[0]["ts"] if records else 0.0
+
+    def timed(record, scheduled):
+        started = time.monotonic()
+        try:
+            outcome, error = run(record), None
+        except Exception as e:
+            outcome, error = None, type(e).__name__
+        with results_lock:
+            results.append({"endpoint": record["endpoint"], "recorded_status": record["status"], "outcome": outcome,
+                            "error": error, "latency": time.monotonic() - started, "lag": started - scheduled})
+
+    began = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="replay") as pool:
+        for record in records:
+            scheduled = began + ((record["ts"] - first) / speed if speed > 0 else 0.0)
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(timed, record, max(scheduled, began))
+    return results, time.monotonic() - began
+
+
+def parse_benchmark(records, min_seconds=0.5):
+    """Parse the recorded generation responses back to back for at least `min_seconds`.
+
+    Timed apart from the replay, where parses share the GIL with every
+    in-flight request, so the numbers are steady enough to compare runs.
+    """
+    from response_parser import StreamingFieldParser, parse_response
+    texts = [record["content"] for record in records
+             if is_generation(record) and record["status"] == "ok" and record.get("content")]
+    if not texts:
+        return {"responses": 0}
+    parses = size = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < min_seconds:
+        for text in texts:
+            # Streams parse incrementally as chunks arrive, then once more in full
+            StreamingFieldParser().feed(text)
+            try:
+                parse_response(text)
+            except json.JSONDecodeError:
+                pass
+            parses += 1
+            size += len(text.encode("utf-8"))
+    elapsed = time.perf_counter() - started
+    return {
+        "responses": len(texts),
+        "parses": parses,
+        "parses_per_s": round(parses / elapsed, 1),
+        "mb_per_s": round(size / elapsed / 1024 / 1024, 2)
+    }
+
+
+def build_report(records, results, elapsed, cache, responses):
+    import metrics
+    endpoints = {}
+    for result in results:
+        entry = endpoints.setdefault(result["endpoint"], {"count": 0, "errors": {}, "outcomes": {}, "latencies": []})
+        entry["count"] += 1
+        if result["error"]:
+            entry["errors"][result["error"]] = entry["errors"].get(result["error"], 0) + 1
+        else:
+            entry["outcomes"][result["outcome"]] = entry["outcomes"].get(result["outcome"], 0) + 1
+            entry["latencies"].append(result["latency"])
+    for entry in endpoints.values():
+        latencies = entry.pop("latencies")
+        entry["p50_s"] = round(percentile(latencies, 50), 4) if latencies else None
+        entry["p95_s"] = round(percentile(latencies, 95), 4) if latencies else None
+
+    parses = parse_seconds = 0
+    for count, total, _ in metrics.JSON_PARSE.samples().values():
+        parses += count
+        parse_seconds += total
+    return {
+        "records": len(records),
+        "replayed": len(results),
+        "elapsed_s": round(elapsed, 3),
+        "max_lag_s": round(max((result["lag"] for result in results), default=0.0), 4),
+        "recorded_errors": sum(1 for record in records if record["status"] == "error"),
+        "endpoints": endpoints,
+        "parse": {
+            "replayed_parses": parses,
+            "replayed_avg_ms": round(parse_seconds / parses * 1000, 3) if parses else None,
+            "benchmark": parse_benchmark(records)
+        },
+        "cache": cache.stats(),
+        "fallbacks": sum(metrics.FALLBACKS.samples().values()),
+        "repairs": sum(metrics.JSON_REPAIRS.samples().values()),
+        "stub": {"matched": responses.matched, "unmatched": responses.unmatched}
+    }
+
+
+def hit_rate(cache_stats):
+    lookups = cache_stats.get("hits", 0) + cache_stats.get("misses", 0)
+    return cache_stats.get("hits", 0) / lookups if lookups else None
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Regressions of this run against an earlier report: slower parsing or different caching"""
+    problems = []
+    current, previous = report["parse"]["benchmark"].get("mb_per_s"), baseline["parse"]["benchmark"].get("mb_per_s")
+    if current and previous and current < previous * (1 - tolerance):
+        problems.append(f"parse throughput fell from {previous} to {current} MB/s")
+    # Faster replays send repeats before the first answer is cached, so only same-speed runs are comparable
+    if baseline.get("speed") == report["speed"]:
+        current, previous = hit_rate(report["cache"]), hit_rate(baseline["cache"])
+        if current is not None and previous is not None and current < previous - tolerance:
+            problems.append(f"cache hit rate fell from {previous:.2f} to {current:.2f}")
+    if report["fallbacks"] > baseline.get("fallbacks", 0):
+        problems.append(f"fallbacks rose from {baseline.get('fallbacks', 0)} to {report['fallbacks']}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded upstream traffic (see replay_log) against a local stub")
+    parser.add_argument("logs", nargs="+", help="Log files or directories written with REPLAY_RECORD_DIR")
+    parser.add_argument("--target", choices=TARGETS, default="pipeline",
+                        help="pipeline: router, cache and codegen in this process; flask: the minimal and troubleshoot apps")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Replay the recorded inter-arrival times this many times faster (0 = as fast as possible)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="Multiply recorded upstream latency by this")
+    parser.add_argument("--endpoints", nargs="*", help="Only replay calls recorded under these endpoints")
+    parser.add_argument("--concurrency", type=int, default=64, help="Most replayed requests in flight at once")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the response cache for generations")
+    parser.add_argument("--baseline", help="Earlier --output report; exit 1 on parse-throughput or caching regressions")
+    parser.add_argument("--tolerance", type=float, default=0.3,
+                        help="Allowed drop against the baseline: fraction of parse throughput, absolute cache hit rate")
+    parser.add_argument("--output", help="Write the report as JSON to this file")
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    records = load_records(args.logs, args.endpoints)
+    if not records:
+        raise SystemExit("No records found")
+    # Cancelled streams were cut short on purpose and have no complete answer to replay
+    records = [record for record in records if record["status"] in ("ok", "error")]
+
+    config = config_from_args(args)
+    responses = config.replay = RecordedResponses(records, args.latency_scale)
+    server, base_url = start_mock_server(config)
+
+    # Must be set before the app modules create the shared client
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "mock-key")
+    os.environ.setdefault("MODEL_ID", "mock-model")
+    os.environ.setdefault("OPENAI_MAX_RETRIES", "0")
+    # Keep the replay off the on-disk cache, out of the log it reads and away from background generation
+    os.environ["CACHE_DB_PATH"] = ""
+    os.environ["WARMUP_ENABLED"] = "false"
+    replay_log.record_dir = ""
+
+    if args.target == "pipeline":
+        run, cache = make_pipeline_target(not args.no_cache)
+    else:
+        run, cache = make_flask_target(not args.no_cache)
+
+    results, elapsed = replay(records, run, args.speed, args.concurrency)
+    report = build_report(records, results, elapsed, cache, responses)
+    report.update(target=args.target, speed=args.speed, latency_scale=args.latency_scale)
+    server.shutdown()
+
+    for endpoint, entry in sorted(report["endpoints"].items()):
+        print(f"{endpoint:16} n={entry['count']:<5} err={sum(entry['errors'].values()):<4} "
+              f"p50={entry['p50_s']} p95={entry['p95_s']} {entry['outcomes']}")
+    print(f"replayed {report['replayed']}/{report['records']} in {report['elapsed_s']}s (max lag {report['max_lag_s']}s); "
+          f"parse {report['parse']['benchmark'].get('mb_per_s')} MB/s; "
+          f"cache hits={report['cache']['hits']} misses={report['cache']['misses']}; "
+          f"stub matched={report['stub']['matched']} unmatched={report['stub']['unmatched']}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare_to_baseline(report, json.load(f), args.tolerance)
+        for problem in problems:
+            print(f"REGRESSION: {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
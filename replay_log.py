@@ -0,0 +1,176 @@
+# replay_log.py - Opt-in recording of upstream model exchanges to rotated JSONL (zstd) logs
+import io
+import os
+import glob
+import json
+import time
+import atexit
+import threading
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional; logs are written as plain JSONL without it
+    zstandard = None
+
+# Raised when reading the last block of a compressed log whose writer was killed
+TRUNCATED_ERRORS = (zstandard.ZstdError,) if zstandard is not None else ()
+
+# Directory for the logs (empty = recording off). Logs hold full prompts and responses, so keep them private.
+record_dir = os.getenv("REPLAY_RECORD_DIR", "")
+
+# Start a new file after this many uncompressed bytes and keep only the newest files
+record_max_bytes = int(float(os.getenv("REPLAY_RECORD_MAX_MB", "64")) * 1024 * 1024)
+record_max_files = int(os.getenv("REPLAY_RECORD_MAX_FILES", "20"))
+
+# "zstd" (when zstandard is installed) or "none"
+record_compression = os.getenv("REPLAY_RECORD_COMPRESSION", "zstd")
+
+RECORD_VERSION = 1
+FILE_PREFIX = "upstream-"
+
+
+class ReplayRecorder:
+    """Append one JSON line per upstream exchange, rotating files by size.
+
+    Each file is named after its start time, the process id and a sequence
+    number, so neither the workers of one server nor two rotations in the
+    same millisecond share a file. Compressed files are written
+    as a single zstd frame flushed after every record, so a log can be read
+    while it is still being written.
+    """
+
+    def __init__(self, directory, max_bytes=64 * 1024 * 1024, max_files=20, compression="zstd"):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.compress = compression == "zstd" and zstandard is not None
+        if compression == "zstd" and zstandard is None:
+            print("REPLAY_RECORD_COMPRESSION=zstd but zstandard is not installed; writing plain JSONL")
+        os.makedirs(directory, exist_ok=True)
+        self.path = None
+        self.records = 0
+        self._sequence = 0
+        self._file = None
+        self._written = 0
+        self._lock = threading.Lock()
+
+    def record(self, entry):
+        line = (json.dumps(entry, separators=(",", ":"), default=str) + "\n").encode("utf-8")
+        with self._lock:
+            if self._file is None or self._written + len(line) > self.max_bytes:
+                self._rotate()
+            self._file.write(line)
+            if self.compress:
+                self._file.flush(zstandard.FLUSH_BLOCK)
+            else:
+                self._file.flush()
+            self._written += len(line)
+            self.records += 1
+
+    def close(self):
+        with self._lock:
+            self._close_file()
+
+    def _rotate(self):
+        self._close_file()
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        suffix = ".jsonl.zst" if self.compress else ".jsonl"
+        millis = int(time.time() * 1000) % 1000
+        self._sequence += 1
+        self.path = os.path.join(self.directory, f"{FILE_PREFIX}{stamp}-{millis:03d}-{os.getpid()}-{self._sequence:04d}{suffix}")
+        raw = open(self.path, "wb")
+        self._file = zstandard.ZstdCompressor(level=3).stream_writer(raw) if self.compress else raw
+        self._written = 0
+        if self.max_files > 0:
+            # The cap covers the whole directory, i.e. every worker recording into it
+            for old in log_files(self.directory)[:-self.max_files]:
+                try:
+                    os.remove(old)
+                except OSError:
+                    pass
+
+    def _close_file(self):
+        if self._file is not None:
+            if self.compress:
+                self._file.flush(zstandard.FLUSH_FRAME)
+            self._file.close()
+            self._file = None
+
+
+def log_files(directory):
+    """Recorded logs in `directory`, oldest first"""
+    paths = glob.glob(os.path.join(directory, f"{FILE_PREFIX}*.jsonl")) + glob.glob(os.path.join(directory, f"{FILE_PREFIX}*.jsonl.zst"))
+    return sorted(paths, key=lambda path: (os.path.getmtime(path), path))
+
+
+def iter_records(paths):
+    """Yield the records of each log in order; a line cut off by a crash ends that file"""
+    for path in paths:
+        with open(path, "rb") as raw:
+            if path.endswith(".zst"):
+                if zstandard is None:
+                    raise RuntimeError(f"{path} is zstd-compressed; install zstandard to read it")
+                stream = zstandard.ZstdDecompressor().stream_reader(raw, read_across_frames=True)
+            else:
+                stream = raw
+            try:
+                for line in io.TextIOWrapper(stream, encoding="utf-8"):
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        break
+            except TRUNCATED_ERRORS:
+                pass
+
+
+def exchange_record(labels, params, status, started_at, latency, content=None, usage=None, ttft=None,
+                    finish_reason=None, chunks=None, error=None):
+    """One upstream exchange as stored in the log (see replay.py for how it is played back)"""
+    return {
+        "v": RECORD_VERSION,
+        "ts": round(started_at, 3),
+        "pid": os.getpid(),
+        "endpoint": labels.get("endpoint", ""),
+        "framework": labels.get("framework", ""),
+        "device": labels.get("device", ""),
+        "params": params,
+        "status": status,
+        "content": content,
+        "finish_reason": finish_reason,
+        "usage": usage or {},
+        "timing": {
+            "latency_s": round(latency, 4),
+            "ttft_s": round(ttft, 4) if ttft is not None else None,
+            "chunks": chunks
+        },
+        "error": error
+    }
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def get_recorder():
+    """This process's recorder, or None when REPLAY_RECORD_DIR is not set"""
+    global _recorder
+    if not record_dir:
+        return None
+    if _recorder is None:
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = ReplayRecorder(record_dir, record_max_bytes, record_max_files, record_compression)
+                # Close the zstd frame cleanly on a normal exit
+                atexit.register(_recorder.close)
+    return _recorder
+
+
+def record_exchange(labels, params, status, started_at, latency, **fields):
+    """Record one exchange if recording is on; never lets a logging problem fail the call"""
+    recorder = get_recorder()
+    if recorder is None:
+        return
+    try:
+        recorder.record(exchange_record(labels, params, status, started_at, latency, **fields))
+    except (OSError, ValueError, TypeError) as e:
+        print(f"Recording the upstream exchange failed: {str(e)}")
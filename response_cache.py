@@ -0,0 +1,212 @@
+# response_cache.py - Two-tier cache for generated UI responses
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def make_cache_key(prompt, framework, device, model_id, temperature):
+    """Build a content-addressed key from the normalized generation request"""
+    normalized = {
+        "prompt": " ".join(prompt.split()).casefold(),
+        "framework": framework,
+        "device": device,
+        "model_id": model_id or "",
+        "temperature": round(float(temperature), 3)
+    }
+    payload = json.dumps(normalized, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """In-process LRU (bounded in bytes) backed by an optional SQLite tier.
+
+    Values are stored as JSON text, so every `get` returns a fresh copy that
+    callers can modify without touching the cached entry. Expired entries are
+    kept for another `stale_ttl_seconds`, so `get_stale` can still serve them
+    while the model API is unavailable.
+    """
+
+    def __init__(self, max_bytes=50 * 1024 * 1024, ttl_seconds=7 * 24 * 3600,
+                 db_path=None, max_disk_entries=5000, stale_ttl_seconds=0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.stale_ttl_seconds = stale_ttl_seconds
+        self.db_path = db_path
+        self.max_disk_entries = max_disk_entries
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (expires_at, payload, size)
+        self._memory_bytes = 0
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "evictions": 0,
+            "expired": 0,
+            "stale_hits": 0,
+            "writes": 0
+        }
+
+        self._db = None
+        if db_path:
+            directory = os.path.dirname(os.path.abspath(db_path))
+            os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+            # WAL lets the workers of a multi-process server read while one of them writes
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, payload TEXT NOT NULL, "
+                "created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created_at)")
+            self._db.commit()
+
+    def get(self, key):
+        """Return the cached value for `key`, or None on a miss"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, payload, _ = entry
+                if expires_at > now:
+                    self._memory.move_to_end(key)
+                    self._stats["hits"] += 1
+                    self._stats["memory_hits"] += 1
+                    return json.loads(payload)
+                if expires_at + self.stale_ttl_seconds <= now:
+                    self._drop_memory(key)
+                self._stats["expired"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT payload, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    payload, expires_at = row
+                    if expires_at > now:
+                        self._store_memory(key, payload, expires_at)
+                        self._stats["hits"] += 1
+                        self._stats["disk_hits"] += 1
+                        return json.loads(payload)
+                    if expires_at + self.stale_ttl_seconds <= now:
+                        self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                        self._db.commit()
+                    self._stats["expired"] += 1
+
+            self._stats["misses"] += 1
+            return None
+
+    def contains(self, key):
+        """Whether a fresh value exists for `key` (does not touch the counters or the LRU order)"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and entry[0] > now:
+                return True
+            if self._db is not None:
+                row = self._db.execute("SELECT expires_at FROM responses WHERE key = ?", (key,)).fetchone()
+                return row is not None and row[0] > now
+            return False
+
+    def get_stale(self, key):
+        """Return the value for `key` even if it expired (within the stale window), or None"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires_at, payload, _ = entry
+            elif self._db is not None:
+                row = self._db.execute(
+                    "SELECT expires_at, payload FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    return None
+                expires_at, payload = row
+            else:
+                return None
+            if expires_at + self.stale_ttl_seconds <= now:
+                return None
+            self._stats["stale_hits"] += 1
+            return json.loads(payload)
+
+    def set(self, key, value):
+        """Store `value` (any JSON-serializable object) under `key` in both tiers"""
+        payload = json.dumps(value, separators=(",", ":"))
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with self._lock:
+            self._store_memory(key, payload, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, payload, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, payload, now, expires_at)
+                )
+                self._prune_disk(now)
+                self._db.commit()
+            self._stats["writes"] += 1
+
+    def invalidate(self, key):
+        """Remove `key` from both tiers"""
+        with self._lock:
+            self._drop_memory(key)
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db.commit()
+
+    def clear(self):
+        """Empty both tiers (counters are kept)"""
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+
+    def stats(self):
+        """Return a snapshot of the hit/miss counters and tier sizes"""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["memory_entries"] = len(self._memory)
+            snapshot["memory_bytes"] = self._memory_bytes
+            if self._db is not None:
+                snapshot["disk_entries"] = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        lookups = snapshot["hits"] + snapshot["misses"]
+        snapshot["hit_rate"] = snapshot["hits"] / lookups if lookups else 0.0
+        return snapshot
+
+    # Internal helpers (caller holds the lock)
+    def _store_memory(self, key, payload, expires_at):
+        size = len(payload.encode("utf-8"))
+        if size > self.max_bytes:
+            # Too large for the memory tier; leave it to the disk tier
+            return
+        self._drop_memory(key)
+        self._memory[key] = (expires_at, payload, size)
+        self._memory_bytes += size
+        while self._memory_bytes > self.max_bytes:
+            oldest_key = next(iter(self._memory))
+            self._drop_memory(oldest_key)
+            self._stats["evictions"] += 1
+
+    def _drop_memory(self, key):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= entry[2]
+
+    def _prune_disk(self, now):
+        self._db.execute("DELETE FROM responses WHERE expires_at <= ?", (now - self.stale_ttl_seconds,))
+        count = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        overflow = count - self.max_disk_entries
+        if overflow > 0:
+            self._db.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY created_at LIMIT ?)",
+                (overflow,)
+            )
+            self._stats["evictions"] += overflow
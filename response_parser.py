@@ -0,0 +1,178 @@
+# response_parser.py - Fast, tolerant parsing of model JSON responses with partial-field salvage
+import json
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; the standard library parser is always available
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+def loads(text):
+    """Parse JSON text with the fastest available backend"""
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            # orjson is stricter than json (e.g. NaN, lone surrogates); let json decide
+            pass
+    return json.loads(text)
+
+
+def clean_json_text(text):
+    """Normalize common model mistakes in a JSON object.
+
+    Skips anything before the first brace and after the matching closing
+    brace (code fences, chatter), drops trailing commas and escapes raw
+    control characters inside strings. Returns (cleaned, complete) where
+    `complete` is False when the text ends before the object is closed.
+    """
+    start = text.find("{")
+    if start < 0:
+        return "", False
+
+    out = []
+    depth = 0
+    in_string = False
+    escape = False
+    for char in text[start:]:
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            elif char < " ":
+                out.append(f"\\u{ord(char):04x}")
+                continue
+            out.append(char)
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            while out and out[-1].isspace():
+                out.pop()
+            if out and out[-1] == ",":
+                out.pop()
+            depth -= 1
+            out.append(char)
+            if depth == 0:
+                return "".join(out), True
+            continue
+        out.append(char)
+    return "".join(out), False
+
+
+class StreamingFieldParser:
+    """Incrementally scan a streamed JSON object and report top-level fields as they close.
+
+    Feed raw text chunks with `feed`; it returns a list of (field, value) pairs
+    for every top-level member whose value became complete in that chunk.
+    Anything before the opening brace (e.g. a code fence) is ignored.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields = {}
+        self.complete = False
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._string_start = None
+        self._key = None
+        self._value_start = None
+
+    def feed(self, chunk):
+        self.buffer += chunk
+        completed = []
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            char = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1 and self._key is None and self._string_start is not None:
+                        self._key = json.loads(buffer[self._string_start:i + 1])
+                        self._string_start = None
+                continue
+
+            if self.complete:
+                break
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and self._key is None:
+                    self._string_start = i
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._close_value(buffer, i, completed)
+                    self.complete = True
+            elif char == ":" and self._depth == 1 and self._key is not None:
+                self._value_start = i + 1
+            elif char == "," and self._depth == 1:
+                self._close_value(buffer, i, completed)
+        self._pos = len(buffer)
+        return completed
+
+    def _close_value(self, buffer, end, completed):
+        if self._key is not None and self._value_start is not None:
+            try:
+                value = loads(buffer[self._value_start:end])
+            except json.JSONDecodeError:
+                value = None
+            else:
+                self.fields[self._key] = value
+                completed.append((self._key, value))
+        self._key = None
+        self._value_start = None
+
+
+def salvage_fields(text):
+    """Return every top-level field of `text` whose value is complete and valid"""
+    parser = StreamingFieldParser()
+    parser.feed(text)
+    return dict(parser.fields)
+
+
+def parse_response(text):
+    """Parse a model response into a JSON object, repairing it when needed.
+
+    Returns (result, recovery). `recovery` is None when the text was valid
+    JSON; otherwise it is {"method": "repaired" | "salvaged", "recovered_fields": [...]}
+    where "salvaged" means the response was cut short and only its complete
+    fields were kept. Raises json.JSONDecodeError when nothing is usable.
+    """
+    text = text or ""
+    try:
+        value = loads(text)
+    except json.JSONDecodeError:
+        value = None
+    if isinstance(value, dict):
+        return value, None
+
+    # Only malformed responses pay for the character-level pass below
+    cleaned, complete = clean_json_text(text)
+    if complete:
+        try:
+            value = loads(cleaned)
+        except json.JSONDecodeError:
+            value = None
+        if isinstance(value, dict):
+            return value, {"method": "repaired", "recovered_fields": list(value)}
+
+    fields = salvage_fields(cleaned)
+    if not fields:
+        raise json.JSONDecodeError("No complete fields could be recovered", text, 0)
+    return fields, {"method": "salvaged", "recovered_fields": list(fields)}
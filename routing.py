@@ -0,0 +1,182 @@
+# routing.py - Per-request token budget and model selection that learns from recorded usage
+import os
+import re
+import json
+import threading
+from collections import deque
+from llm_client import model_id
+from codegen import MAX_TOKENS
+from prompt_library import PROMPT_LIBRARY
+from metrics import percentile
+
+# Set ROUTING_ENABLED=false to send every request to MODEL_ID with the fixed budget
+routing_enabled = os.getenv("ROUTING_ENABLED", "true").lower() == "true"
+
+# Budget tiers; each tier can use its own (e.g. faster, cheaper) model and defaults to MODEL_ID
+TIERS = {
+    "small": {
+        "max_tokens": int(os.getenv("ROUTE_SMALL_MAX_TOKENS", "2500")),
+        "model": os.getenv("ROUTE_SMALL_MODEL") or model_id
+    },
+    "medium": {
+        "max_tokens": int(os.getenv("ROUTE_MEDIUM_MAX_TOKENS", "4000")),
+        "model": os.getenv("ROUTE_MEDIUM_MODEL") or model_id
+    },
+    "large": {
+        "max_tokens": int(os.getenv("ROUTE_LARGE_MAX_TOKENS", "8000")),
+        "model": os.getenv("ROUTE_LARGE_MODEL") or model_id
+    }
+}
+
+# Learned budgets are kept within these bounds
+MIN_TOKENS = int(os.getenv("ROUTE_MIN_TOKENS", "1000"))
+MAX_TOKENS_CAP = int(os.getenv("ROUTE_MAX_TOKENS_CAP", "8000"))
+
+# Expected output size of each prompt library category
+CATEGORY_TIERS = {
+    "Form Components": "medium",
+    "Navigation Components": "medium",
+    "Interactive Elements": "small",
+    "Data Display": "medium",
+    "Complete Layouts": "large"
+}
+
+# Frameworks that wrap the markup in more boilerplate get proportionally more room
+FRAMEWORK_FACTORS = {
+    "HTML/CSS/JS": 1.0,
+    "React": 1.15,
+    "Vue.js": 1.15,
+    "Angular": 1.3,
+    "Svelte": 1.1
+}
+
+# Words and phrases that hint at the size of a free-form prompt
+LARGE_HINTS = ("dashboard", "landing page", "admin", "complete", "full page", "website", "web app",
+               "e commerce", "ecommerce", "portfolio", "blog", "layout", "multi step", "multiple pages")
+SMALL_HINTS = ("button", "toggle", "switch", "rating", "badge", "spinner", "loader", "tooltip", "icon",
+               "avatar", "progress bar", "breadcrumb", "chip", "tag", "alert", "toast")
+
+
+def normalize_prompt(prompt):
+    return " ".join(re.findall(r"[a-z0-9]+", prompt.lower()))
+
+
+_LIBRARY_CATEGORIES = {
+    normalize_prompt(prompt): category
+    for category, prompts in PROMPT_LIBRARY.items()
+    for prompt in prompts
+}
+
+
+def classify_prompt(prompt):
+    """Return (category, tier) for a prompt.
+
+    Prompts from PROMPT_LIBRARY use their library category; anything else is
+    sized by keyword hints and length and gets a "custom:<tier>" category.
+    """
+    normalized = normalize_prompt(prompt)
+    category = _LIBRARY_CATEGORIES.get(normalized)
+    if category is not None:
+        return category, CATEGORY_TIERS.get(category, "medium")
+
+    padded = f" {normalized} "
+    word_count = len(normalized.split())
+    if word_count > 40 or any(f" {hint} " in padded for hint in LARGE_HINTS):
+        tier = "large"
+    elif word_count <= 15 and any(f" {hint} " in padded for hint in SMALL_HINTS):
+        tier = "small"
+    else:
+        tier = "medium"
+    return f"custom:{tier}", tier
+
+
+class Router:
+    """Choose the model and max_tokens for a generation and learn from the outcome.
+
+    Until enough completions have been seen for a (category, framework,
+    device), the budget comes from the tier table. After that it is the 95th
+    percentile of recent completion tokens plus headroom. Truncated
+    completions are recorded as larger than their budget, so a category that
+    keeps hitting the limit grows its budget quickly.
+    """
+
+    def __init__(self, window=50, min_samples=5, headroom=1.3, enabled=True):
+        self.window = window
+        self.min_samples = min_samples
+        self.headroom = headroom
+        self.enabled = enabled
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def route(self, prompt, framework, device):
+        """Return the route for a request: model, max_tokens, category and tier"""
+        if not self.enabled:
+            return {"model": model_id, "max_tokens": MAX_TOKENS,
+                    "category": None, "tier": None, "learned": False}
+
+        category, tier = classify_prompt(prompt)
+        budget = TIERS[tier]["max_tokens"] * FRAMEWORK_FACTORS.get(framework, 1.0)
+        learned = False
+        with self._lock:
+            # Fall back to the whole category while a framework/device pair has little data
+            for key in ((category, framework, device), (category,)):
+                samples = self._samples.get(key)
+                if samples is not None and len(samples) >= self.min_samples:
+                    budget = percentile(samples, 95) * self.headroom
+                    learned = True
+                    break
+
+        return {
+            "model": TIERS[tier]["model"],
+            "max_tokens": int(min(MAX_TOKENS_CAP, max(MIN_TOKENS, budget))),
+            "category": category,
+            "tier": tier,
+            "framework": framework,
+            "device": device,
+            "learned": learned
+        }
+
+    def observe(self, route, result):
+        """Learn from a fresh generation made with `route` and note the route in its metadata"""
+        metadata = result.get("metadata")
+        if metadata is None:
+            return
+        metadata["route"] = {key: route[key] for key in ("category", "tier", "model", "max_tokens")}
+        if not self.enabled:
+            return
+
+        usage = metadata.get("usage") or {}
+        tokens = usage.get("completion_tokens")
+        if not tokens:
+            # Streams without a usage chunk: estimate from the generated text
+            payload = {key: value for key, value in result.items() if key != "metadata"}
+            tokens = len(json.dumps(payload)) // 4
+        if metadata.get("finish_reason") == "length":
+            tokens = max(tokens, route["max_tokens"]) * 1.5
+
+        with self._lock:
+            for key in ((route["category"], route["framework"], route["device"]), (route["category"],)):
+                self._samples.setdefault(key, deque(maxlen=self.window)).append(tokens)
+
+    def stats(self):
+        """Per category sample counts and learned 95th percentiles"""
+        with self._lock:
+            return {
+                key[0]: {"samples": len(samples), "p95_completion_tokens": int(percentile(samples, 95))}
+                for key, samples in self._samples.items()
+                if len(key) == 1 and samples
+            }
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    """Return the process-wide router"""
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = Router(enabled=routing_enabled)
+    return _router
@@ -65,7 +65,7 @@ document.addEventListener('DOMContentLoaded', function() {
         generateBtn.disabled = true;
         
         try {
-            const response = await fetch('/generate', {
+            const response = await fetch('/api/generate/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -77,29 +77,22 @@ document.addEventListener('DOMContentLoaded', function() {
                 throw new Error('Failed to generate code');
             }
             
-            const data = await response.json();
-            
-            // The result might already be a JSON object or might be a string that needs parsing
-            let result;
-            if (typeof data.result === 'string') {
-                try {
-                    result = JSON.parse(data.result);
-                } catch (e) {
-                    console.error('Failed to parse result as JSON:', e);
-                    throw new Error('Invalid response format');
+            // Fill in each section as soon as its field arrives
+            let finished = false;
+            await readEventStream(response, (event, data) => {
+                if (event === 'field') {
+                    showField(data.field, data.value);
+                } else if (event === 'done') {
+                    finished = true;
+                    displayResults(toDisplayResult(data.result));
+                } else if (event === 'error') {
+                    throw new Error(data.message);
                 }
-            } else {
-                result = data.result;
-            }
+            });
             
-            // Check if all required properties exist
-            if (!result.interactive_code || !result.html_code || !result.css_code || !result.js_code) {
-                console.error('Response missing required properties:', result);
+            if (!finished) {
                 throw new Error('Incomplete response from AI');
             }
-            
-            // Update UI with generated code
-            displayResults(result);
         } catch (error) {
             console.error('Error:', error);
             alert('An error occurred while generating code. Please try again.');
@@ -109,6 +102,68 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     });
 
+    // Read a server-sent event stream from a fetch response
+    async function readEventStream(response, onEvent) {
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            
+            buffer += decoder.decode(value, { stream: true });
+            
+            // Events are separated by a blank line
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                
+                let event = 'message';
+                let data = '';
+                rawEvent.split('\n').forEach(line => {
+                    if (line.startsWith('event: ')) {
+                        event = line.slice(7);
+                    } else if (line.startsWith('data: ')) {
+                        data += line.slice(6);
+                    }
+                });
+                
+                onEvent(event, data ? JSON.parse(data) : null);
+            }
+        }
+    }
+
+    // Map the generation fields onto the shape displayResults expects
+    function toDisplayResult(result) {
+        const separateCode = result.separate_code || {};
+        return {
+            interactive_code: result.interactive_code,
+            html_code: separateCode.html || '',
+            css_code: result.css_code || separateCode.css || '',
+            js_code: separateCode.js || '',
+            explanation: result.explanation
+        };
+    }
+
+    // Render a single streamed field
+    function showField(field, value) {
+        loadingSection.style.display = 'none';
+        resultsSection.style.display = 'block';
+        
+        if (field === 'explanation') {
+            explanationContent.innerHTML = value || '';
+        } else if (field === 'css_code') {
+            cssCode.textContent = value || '';
+        } else if (field === 'separate_code' && value) {
+            htmlCode.textContent = value.html || '';
+            jsCode.textContent = value.js || '';
+        } else if (field === 'interactive_code' && value) {
+            renderPreview(value);
+        }
+    }
+
     // Function to display results
     function displayResults(result) {
         console.log("Displaying results:", result);
@@ -123,36 +178,7 @@ document.addEventListener('DOMContentLoaded', function() {
         
         // Set the UI preview
         if (result.interactive_code) {
-            // Create a container for the preview
-            const previewContainer = document.createElement('div');
-            previewContainer.classList.add('preview-wrapper');
-            
-            try {
-                // Set the interactive code
-                previewContainer.innerHTML = result.interactive_code;
-                uiPreview.innerHTML = '';
-                uiPreview.appendChild(previewContainer);
-                
-                // Execute any JavaScript in the preview
-                const scriptTags = previewContainer.querySelectorAll('script');
-                scriptTags.forEach(scriptTag => {
-                    const newScript = document.createElement('script');
-                    
-                    // Copy all attributes
-                    Array.from(scriptTag.attributes).forEach(attr => {
-                        newScript.setAttribute(attr.name, attr.value);
-                    });
-                    
-                    // Set the script content
-                    newScript.textContent = scriptTag.textContent;
-                    
-                    // Replace the old script tag with the new one
-                    scriptTag.parentNode.replaceChild(newScript, scriptTag);
-                });
-            } catch (error) {
-                console.error('Error rendering preview:', error);
-                uiPreview.innerHTML = '<div class="error-message">Error rendering preview. Check the console for details.</div>';
-            }
+            renderPreview(result.interactive_code);
         }
         
         // Apply syntax highlighting
@@ -161,6 +187,40 @@ document.addEventListener('DOMContentLoaded', function() {
         // Show results section
         resultsSection.style.display = 'block';
     }
+
+    // Function to render the interactive code into the preview
+    function renderPreview(interactiveCode) {
+        // Create a container for the preview
+        const previewContainer = document.createElement('div');
+        previewContainer.classList.add('preview-wrapper');
+        
+        try {
+            // Set the interactive code
+            previewContainer.innerHTML = interactiveCode;
+            uiPreview.innerHTML = '';
+            uiPreview.appendChild(previewContainer);
+            
+            // Execute any JavaScript in the preview
+            const scriptTags = previewContainer.querySelectorAll('script');
+            scriptTags.forEach(scriptTag => {
+                const newScript = document.createElement('script');
+                
+                // Copy all attributes
+                Array.from(scriptTag.attributes).forEach(attr => {
+                    newScript.setAttribute(attr.name, attr.value);
+                });
+                
+                // Set the script content
+                newScript.textContent = scriptTag.textContent;
+                
+                // Replace the old script tag with the new one
+                scriptTag.parentNode.replaceChild(newScript, scriptTag);
+            });
+        } catch (error) {
+            console.error('Error rendering preview:', error);
+            uiPreview.innerHTML = '<div class="error-message">Error rendering preview. Check the console for details.</div>';
+        }
+    }
     
     // Add error handling for the preview iframe if needed
     window.addEventListener('error', function(e) {
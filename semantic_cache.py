@@ -0,0 +1,150 @@
+# semantic_cache.py - Near-duplicate prompt lookup over locally embedded prompts
+import re
+import time
+import hashlib
+import threading
+
+# numpy is optional and only imported once the semantic cache is used, so it costs nothing when disabled
+np = None
+
+# Words that carry no meaning about the requested UI
+STOP_WORDS = {
+    "a", "an", "the", "and", "or", "with", "for", "of", "to", "in", "on", "that",
+    "create", "make", "build", "generate", "design", "please", "me", "i", "want", "some",
+    "having", "w", "using", "can", "you"
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def _load_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:  # without numpy the semantic cache stays disabled
+            return None
+        np = numpy
+    return np
+
+
+def is_available():
+    return _load_numpy() is not None
+
+
+def embed_prompt(prompt, dim=2048):
+    """Embed a prompt as an L2-normalized hashed bag of words and word bigrams.
+
+    Feature hashing keeps every vector in the same space without fitting a
+    vocabulary, so the index never has to be rebuilt as prompts are added.
+    """
+    words = [word for word in TOKEN_PATTERN.findall(prompt.lower()) if word not in STOP_WORDS]
+    # Fold simple plurals so "fields" matches "field"
+    words = [word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
+             for word in words]
+    features = words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+    vector = np.zeros(dim, dtype=np.float32)
+    for feature in features:
+        digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+        value = int.from_bytes(digest, "little")
+        sign = 1.0 if value & 1 else -1.0
+        # Bigrams count a little less than single words
+        weight = 0.5 if " " in feature else 1.0
+        vector[(value >> 1) % dim] += sign * weight
+
+    norm = np.linalg.norm(vector)
+    if norm > 0:
+        vector /= norm
+    return vector
+
+
+class SemanticCache:
+    """Map prompts to exact response-cache keys by cosine similarity.
+
+    One index (a NumPy matrix of prompt vectors) is kept per (framework,
+    device, model) so a match never crosses into a different target. Each
+    index holds at most `max_entries` prompts; the least recently matched
+    prompt is evicted first.
+    """
+
+    def __init__(self, threshold=0.85, max_entries=500, dim=2048):
+        if _load_numpy() is None:
+            raise RuntimeError("The semantic cache requires numpy")
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._indexes = {}
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def lookup(self, prompt, framework, device, model_id):
+        """Return (cache_key, similarity, matched_prompt) for the closest stored prompt, or None"""
+        query = embed_prompt(prompt, self.dim)
+        with self._lock:
+            index = self._indexes.get((framework, device, model_id))
+            if index is None or not index["keys"]:
+                self._stats["misses"] += 1
+                return None
+
+            similarities = index["matrix"][:len(index["keys"])] @ query
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self._stats["misses"] += 1
+                return None
+
+            index["last_used"][best] = time.monotonic()
+            self._stats["hits"] += 1
+            return index["keys"][best], similarity, index["prompts"][best]
+
+    def add(self, prompt, framework, device, model_id, cache_key):
+        """Index `prompt` as pointing at `cache_key`"""
+        vector = embed_prompt(prompt, self.dim)
+        with self._lock:
+            index = self._indexes.setdefault((framework, device, model_id), {
+                "matrix": np.zeros((min(16, self.max_entries), self.dim), dtype=np.float32),
+                "keys": [],
+                "prompts": [],
+                "last_used": []
+            })
+            if cache_key in index["keys"]:
+                slot = index["keys"].index(cache_key)
+            elif len(index["keys"]) < self.max_entries:
+                slot = len(index["keys"])
+                if slot == len(index["matrix"]):
+                    # Grow the matrix geometrically up to max_entries rows
+                    grown = np.zeros((min(slot * 2, self.max_entries), self.dim), dtype=np.float32)
+                    grown[:slot] = index["matrix"]
+                    index["matrix"] = grown
+                index["keys"].append(cache_key)
+                index["prompts"].append(prompt)
+                index["last_used"].append(0.0)
+            else:
+                slot = min(range(len(index["last_used"])), key=index["last_used"].__getitem__)
+                index["keys"][slot] = cache_key
+                index["prompts"][slot] = prompt
+                self._stats["evictions"] += 1
+
+            index["matrix"][slot] = vector
+            index["last_used"][slot] = time.monotonic()
+
+    def discard(self, framework, device, model_id, cache_key):
+        """Forget a cache key whose payload is gone from the response cache"""
+        with self._lock:
+            index = self._indexes.get((framework, device, model_id))
+            if index is None or cache_key not in index["keys"]:
+                return
+            slot = index["keys"].index(cache_key)
+            last = len(index["keys"]) - 1
+            # Move the last row into the freed slot to keep the matrix dense
+            index["matrix"][slot] = index["matrix"][last]
+            for field in ("keys", "prompts", "last_used"):
+                index[field][slot] = index[field][last]
+                index[field].pop()
+
+    def stats(self):
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot["entries"] = sum(len(index["keys"]) for index in self._indexes.values())
+        return snapshot
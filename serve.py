@@ -0,0 +1,233 @@
+# serve.py - Production entry point: run a Flask app on several worker processes with shared state
+import os
+import sys
+import time
+import signal
+import socket
+import argparse
+import importlib
+import threading
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # gunicorn is optional; the built-in pre-fork server needs only the standard library
+    BaseApplication = None
+
+DEFAULT_SHARED_STATE_PATH = ".codepilot_shared.sqlite3"
+
+
+def load_app(spec):
+    """Import "module:attribute" and return the WSGI app"""
+    module_name, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attribute or "app")
+
+
+def drain_worker(timeout):
+    # Imported in the worker, after the app, so it is the app's lifecycle
+    from serving import lifecycle
+    return lifecycle.drain(timeout)
+
+
+def drain_before_exit(worker, drain_timeout):
+    """gunicorn post_worker_init hook: on SIGTERM keep serving while the app drains, then stop the worker"""
+    stop = worker.handle_exit
+
+    def handle_exit(signum, frame):
+        # Readiness answers 503 and running jobs/streams finish while the worker still serves requests
+        def drain_then_stop():
+            drain_worker(drain_timeout)
+            stop(signum, frame)
+        threading.Thread(target=drain_then_stop, daemon=True).start()
+
+    # init_signals already registered the bound method, so the signal has to be re-pointed too
+    worker.handle_exit = handle_exit
+    signal.signal(signal.SIGTERM, handle_exit)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+class WorkerServer(ThreadingMixIn, WSGIServer):
+    """Threaded WSGI server on a listening socket inherited from the parent process"""
+
+    daemon_threads = True
+
+    def __init__(self, sock, app):
+        super().__init__(sock.getsockname()[:2], QuietRequestHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        host, port = sock.getsockname()[:2]
+        self.server_name = socket.getfqdn(host)
+        self.server_port = port
+        self.setup_environ()
+        self.set_app(app)
+        self.active_requests = 0
+        self._active_lock = threading.Lock()
+
+    def process_request_thread(self, request, client_address):
+        with self._active_lock:
+            self.active_requests += 1
+        try:
+            super().process_request_thread(request, client_address)
+        finally:
+            with self._active_lock:
+                self.active_requests -= 1
+
+    def wait_idle(self, timeout):
+        deadline = time.time() + timeout
+        while self.active_requests and time.time() < deadline:
+            time.sleep(0.1)
+        return not self.active_requests
+
+
+def run_builtin_worker(sock, app_spec, drain_timeout):
+    """Body of one forked worker: serve until SIGTERM/SIGINT, then drain and exit"""
+    server = WorkerServer(sock, load_app(app_spec))
+
+    def handle_stop(signum, frame):
+        # shutdown() waits for serve_forever to return, so it cannot run in the signal handler's thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+    server.serve_forever(poll_interval=0.5)
+
+    # No new connections from here on; other workers keep accepting them
+    deadline = time.time() + drain_timeout
+    drain_worker(drain_timeout)
+    if not server.wait_idle(max(0.0, deadline - time.time())):
+        print(f"Worker {os.getpid()} exiting with {server.active_requests} requests still open")
+
+
+def serve_builtin(app_spec, host, port, workers, drain_timeout):
+    """Pre-fork server: the parent owns the socket and restarts workers that die"""
+    if not hasattr(os, "fork"):
+        raise SystemExit("The built-in server needs os.fork; install gunicorn or run the app directly")
+
+    sock = socket.create_server((host, port), backlog=2048)
+    children = set()
+    stopping = threading.Event()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                run_builtin_worker(sock, app_spec, drain_timeout)
+            except BaseException as e:
+                print(f"Worker {os.getpid()} failed: {str(e)}")
+                code = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(code)
+        children.add(pid)
+
+    def handle_stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    for _ in range(workers):
+        spawn()
+    print(f"Serving {app_spec} on http://{host}:{sock.getsockname()[1]} with {workers} workers (built-in server)")
+
+    while not stopping.is_set():
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            pid = 0
+        if pid and pid in children:
+            children.discard(pid)
+            print(f"Worker {pid} exited; starting a replacement")
+            # Avoid a tight restart loop when workers crash on startup
+            stopping.wait(1.0)
+            if not stopping.is_set():
+                spawn()
+        stopping.wait(0.2)
+
+    print(f"Stopping: draining {len(children)} workers for up to {drain_timeout:.0f}s")
+    for pid in list(children):
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            children.discard(pid)
+    deadline = time.time() + drain_timeout + 10
+    while children and time.time() < deadline:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            children.discard(pid)
+        else:
+            time.sleep(0.1)
+    for pid in children:
+        print(f"Worker {pid} did not stop in time; killing it")
+        os.kill(pid, signal.SIGKILL)
+    sock.close()
+
+
+def serve_gunicorn(app_spec, host, port, workers, threads, drain_timeout):
+    class StandaloneApplication(BaseApplication):
+        def load_config(self):
+            settings = {
+                "bind": f"{host}:{port}",
+                "workers": workers,
+                "worker_class": "gthread",
+                "threads": threads,
+                # Long enough for SSE generation streams
+                "timeout": 300,
+                "graceful_timeout": int(drain_timeout) + 10,
+                "post_worker_init": lambda worker: drain_before_exit(worker, drain_timeout),
+                # Already drained on SIGTERM; this covers exits that skipped it (returns at once if drained)
+                "worker_exit": lambda server, worker: drain_worker(drain_timeout)
+            }
+            for key, value in settings.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # Imported in each worker (no preload), so every worker starts its own job threads
+            return load_app(app_spec)
+
+    print(f"Serving {app_spec} on http://{host}:{port} with {workers} workers (gunicorn)")
+    StandaloneApplication().run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a CodePilot Flask app on several worker processes")
+    parser.add_argument("app", nargs="?", default="minimal_app:app", help="WSGI app as module:attribute")
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_WORKERS", str(os.cpu_count() or 1))))
+    parser.add_argument("--threads", type=int, default=int(os.getenv("WEB_THREADS", "8")),
+                        help="Request threads per worker (gunicorn)")
+    parser.add_argument("--drain-timeout", type=float, default=float(os.getenv("DRAIN_TIMEOUT_SECONDS", "60")))
+    parser.add_argument("--server", choices=["auto", "gunicorn", "builtin"], default="auto")
+    parser.add_argument("--shared-state", default=os.getenv("SHARED_STATE_PATH") or DEFAULT_SHARED_STATE_PATH,
+                        help="SQLite file for job status, rate limits and metrics shared by the workers")
+    args = parser.parse_args()
+
+    # Set before any app module is imported, so every worker reads the same settings
+    os.environ["SHARED_STATE_PATH"] = args.shared_state
+    os.environ["DRAIN_TIMEOUT_SECONDS"] = str(args.drain_timeout)
+    import shared_state
+    shared_state.reset(args.shared_state)
+
+    server = args.server
+    if server == "auto":
+        server = "gunicorn" if BaseApplication is not None else "builtin"
+    if server == "gunicorn":
+        if BaseApplication is None:
+            raise SystemExit("gunicorn is not installed; use --server builtin")
+        serve_gunicorn(args.app, args.host, args.port, args.workers, args.threads, args.drain_timeout)
+    else:
+        serve_builtin(args.app, args.host, args.port, args.workers, args.drain_timeout)
+
+
+if __name__ == "__main__":
+    main()
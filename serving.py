@@ -0,0 +1,72 @@
+# serving.py - Readiness and graceful drain state of one worker process
+import os
+import time
+import threading
+
+# How long a stopping worker waits for queued and running generations
+drain_timeout_seconds = float(os.getenv("DRAIN_TIMEOUT_SECONDS", "60"))
+
+
+class Lifecycle:
+    """Readiness checks and drain callbacks registered by the app.
+
+    `readiness()` fails while the worker drains or when a check raises.
+    `drain()` runs the callbacks once (e.g. JobQueue.drain) within a
+    shared deadline; serve.py calls it when a worker is told to stop.
+    """
+
+    def __init__(self):
+        self.draining = False
+        self.started_at = time.time()
+        self._checks = {}
+        self._drain_callbacks = []
+        self._lock = threading.Lock()
+        self._drained = threading.Event()
+
+    def add_check(self, name, check):
+        """`check()` returns details for the readiness response, or raises when not ready"""
+        self._checks[name] = check
+
+    def on_drain(self, callback):
+        """`callback(timeout)` is called on shutdown and should return once its work is finished"""
+        self._drain_callbacks.append(callback)
+
+    def readiness(self):
+        """Return (ready, details)"""
+        ready = not self.draining
+        checks = {}
+        for name, check in self._checks.items():
+            try:
+                checks[name] = check()
+            except Exception as e:
+                checks[name] = f"failed: {str(e)}"
+                ready = False
+        return ready, {
+            "ready": ready,
+            "draining": self.draining,
+            "worker_pid": os.getpid(),
+            "uptime_s": round(time.time() - self.started_at, 1),
+            "checks": checks
+        }
+
+    def drain(self, timeout=None):
+        """Stop taking work and wait for in-flight work; returns True if everything finished in time"""
+        timeout = drain_timeout_seconds if timeout is None else timeout
+        with self._lock:
+            if self.draining:
+                return self._drained.wait(timeout)
+            self.draining = True
+        deadline = time.time() + timeout
+        finished = True
+        for callback in self._drain_callbacks:
+            try:
+                finished = callback(max(0.0, deadline - time.time())) is not False and finished
+            except Exception as e:
+                print(f"Drain callback failed: {str(e)}")
+                finished = False
+        self._drained.set()
+        print(f"Worker {os.getpid()} drained ({'complete' if finished else 'timed out'})")
+        return finished
+
+
+lifecycle = Lifecycle()
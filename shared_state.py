@@ -0,0 +1,251 @@
+# shared_state.py - SQLite-backed state shared by the worker processes of one server
+import os
+import json
+import time
+import sqlite3
+import threading
+import metrics
+
+# One SQLite file shared by every worker on the box (empty = each process keeps its own state in memory).
+# serve.py sets it when it starts more than one worker.
+shared_state_path = os.getenv("SHARED_STATE_PATH", "")
+
+# How often each worker copies its metrics into the shared file
+metrics_publish_seconds = float(os.getenv("METRICS_PUBLISH_SECONDS", "5"))
+
+SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS buckets ("
+    "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS jobs ("
+    "id TEXT PRIMARY KEY, payload TEXT NOT NULL, status TEXT NOT NULL, created_at REAL NOT NULL, "
+    "started_at REAL, finished_at REAL, result TEXT, error TEXT)",
+    "CREATE TABLE IF NOT EXISTS job_events ("
+    "job_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL, data TEXT NOT NULL, "
+    "PRIMARY KEY (job_id, seq))",
+    "CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at)",
+    "CREATE TABLE IF NOT EXISTS metric_snapshots ("
+    "worker TEXT PRIMARY KEY, snapshot TEXT NOT NULL, updated REAL NOT NULL)"
+]
+
+
+class SharedState:
+    """One connection per process to the shared SQLite file, in WAL mode so readers never block writers"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.Lock()
+        with self._lock:
+            for statement in SCHEMA:
+                self._db.execute(statement)
+
+    def execute(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def transaction(self, work):
+        """Run `work(db)` in a write transaction (BEGIN IMMEDIATE serializes it across processes)"""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                value = work(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return value
+
+    def ping(self):
+        self.execute("SELECT 1")
+
+
+class SharedTokenBucket:
+    """TokenBucket (see upstream_guard) whose level lives in the shared file.
+
+    Every worker reserves from the same row, so the configured per-minute
+    quota holds for the whole server rather than per process.
+    """
+
+    def __init__(self, state, name, rate_per_minute, capacity=None):
+        self.state = state
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        if self.rate > 0:
+            state.execute("INSERT OR IGNORE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                          (name, self.capacity, time.time()))
+
+    def reserve(self, amount, max_wait=None):
+        """Reserve `amount` and return the wait in seconds, or None (nothing reserved) if it exceeds `max_wait`"""
+        if self.rate <= 0:
+            return 0.0
+
+        def work(db):
+            tokens = self._refilled(db)
+            needed = min(amount, self.capacity)
+            wait = max(0.0, (needed - tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            db.execute("UPDATE buckets SET tokens = ?, updated = ? WHERE name = ?",
+                       (tokens - needed, time.time(), self.name))
+            return wait
+
+        return self.state.transaction(work)
+
+    def refund(self, amount):
+        if self.rate <= 0 or amount <= 0:
+            return
+
+        def work(db):
+            tokens = min(self.capacity, self._refilled(db) + amount)
+            db.execute("UPDATE buckets SET tokens = ?, updated = ? WHERE name = ?", (tokens, time.time(), self.name))
+
+        self.state.transaction(work)
+
+    def _refilled(self, db):
+        tokens, updated = db.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (self.name,)).fetchone()
+        return min(self.capacity, tokens + max(0.0, time.time() - updated) * self.rate)
+
+
+class SharedJobStore:
+    """Job status, results and events, so any worker can answer for a job another worker runs"""
+
+    def __init__(self, state):
+        self.state = state
+
+    def save(self, job):
+        self.state.execute(
+            "INSERT OR REPLACE INTO jobs (id, payload, status, created_at, started_at, finished_at, result, error) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (job.id, json.dumps(job.payload), job.status, job.created_at, job.started_at, job.finished_at,
+             json.dumps(job.result) if job.result is not None else None, job.error)
+        )
+
+    def add_event(self, job_id, seq, event, data):
+        self.state.execute("INSERT OR REPLACE INTO job_events (job_id, seq, event, data) VALUES (?, ?, ?, ?)",
+                           (job_id, seq, event, json.dumps(data)))
+
+    def load(self, job_id):
+        rows = self.state.execute(
+            "SELECT id, payload, status, created_at, started_at, finished_at, result, error FROM jobs WHERE id = ?",
+            (job_id,)
+        )
+        if not rows:
+            return None
+        job_id, payload, status, created_at, started_at, finished_at, result, error = rows[0]
+        return {
+            "id": job_id,
+            "payload": json.loads(payload),
+            "status": status,
+            "created_at": created_at,
+            "started_at": started_at,
+            "finished_at": finished_at,
+            "result": json.loads(result) if result is not None else None,
+            "error": error
+        }
+
+    def events_after(self, job_id, seq):
+        rows = self.state.execute(
+            "SELECT seq, event, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, seq)
+        )
+        return [(row_seq, event, json.loads(data)) for row_seq, event, data in rows]
+
+    def prune(self, cutoff):
+        def work(db):
+            expired = [row[0] for row in db.execute("SELECT id FROM jobs WHERE finished_at < ?", (cutoff,))]
+            db.executemany("DELETE FROM job_events WHERE job_id = ?", [(job_id,) for job_id in expired])
+            db.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in expired])
+
+        self.state.transaction(work)
+
+
+class SharedMetrics:
+    """Each worker publishes a snapshot of its metrics; a scrape on any worker sums them all.
+
+    Snapshots of workers that exited are kept, so counters never go backwards
+    when a worker is replaced.
+    """
+
+    def __init__(self, state):
+        self.state = state
+        self.worker = f"{os.getpid()}-{int(time.time() * 1000)}"
+        self._thread = None
+
+    def publish(self):
+        self.state.execute("INSERT OR REPLACE INTO metric_snapshots (worker, snapshot, updated) VALUES (?, ?, ?)",
+                           (self.worker, json.dumps(metrics.snapshot()), time.time()))
+
+    def collect(self):
+        return [json.loads(row[0]) for row in self.state.execute("SELECT snapshot FROM metric_snapshots")]
+
+    def render(self):
+        """Prometheus text for the whole server, including this worker's latest values"""
+        self.publish()
+        return metrics.render_prometheus(self.collect())
+
+    def start(self, interval_seconds):
+        if self._thread is None and interval_seconds > 0:
+            self._thread = threading.Thread(target=self._run, args=(interval_seconds,),
+                                            name="metrics-publisher", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self, interval_seconds):
+        while True:
+            time.sleep(interval_seconds)
+            try:
+                self.publish()
+            except sqlite3.Error as e:
+                print(f"Publishing metrics failed: {str(e)}")
+
+
+_state = None
+_shared_metrics = None
+_state_lock = threading.Lock()
+
+
+def get_state():
+    """Return this process's connection to the shared file, or None when SHARED_STATE_PATH is not set"""
+    global _state
+    if not shared_state_path:
+        return None
+    if _state is None:
+        with _state_lock:
+            if _state is None:
+                _state = SharedState(shared_state_path)
+    return _state
+
+
+def get_job_store():
+    state = get_state()
+    return SharedJobStore(state) if state is not None else None
+
+
+def get_shared_metrics():
+    """Start publishing this worker's metrics (once) and return the aggregator, or None"""
+    global _shared_metrics
+    state = get_state()
+    if state is None:
+        return None
+    with _state_lock:
+        if _shared_metrics is None:
+            _shared_metrics = SharedMetrics(state).start(metrics_publish_seconds)
+    return _shared_metrics
+
+
+def render_metrics():
+    """Prometheus text for this server: all workers when state is shared, else this process"""
+    shared = get_shared_metrics()
+    return shared.render() if shared is not None else metrics.render_prometheus()
+
+
+def reset(path):
+    """Clear per-run state (metrics snapshots, jobs) before a server starts its workers"""
+    state = SharedState(path)
+    state.execute("DELETE FROM metric_snapshots")
+    state.execute("DELETE FROM job_events")
+    state.execute("DELETE FROM jobs")
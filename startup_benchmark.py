@@ -0,0 +1,147 @@
+# startup_benchmark.py - Cold start and rerun timings for the Streamlit and Flask entry points
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+FLASK_APPS = ["minimal_app", "troubleshoot_app"]
+
+# Keep the measurement local: no artifact server port, no files, no background generation
+BENCH_ENV = {
+    "OPENAI_API_KEY": "bench-key",
+    "OPENAI_BASE_URL": "http://127.0.0.1:9/v1",
+    "MODEL_ID": "bench-model",
+    "ARTIFACT_SERVER_ENABLED": "false",
+    "HISTORY_BACKEND": "memory",
+    "CACHE_DB_PATH": "",
+    "WARMUP_ENABLED": "false"
+}
+
+# Runs in a fresh interpreter: import a Flask entry point and serve its first page
+FLASK_SNIPPET = """
+import json, time
+started = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+response = {module}.app.test_client().get("/")
+served = time.perf_counter()
+print(json.dumps({{"import_s": imported - started, "first_response_s": served - started, "status": response.status_code}}))
+"""
+
+# Runs in a fresh interpreter: first script run of the Streamlit app, then reruns
+STREAMLIT_SNIPPET = """
+import json, time
+started = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file("app.py", default_timeout=60)
+app.run()
+first_run = time.perf_counter() - started
+# Let the background client preload finish so reruns are measured in steady state
+import llm_client
+llm_client.get_client()
+client_ready = time.perf_counter() - started
+reruns = []
+for i in range({reruns}):
+    rerun_started = time.perf_counter()
+    if i % 2:
+        # Widget interaction, like toggling a sidebar checkbox
+        app.checkbox(key="bypass_cache").set_value(i % 4 == 1).run()
+    else:
+        app.run()
+    reruns.append(time.perf_counter() - rerun_started)
+print(json.dumps({{"first_run_s": first_run, "client_ready_s": client_ready, "reruns_s": reruns, "exceptions": [str(e.value) for e in app.exception]}}))
+"""
+
+
+def run_snippet(snippet):
+    """Run `snippet` in a new interpreter and return (parsed output, process wall time)"""
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", snippet],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=dict(os.environ, **BENCH_ENV),
+        capture_output=True,
+        text=True,
+        timeout=300
+    )
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1] if completed.stderr else "snippet failed")
+    # The apps print their configuration; the measurement is the last line
+    return json.loads(completed.stdout.strip().splitlines()[-1]), wall
+
+
+def bench_flask(module, runs):
+    imports, first_responses, walls = [], [], []
+    for _ in range(runs):
+        result, wall = run_snippet(FLASK_SNIPPET.format(module=module))
+        imports.append(result["import_s"])
+        first_responses.append(result["first_response_s"])
+        walls.append(wall)
+    return {
+        "target": module,
+        "runs": runs,
+        "import_s": round(statistics.median(imports), 3),
+        "first_response_s": round(statistics.median(first_responses), 3),
+        "process_wall_s": round(statistics.median(walls), 3)
+    }
+
+
+def bench_streamlit(runs, reruns):
+    first_runs, ready_times, rerun_times, walls, exceptions = [], [], [], [], []
+    for _ in range(runs):
+        result, wall = run_snippet(STREAMLIT_SNIPPET.format(reruns=reruns))
+        first_runs.append(result["first_run_s"])
+        ready_times.append(result["client_ready_s"])
+        rerun_times.extend(result["reruns_s"])
+        walls.append(wall)
+        exceptions.extend(result["exceptions"])
+    return {
+        "target": "streamlit_app",
+        "runs": runs,
+        "first_run_s": round(statistics.median(first_runs), 3),
+        "client_ready_s": round(statistics.median(ready_times), 3),
+        "rerun_p50_s": round(statistics.median(rerun_times), 4) if rerun_times else None,
+        "rerun_max_s": round(max(rerun_times), 4) if rerun_times else None,
+        "process_wall_s": round(statistics.median(walls), 3),
+        "exceptions": sorted(set(exceptions))
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold start and rerun latency of the app entry points")
+    parser.add_argument("--targets", nargs="*", choices=FLASK_APPS + ["streamlit"], default=FLASK_APPS + ["streamlit"])
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per target")
+    parser.add_argument("--reruns", type=int, default=20, help="Streamlit reruns per process")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = []
+    for target in args.targets:
+        if target == "streamlit":
+            try:
+                import streamlit  # noqa: F401
+            except ImportError:
+                print("streamlit is not installed; skipping the Streamlit app")
+                continue
+            stats = bench_streamlit(args.runs, args.reruns)
+            print(f"{'streamlit_app':18} first_run={stats['first_run_s']}s client_ready={stats['client_ready_s']}s rerun_p50={stats['rerun_p50_s']}s "
+                  f"rerun_max={stats['rerun_max_s']}s process={stats['process_wall_s']}s")
+            if stats["exceptions"]:
+                print(f"  script exceptions: {stats['exceptions']}")
+        else:
+            stats = bench_flask(target, args.runs)
+            print(f"{target:18} import={stats['import_s']}s first_response={stats['first_response_s']}s "
+                  f"process={stats['process_wall_s']}s")
+        results.append(stats)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# test_admission.py - Priority ordering, class deadlines, latency shedding and endpoint classes
+import time
+import threading
+import pytest
+import admission
+from admission import AdmissionController, AdmissionRejected, priority_for
+
+LIMITS = {"interactive": 4, "batch": 4, "diagnostics": 4}
+DEADLINES = {"interactive": 5.0, "batch": 5.0, "diagnostics": 5.0}
+
+
+def controller(max_concurrency=1, limits=None, deadlines=None, latency_target=0.0):
+    return AdmissionController(max_concurrency, limits or LIMITS, deadlines or DEADLINES, latency_target)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def queue_waiter(gate, priority, order):
+    """Start a thread that takes a slot, notes its priority and gives the slot back"""
+    def run():
+        gate.acquire(priority)
+        order.append(priority)
+        gate.release(priority)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_higher_class_goes_first_and_fifo_within_a_class():
+    gate = controller()
+    gate.acquire("batch")
+    order = []
+    threads = []
+    for priority in ("diagnostics", "batch", "interactive", "interactive"):
+        threads.append(queue_waiter(gate, priority, order))
+        wait_for(lambda count=len(threads): sum(gate.stats()["waiting"].values()) == count)
+    gate.release("batch")
+    for thread in threads:
+        thread.join(5)
+    assert order == ["interactive", "interactive", "batch", "diagnostics"]
+
+
+def test_class_limit_leaves_room_for_other_classes():
+    gate = controller(max_concurrency=3, limits=dict(LIMITS, batch=1))
+    gate.acquire("batch")
+    order = []
+    blocked = queue_waiter(gate, "batch", order)
+    wait_for(lambda: gate.stats()["waiting"]["batch"] == 1)
+    gate.acquire("interactive")
+    assert gate.stats()["active"] == {"interactive": 1, "batch": 1, "diagnostics": 0}
+    gate.release("batch")
+    blocked.join(5)
+    assert order == ["batch"]
+
+
+def test_waiting_past_the_class_deadline_is_rejected():
+    gate = controller(deadlines=dict(DEADLINES, diagnostics=0.05))
+    gate.acquire("interactive")
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected):
+        gate.acquire("diagnostics")
+    assert time.monotonic() - started < 1.0
+    assert gate.stats()["waiting"]["diagnostics"] == 0
+
+
+def test_slow_upstream_sheds_low_priority_but_never_interactive():
+    gate = controller(max_concurrency=10, latency_target=1.0)
+    for _ in range(5):
+        gate.acquire("interactive")
+        gate.release("interactive", latency=1.5)
+    with pytest.raises(AdmissionRejected):
+        gate.acquire("diagnostics")
+    # Batch is only shed above twice the target
+    gate.acquire("batch")
+    gate.release("batch", latency=3.0)
+    for _ in range(5):
+        gate.acquire("interactive")
+        gate.release("interactive", latency=3.0)
+    with pytest.raises(AdmissionRejected):
+        gate.acquire("batch")
+    gate.acquire("interactive")
+
+
+def test_release_function_is_idempotent(monkeypatch):
+    gate = controller(max_concurrency=2)
+    monkeypatch.setattr(admission, "controller", gate)
+    release = admission.acquire("generate")
+    release()
+    release(0.5)
+    assert gate.stats()["active"]["interactive"] == 0
+
+
+@pytest.mark.parametrize("endpoint, priority", [
+    ("generate", "interactive"), ("ask_claude", "interactive"), ("batch", "batch"),
+    ("speculative", "batch"), ("api_test", "diagnostics"), ("something_new", "batch")
+])
+def test_endpoint_classes(endpoint, priority):
+    assert priority_for(endpoint) == priority
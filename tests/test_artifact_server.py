@@ -0,0 +1,37 @@
+# test_artifact_server.py - Artifact pruning and the check for an already running server
+import os
+import time
+from artifact_server import ArtifactStore, is_artifact_name, is_serving, start_artifact_server
+
+
+def stored(directory):
+    return sorted(name for name in os.listdir(directory) if is_artifact_name(name))
+
+
+def test_prune_keeps_newest_under_size_cap(tmp_path):
+    store = ArtifactStore(str(tmp_path), max_bytes=4000, max_age=3600, prune_interval=0)
+    names = []
+    for i in range(20):
+        names.append(store.put(f"<p>{i}</p>" + "x" * 500))
+        time.sleep(0.01)
+    kept = stored(tmp_path)
+    assert 0 < len(kept) < 20
+    assert names[-1] in kept and names[0] not in kept
+
+
+def test_prune_drops_expired(tmp_path):
+    store = ArtifactStore(str(tmp_path), max_age=3600, prune_interval=3600)
+    store.put("<p>old</p>")
+    store.max_age = 0
+    store.prune()
+    assert os.listdir(tmp_path) == []
+
+
+def test_is_serving(tmp_path):
+    store = ArtifactStore(str(tmp_path))
+    server = start_artifact_server(store, port=0)
+    try:
+        assert is_serving(store, "127.0.0.1", server.server_address[1])
+    finally:
+        server.shutdown()
+    assert not is_serving(store, "127.0.0.1", server.server_address[1], timeout=0.5)
@@ -0,0 +1,81 @@
+# test_batch_generate.py - Which failures the batch runner retries on top of upstream_guard
+import json
+import pytest
+import upstream_guard
+import batch_generate
+
+JOB = {"prompt": "Create a landing page", "framework": "React", "device": "Desktop"}
+
+
+class FakeRouter:
+    def route(self, prompt, framework, device):
+        return {"model": "m", "max_tokens": 1000}
+
+    def observe(self, route, result):
+        pass
+
+
+@pytest.fixture
+def replies(monkeypatch):
+    """Queue of exceptions (raised) or results (returned) for successive generate_result calls"""
+    queue = []
+    calls = []
+
+    def generate_result(*args, **kwargs):
+        calls.append(kwargs["endpoint"])
+        reply = queue.pop(0)
+        if isinstance(reply, BaseException):
+            raise reply
+        return reply, []
+
+    monkeypatch.setattr(batch_generate, "generate_result", generate_result)
+    monkeypatch.setattr(batch_generate, "get_router", FakeRouter)
+    monkeypatch.setattr(batch_generate.time, "sleep", lambda seconds: None)
+    return queue, calls
+
+
+def run(max_retries=2):
+    return batch_generate.run_job(None, "m", JOB, max_retries, 0.01, None)
+
+
+def ok_result():
+    return {"metadata": {"usage": {"total_tokens": 10}}}
+
+
+def test_retries_refused_calls_and_parse_failures(replies):
+    queue, calls = replies
+    queue += [upstream_guard.CircuitOpenError("open", retry_after=1.0),
+              json.JSONDecodeError("bad", "", 0), ok_result()]
+    outcome = run()
+    assert outcome["status"] == "ok" and outcome["attempts"] == 3
+    assert calls == ["batch"] * 3
+
+
+def test_other_errors_fail_at_once(replies):
+    queue, calls = replies
+    queue += [ValueError("400 bad request"), ok_result()]
+    outcome = run()
+    assert outcome["status"] == "error" and outcome["attempts"] == 1
+    assert "400" in outcome["error"]
+
+
+def test_gives_up_after_max_retries(replies):
+    queue, calls = replies
+    queue += [upstream_guard.CircuitOpenError("open", retry_after=1.0)] * 3
+    outcome = run(max_retries=2)
+    assert outcome["status"] == "error" and outcome["attempts"] == 3
+
+
+def test_quota_waits_do_not_use_retries(replies):
+    queue, calls = replies
+    queue += [upstream_guard.RateLimitExceeded("quota", retry_after=1.0)] * 5 + [ok_result()]
+    outcome = run(max_retries=0)
+    assert outcome["status"] == "ok" and outcome["attempts"] == 6
+
+
+def test_limits_replace_the_shared_limiter(monkeypatch, tmp_path):
+    monkeypatch.setattr(upstream_guard, "limiter", upstream_guard.limiter)
+    batch_generate.run_batch(None, "m", str(tmp_path / "out.jsonl"), [], requests_per_minute=30,
+                             tokens_per_minute=9000, log=lambda message: None)
+    assert upstream_guard.limiter.requests.rate == 0.5
+    assert upstream_guard.limiter.tokens.capacity == 9000
@@ -0,0 +1,72 @@
+# test_generation_tracker.py - Join, supersede, cancel and eviction of per-session generations
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from generation_tracker import GenerationCancelled, GenerationTracker
+
+LABELS = {"endpoint": "generate", "framework": "React", "device": "Desktop"}
+
+
+@pytest.fixture
+def executor():
+    pool = ThreadPoolExecutor(max_workers=4)
+    yield pool
+    pool.shutdown(wait=True)
+
+
+def blocking_work(release):
+    """Work that runs until `release` is set or its ticket is cancelled"""
+    def work(ticket):
+        while not release.wait(0.01):
+            ticket.check()
+        return "done"
+    return work
+
+
+def test_same_key_joins_the_running_ticket(executor):
+    tracker = GenerationTracker(executor)
+    release = threading.Event()
+    first = tracker.submit("s1", "key-a", blocking_work(release), LABELS)
+    second = tracker.submit("s1", "key-a", blocking_work(release), LABELS)
+    assert second is first and first.joined == 1
+    release.set()
+    assert first.future.result(timeout=5) == "done"
+
+
+def test_new_key_supersedes_the_running_ticket(executor):
+    tracker = GenerationTracker(executor)
+    release = threading.Event()
+    old = tracker.submit("s1", "key-a", blocking_work(release), LABELS)
+    new = tracker.submit("s1", "key-b", lambda ticket: "new", LABELS)
+    assert old.cancelled.is_set()
+    with pytest.raises(GenerationCancelled):
+        old.future.result(timeout=5)
+    assert new.future.result(timeout=5) == "new"
+    assert tracker.pending("s1") is new
+
+
+def test_sessions_are_independent(executor):
+    tracker = GenerationTracker(executor)
+    release = threading.Event()
+    mine = tracker.submit("s1", "key-a", blocking_work(release), LABELS)
+    tracker.submit("s2", "key-b", blocking_work(release), LABELS)
+    assert not mine.cancelled.is_set()
+    assert tracker.cancel("s2") is True
+    assert tracker.cancel("s2") is False
+    release.set()
+    assert mine.future.result(timeout=5) == "done"
+
+
+def test_release_and_eviction_of_uncollected_results(executor):
+    tracker = GenerationTracker(executor, result_ttl=0.0)
+    collected = tracker.submit("s1", "key-a", lambda ticket: 1, LABELS)
+    collected.future.result(timeout=5)
+    tracker.release("s1", collected)
+    assert tracker.pending("s1") is None
+
+    abandoned = tracker.submit("s2", "key-b", lambda ticket: 2, LABELS)
+    abandoned.future.result(timeout=5)
+    # Done callbacks run right after the result is set
+    time.sleep(0.05)
+    assert tracker.stats()["sessions"] == 0
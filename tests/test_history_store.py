@@ -0,0 +1,47 @@
+# test_history_store.py - Backend interface and the behaviour both backends share
+import pytest
+from history_store import HistoryStore, MemoryHistoryStore, SQLiteHistoryStore
+
+
+def result(device, code="<p>hi</p>"):
+    return {"interactive_code": code, "metadata": {"device": device}}
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryHistoryStore()
+    return SQLiteHistoryStore(str(tmp_path / "history.sqlite3"))
+
+
+def test_incomplete_backend_fails_when_created():
+    class PartialStore(HistoryStore):
+        def add_entry(self, session_id, prompt, framework, device, result):
+            return 1
+
+    with pytest.raises(TypeError):
+        PartialStore()
+
+
+def test_entries_variants_and_listing(store):
+    entry_id = store.add_entry("s1", "a login form", "React", "Desktop", result("Desktop"))
+    store.add_variant(entry_id, "Mobile", result("Mobile", "<p>small</p>"))
+    store.set_device(entry_id, "Mobile")
+    store.add_entry("s2", "another session", "React", "Desktop", result("Desktop"))
+
+    entry = store.get_entry(entry_id)
+    assert entry["framework"] == "React" and sorted(entry["devices"]) == ["Desktop", "Mobile"]
+    assert store.load(entry_id) == result("Mobile", "<p>small</p>")
+    assert store.load(entry_id, "Desktop") == result("Desktop")
+    assert store.load(entry_id, "Tablet") is None
+
+    summaries, total = store.list_entries("s1", query="LOGIN")
+    assert total == 1 and summaries[0]["id"] == entry_id
+    assert store.list_entries("s1", query="missing") == ([], 0)
+
+
+def test_prune_drops_old_entries(store):
+    entry_id = store.add_entry("s1", "a login form", "React", "Desktop", result("Desktop"))
+    store.prune(-1)
+    assert store.get_entry(entry_id) is None
+    assert store.list_entries("s1") == ([], 0)
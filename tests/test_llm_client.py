@@ -0,0 +1,111 @@
+# test_llm_client.py - Rate-limiter token settlement for streamed and blocking calls
+from types import SimpleNamespace
+import pytest
+import upstream_guard
+import llm_client
+import metrics
+
+TOKENS_PER_MINUTE = 600000
+
+
+def chunk(content=None, finish_reason=None, usage=None):
+    choices = [] if content is None and finish_reason is None else \
+        [SimpleNamespace(delta=SimpleNamespace(content=content), finish_reason=finish_reason)]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+class FakeClient:
+    """Stands in for the OpenAI client: `create` returns the prepared chunks or response"""
+
+    def __init__(self, reply):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=lambda **params: reply()))
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    limiter = upstream_guard.RateLimiter(0, TOKENS_PER_MINUTE)
+    monkeypatch.setattr(upstream_guard, "limiter", limiter)
+    # Freeze the refill so only reservations and refunds move the level
+    monkeypatch.setattr(limiter.tokens, "_refill", lambda: None)
+    return limiter.tokens
+
+
+def params(max_tokens=4000):
+    return {"model": "m", "messages": [{"role": "user", "content": "x" * 400}], "max_tokens": max_tokens, "stream": True}
+
+
+def test_stream_settles_with_reported_usage(bucket):
+    usage = SimpleNamespace(prompt_tokens=100, completion_tokens=50, total_tokens=150, prompt_tokens_details=None)
+    client = FakeClient(lambda: (item for item in [chunk("hello"), chunk(finish_reason="stop"), chunk(usage=usage)]))
+    for _ in llm_client.chat_completion(client, metrics.call_labels("generate_stream"), **params()):
+        pass
+    assert bucket.tokens == TOKENS_PER_MINUTE - 150
+
+
+def test_stream_without_usage_settles_on_streamed_text(bucket):
+    client = FakeClient(lambda: (item for item in [chunk("a" * 400), chunk(finish_reason="stop")]))
+    for _ in llm_client.chat_completion(client, metrics.call_labels("generate_stream"), **params()):
+        pass
+    # 400 prompt characters and 400 streamed characters, 4 characters per token
+    assert bucket.tokens == TOKENS_PER_MINUTE - 200
+
+
+def test_stream_closed_early_settles_once(bucket):
+    client = FakeClient(lambda: (item for item in [chunk("a" * 40), chunk("b" * 40), chunk(finish_reason="stop")]))
+    stream = llm_client.chat_completion(client, metrics.call_labels("generate_stream"), **params())
+    reader = iter(stream)
+    next(reader)
+    stream.close()
+    reader.close()
+    assert bucket.tokens == TOKENS_PER_MINUTE - 110
+
+
+def test_stream_closed_unread_keeps_only_the_prompt(bucket):
+    client = FakeClient(lambda: (item for item in [chunk("a" * 40)]))
+    llm_client.chat_completion(client, metrics.call_labels("generate_stream"), **params()).close()
+    assert bucket.tokens == TOKENS_PER_MINUTE - 100
+
+
+class FakeAsyncStream:
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.chunks:
+            raise StopAsyncIteration
+        return self.chunks.pop(0)
+
+    async def close(self):
+        self.closed = True
+
+
+def test_async_stream_holds_the_admission_slot_until_it_ends(bucket, monkeypatch):
+    import asyncio
+    import admission
+    controller = admission.AdmissionController(4, {"interactive": 4, "batch": 1, "diagnostics": 1},
+                                               {"interactive": 1, "batch": 1, "diagnostics": 1}, latency_target=0)
+    monkeypatch.setattr(admission, "controller", controller)
+
+    async def create(**params):
+        return FakeAsyncStream([chunk("a" * 40), chunk(finish_reason="stop")])
+
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    async def run():
+        stream = await llm_client.async_chat_completion(client, metrics.call_labels("generate_stream"), **params())
+        assert controller.active["interactive"] == 1
+        async for _ in stream:
+            pass
+        assert controller.active["interactive"] == 0
+
+        stream = await llm_client.async_chat_completion(client, metrics.call_labels("generate_stream"), **params())
+        await stream.close()
+        assert controller.active["interactive"] == 0
+
+    asyncio.run(run())
+    # The read stream used 100 prompt + 10 completion tokens, the unread one only its prompt
+    assert bucket.tokens == TOKENS_PER_MINUTE - 210
@@ -0,0 +1,46 @@
+# test_project_export.py - Project layout and ZIP export on well-formed and odd result shapes
+import io
+import zipfile
+import pytest
+from project_export import PROJECT_LAYOUTS, ProjectExporter, project_files
+
+
+def odd_result():
+    # Shapes models do return: a string where an object was asked for, a list of file names, nulls
+    return {
+        "interactive_code": "<div>hi</div>",
+        "separate_code": "<div>hi</div>",
+        "additional_files": ["helpers.js", "utils.js"],
+        "css_code": None,
+        "framework_specific_code": {"App.jsx": "export default () => null"},
+        "explanation": None
+    }
+
+
+@pytest.mark.parametrize("framework", list(PROJECT_LAYOUTS))
+def test_odd_shapes_export(framework):
+    files = project_files(odd_result(), framework)
+    assert all(isinstance(content, str) for content in files.values())
+    archive = ProjectExporter().build(odd_result(), framework)
+    with zipfile.ZipFile(io.BytesIO(archive)) as opened:
+        assert opened.testzip() is None
+        assert len(opened.namelist()) == len(files)
+
+
+def test_additional_files_stay_inside_project():
+    result = {"separate_code": {"html": "<p>x</p>"},
+              "additional_files": {"../../etc/passwd": "x", "lib/a.js": {"not": "text"}, "index.html": "overwrite"}}
+    files = project_files(result, "HTML/CSS/JS")
+    assert "etc/passwd" in files
+    assert files["lib/a.js"].startswith("{")
+    assert files["index.html"] != "overwrite"
+
+
+
+def test_stream_yields_bytes_from_cache():
+    exporter = ProjectExporter()
+    key, root, files = exporter.prepare({"separate_code": {"html": "<p>x</p>"}}, "HTML/CSS/JS")
+    first = b"".join(exporter.stream(key, root, files))
+    chunks = list(exporter.stream(key, root, files, chunk_size=100))
+    assert all(type(chunk) is bytes for chunk in chunks)
+    assert b"".join(chunks) == first
@@ -0,0 +1,44 @@
+# test_replay_log.py - Log rotation and reading logs whose writer was killed
+import os
+import pytest
+from replay_log import ReplayRecorder, iter_records, log_files, zstandard
+
+COMPRESSIONS = ["none", pytest.param("zstd", marks=pytest.mark.skipif(zstandard is None, reason="zstandard not installed"))]
+
+
+def write_records(directory, count, compression, max_bytes=64 * 1024, max_files=20):
+    recorder = ReplayRecorder(str(directory), max_bytes=max_bytes, max_files=max_files, compression=compression)
+    for i in range(count):
+        recorder.record({"i": i, "content": "é" * 40})
+    return recorder
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_rotation_keeps_newest_files(tmp_path, compression):
+    recorder = write_records(tmp_path, 30, compression, max_bytes=300, max_files=3)
+    recorder.close()
+    paths = log_files(str(tmp_path))
+    assert len(paths) == 3
+    numbers = [record["i"] for record in iter_records(paths)]
+    assert numbers == list(range(numbers[0], 30))
+    assert numbers[0] > 0
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+def test_reads_log_still_being_written(tmp_path, compression):
+    recorder = write_records(tmp_path, 5, compression)
+    assert [record["i"] for record in iter_records(log_files(str(tmp_path)))] == list(range(5))
+    recorder.close()
+
+
+@pytest.mark.parametrize("compression", COMPRESSIONS)
+@pytest.mark.parametrize("cut", [1, 4, 7, 50])
+def test_truncated_log_yields_complete_records(tmp_path, compression, cut):
+    write_records(tmp_path, 10, compression).close()
+    [path] = log_files(str(tmp_path))
+    size = os.path.getsize(path)
+    with open(path, "r+b") as handle:
+        handle.truncate(size - cut)
+    numbers = [record["i"] for record in iter_records([path])]
+    assert 0 < len(numbers) <= 10
+    assert numbers == list(range(len(numbers)))
@@ -0,0 +1,107 @@
+# test_response_cache.py - LRU eviction, TTL expiry, stale reads and the SQLite tier
+import json
+from types import SimpleNamespace
+import pytest
+import response_cache
+from response_cache import ResponseCache, make_cache_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake wall clock for the cache module; advance it by setting `clock.now`"""
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(response_cache, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def value(i, size=100):
+    return {"i": i, "code": "x" * size}
+
+
+def test_key_normalizes_prompt_whitespace_and_case():
+    key = make_cache_key("A  Login\nForm", "React", "Desktop", "m", 0.7)
+    assert key == make_cache_key("a login form", "React", "Desktop", "m", 0.7)
+    assert key != make_cache_key("a login form", "React", "Desktop", "other", 0.7)
+    assert key != make_cache_key("a login form", "React", "Mobile", "m", 0.7)
+
+
+def test_get_returns_a_copy():
+    cache = ResponseCache()
+    cache.set("k", value(1))
+    cache.get("k")["code"] = "changed"
+    assert cache.get("k") == value(1)
+
+
+def test_lru_evicts_least_recently_used_by_bytes():
+    size = len(json.dumps(value(0), separators=(",", ":")))
+    cache = ResponseCache(max_bytes=3 * size)
+    for i in range(3):
+        cache.set(f"k{i}", value(i))
+    cache.get("k0")
+    cache.set("k3", value(3))
+    assert cache.get("k1") is None
+    assert all(cache.get(f"k{i}") is not None for i in (0, 2, 3))
+    stats = cache.stats()
+    assert stats["evictions"] == 1 and stats["memory_bytes"] == 3 * size
+
+
+def test_values_larger_than_memory_tier_go_to_disk_only(tmp_path):
+    cache = ResponseCache(max_bytes=50, db_path=str(tmp_path / "cache.sqlite3"))
+    cache.set("big", value(1, size=200))
+    assert cache.stats()["memory_entries"] == 0
+    assert cache.get("big") == value(1, size=200)
+
+
+def test_ttl_expiry_and_stale_window(clock):
+    cache = ResponseCache(ttl_seconds=60, stale_ttl_seconds=600)
+    cache.set("k", value(1))
+    clock.now += 59
+    assert cache.get("k") == value(1)
+    clock.now += 2
+    assert cache.get("k") is None and not cache.contains("k")
+    assert cache.get_stale("k") == value(1)
+    clock.now += 600
+    assert cache.get_stale("k") is None
+    stats = cache.stats()
+    assert stats["stale_hits"] == 1 and stats["expired"] >= 1
+
+
+def test_get_stale_without_stale_window(clock):
+    cache = ResponseCache(ttl_seconds=60)
+    cache.set("k", value(1))
+    clock.now += 61
+    assert cache.get_stale("k") is None
+
+
+def test_sqlite_tier_persists_across_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    ResponseCache(db_path=path).set("k", value(1))
+    reopened = ResponseCache(db_path=path)
+    assert reopened.contains("k")
+    assert reopened.get("k") == value(1)
+    assert reopened.stats()["disk_hits"] == 1
+    # Promoted to memory by the disk hit
+    assert reopened.get("k") == value(1) and reopened.stats()["memory_hits"] == 1
+
+
+def test_sqlite_stale_read_and_expiry(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    ResponseCache(ttl_seconds=60, stale_ttl_seconds=600, db_path=path).set("k", value(1))
+    reopened = ResponseCache(ttl_seconds=60, stale_ttl_seconds=600, db_path=path)
+    clock.now += 120
+    assert reopened.get("k") is None
+    assert reopened.get_stale("k") == value(1)
+    clock.now += 600
+    assert reopened.get("k") is None
+    assert reopened.stats()["disk_entries"] == 0
+
+
+def test_invalidate_and_clear_both_tiers(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ResponseCache(db_path=path)
+    cache.set("a", value(1))
+    cache.set("b", value(2))
+    cache.invalidate("a")
+    assert cache.get("a") is None and ResponseCache(db_path=path).get("a") is None
+    cache.clear()
+    assert ResponseCache(db_path=path).get("b") is None
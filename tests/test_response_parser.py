@@ -0,0 +1,72 @@
+# test_response_parser.py - Repairing and salvaging malformed model JSON
+import json
+import pytest
+from response_parser import StreamingFieldParser, clean_json_text, parse_response, salvage_fields
+
+VALID = {"interactive_code": "<p>{hi}</p>", "css_code": "p { color: red; }", "explanation": "A \"quoted\" word"}
+
+
+def test_valid_json_needs_no_recovery():
+    result, recovery = parse_response(json.dumps(VALID))
+    assert result == VALID and recovery is None
+
+
+def test_fenced_json_with_chatter_is_repaired():
+    text = "Here is your UI:\n```json\n" + json.dumps(VALID, indent=2) + "\n```\nEnjoy!"
+    result, recovery = parse_response(text)
+    assert result == VALID
+    assert recovery == {"method": "repaired", "recovered_fields": list(VALID)}
+
+
+def test_trailing_commas_are_dropped():
+    text = '{"a": [1, 2, ], "b": {"c": 3,},\n}'
+    result, recovery = parse_response(text)
+    assert result == {"a": [1, 2], "b": {"c": 3}} and recovery["method"] == "repaired"
+
+
+def test_commas_inside_strings_are_kept():
+    result, _ = parse_response('{"a": "x, }", "b": "[1, ]",}')
+    assert result == {"a": "x, }", "b": "[1, ]"}
+
+
+def test_raw_control_characters_in_strings_are_escaped():
+    result, recovery = parse_response('{"code": "line one\nline two\ttabbed"}')
+    assert result == {"code": "line one\nline two\ttabbed"} and recovery["method"] == "repaired"
+
+
+def test_truncated_response_keeps_complete_fields():
+    text = '{"interactive_code": "<p>done</p>", "css_code": "p {}", "explanation": "cut off here'
+    result, recovery = parse_response(text)
+    assert result == {"interactive_code": "<p>done</p>", "css_code": "p {}"}
+    assert recovery == {"method": "salvaged", "recovered_fields": ["interactive_code", "css_code"]}
+
+
+def test_truncated_nested_value_is_dropped():
+    result, _ = parse_response('{"a": 1, "separate_code": {"html": "<p>", "js": "x')
+    assert result == {"a": 1}
+
+
+@pytest.mark.parametrize("text", ['["a", "b"]', '"just a string"', "42", "", None, "no json here", '{"a": "never closed'])
+def test_unusable_text_raises(text):
+    with pytest.raises(json.JSONDecodeError):
+        parse_response(text)
+
+
+def test_clean_json_text_reports_incomplete_objects():
+    assert clean_json_text('noise {"a": {"b": 1}} trailing') == ('{"a": {"b": 1}}', True)
+    assert clean_json_text('{"a": {"b": 1}')[1] is False
+    assert clean_json_text("no braces") == ("", False)
+
+
+def test_streaming_parser_reports_fields_as_they_close():
+    text = '```json\n{"a": "x,y", "b": {"c": [1, 2]}, "d": 3}\n```'
+    parser = StreamingFieldParser()
+    seen = []
+    for i in range(0, len(text), 5):
+        seen.extend(parser.feed(text[i:i + 5]))
+    assert seen == [("a", "x,y"), ("b", {"c": [1, 2]}), ("d", 3)]
+    assert parser.complete
+
+
+def test_salvage_skips_invalid_values():
+    assert salvage_fields('{"a": nope, "b": 2, "c": ') == {"b": 2}
@@ -0,0 +1,91 @@
+# test_routing.py - Tier selection for prompts and budgets learned from observed usage
+import json
+import pytest
+import routing
+from routing import MAX_TOKENS_CAP, MIN_TOKENS, TIERS, Router, classify_prompt
+from prompt_library import PROMPT_LIBRARY
+
+SMALL_PROMPT = PROMPT_LIBRARY["Interactive Elements"][0]
+LARGE_PROMPT = PROMPT_LIBRARY["Complete Layouts"][0]
+
+
+def result(completion_tokens=None, finish_reason="stop"):
+    usage = {"completion_tokens": completion_tokens} if completion_tokens else {}
+    return {"interactive_code": "<p>x</p>", "metadata": {"usage": usage, "finish_reason": finish_reason}}
+
+
+def budget(tier, framework="HTML/CSS/JS"):
+    return int(min(MAX_TOKENS_CAP, max(MIN_TOKENS, TIERS[tier]["max_tokens"] * routing.FRAMEWORK_FACTORS[framework])))
+
+
+def test_library_prompts_use_their_category():
+    assert classify_prompt(SMALL_PROMPT) == ("Interactive Elements", "small")
+    # Matching ignores case, punctuation and spacing
+    assert classify_prompt("  " + LARGE_PROMPT.upper() + "!") == ("Complete Layouts", "large")
+
+
+@pytest.mark.parametrize("prompt, tier", [
+    ("a toggle switch", "small"),
+    ("an admin dashboard with charts", "large"),
+    ("a pricing table with three plans", "medium"),
+    ("a button " + "with many extra words " * 10, "large")
+])
+def test_custom_prompts_are_sized_by_hints_and_length(prompt, tier):
+    assert classify_prompt(prompt) == (f"custom:{tier}", tier)
+
+
+def test_route_uses_tier_budget_and_framework_factor():
+    router = Router()
+    route = router.route(SMALL_PROMPT, "Angular", "Mobile")
+    assert route["tier"] == "small" and route["model"] == TIERS["small"]["model"]
+    assert route["max_tokens"] == budget("small", "Angular") and not route["learned"]
+    assert router.route(LARGE_PROMPT, "HTML/CSS/JS", "Desktop")["max_tokens"] == budget("large")
+
+
+def test_disabled_router_uses_fixed_budget():
+    route = Router(enabled=False).route(LARGE_PROMPT, "React", "Desktop")
+    assert route["max_tokens"] == routing.MAX_TOKENS and route["category"] is None and not route["learned"]
+
+
+def test_observe_learns_p95_with_headroom_after_min_samples():
+    router = Router(min_samples=5, headroom=1.5)
+    route = router.route(SMALL_PROMPT, "HTML/CSS/JS", "Desktop")
+    for tokens in (1000, 1100, 1200, 1300):
+        router.observe(route, result(tokens))
+    assert not router.route(SMALL_PROMPT, "HTML/CSS/JS", "Desktop")["learned"]
+    router.observe(route, result(1400))
+    learned = router.route(SMALL_PROMPT, "HTML/CSS/JS", "Desktop")
+    assert learned["learned"] and learned["max_tokens"] == 2100
+    assert router.stats()["Interactive Elements"] == {"samples": 5, "p95_completion_tokens": 1400}
+
+
+def test_other_pairs_fall_back_to_the_category_samples():
+    router = Router(min_samples=3, headroom=1.0)
+    route = router.route(SMALL_PROMPT, "HTML/CSS/JS", "Desktop")
+    for _ in range(3):
+        router.observe(route, result(1600))
+    other = router.route(SMALL_PROMPT, "React", "Mobile")
+    assert other["learned"] and other["max_tokens"] == 1600
+
+
+def test_truncated_completions_grow_the_budget():
+    router = Router(min_samples=1, headroom=1.0)
+    route = router.route(SMALL_PROMPT, "HTML/CSS/JS", "Desktop")
+    router.observe(route, result(500, finish_reason="length"))
+    assert router.route(SMALL_PROMPT, "HTML/CSS/JS", "Desktop")["max_tokens"] == min(MAX_TOKENS_CAP, int(route["max_tokens"] * 1.5))
+
+
+def test_learned_budget_is_clamped():
+    router = Router(min_samples=1, headroom=1.0)
+    route = router.route(SMALL_PROMPT, "HTML/CSS/JS", "Desktop")
+    router.observe(route, result(10))
+    assert router.route(SMALL_PROMPT, "HTML/CSS/JS", "Desktop")["max_tokens"] == MIN_TOKENS
+
+
+def test_observe_estimates_tokens_without_usage_and_notes_the_route():
+    router = Router(min_samples=1, headroom=1.0)
+    route = router.route(SMALL_PROMPT, "HTML/CSS/JS", "Desktop")
+    generated = {"interactive_code": "x" * 8000, "metadata": {}}
+    router.observe(route, generated)
+    assert generated["metadata"]["route"] == {key: route[key] for key in ("category", "tier", "model", "max_tokens")}
+    assert router.stats()["Interactive Elements"]["p95_completion_tokens"] == len(json.dumps({"interactive_code": "x" * 8000})) // 4
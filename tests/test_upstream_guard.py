@@ -0,0 +1,178 @@
+# test_upstream_guard.py - Circuit breaker states, Retry-After, retry policy and token refunds
+from types import SimpleNamespace
+import openai
+import pytest
+import upstream_guard
+from upstream_guard import CircuitBreaker, CircuitOpenError, RateLimitExceeded, TokenBucket, retry_after_seconds
+
+LABELS = {"endpoint": "test", "framework": "", "device": ""}
+
+
+def provider_error(cls, headers=None):
+    """An openai error of type `cls` carrying `headers`, without building an HTTP response"""
+    error = cls.__new__(cls)
+    error.response = SimpleNamespace(headers=headers or {})
+    return error
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Fake monotonic clock; `sleep` advances it and records each delay"""
+    clock = SimpleNamespace(now=1000.0, sleeps=[])
+
+    def sleep(seconds):
+        clock.sleeps.append(seconds)
+        clock.now += seconds
+
+    monkeypatch.setattr(upstream_guard, "time", SimpleNamespace(monotonic=lambda: clock.now, sleep=sleep))
+    return clock
+
+
+@pytest.fixture
+def guard(monkeypatch, clock):
+    """Fresh limiter and breaker with a 6000 tokens/minute bucket"""
+    monkeypatch.setattr(upstream_guard, "limiter", upstream_guard.RateLimiter(0, 6000))
+    monkeypatch.setattr(upstream_guard, "breaker", CircuitBreaker(failure_threshold=3, reset_seconds=30))
+    monkeypatch.setattr(upstream_guard, "retry_attempts", 2)
+    monkeypatch.setattr(upstream_guard, "max_wait_seconds", 60)
+    monkeypatch.setattr(upstream_guard, "backoff_base", 0.5)
+    return upstream_guard
+
+
+def failing(*errors, response="ok"):
+    """A `create` callable raising each error in turn, then returning `response`"""
+    calls = []
+
+    def create():
+        calls.append(len(calls))
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return response
+
+    create.calls = calls
+    return create
+
+
+def test_breaker_opens_half_opens_and_closes(clock):
+    breaker = CircuitBreaker(failure_threshold=2, reset_seconds=30)
+    breaker.record_failure()
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError) as refused:
+        breaker.allow()
+    assert refused.value.retry_after == 30
+    clock.now += 30
+    breaker.allow()
+    assert breaker.state == "half_open"
+    # Only one probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.failures == 0
+    breaker.allow()
+
+
+def test_failed_probe_reopens_the_breaker(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    breaker.record_failure()
+    clock.now += 10
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+
+
+def test_released_probe_lets_the_next_caller_probe(clock):
+    breaker = CircuitBreaker(failure_threshold=1, reset_seconds=10)
+    breaker.record_failure()
+    clock.now += 10
+    breaker.allow()
+    breaker.release_probe()
+    breaker.allow()
+    assert breaker.state == "half_open"
+
+
+@pytest.mark.parametrize("headers, expected", [
+    ({"retry-after": "3"}, 3.0),
+    ({"retry-after": "1.5"}, 1.5),
+    ({"retry-after-ms": "250", "retry-after": "9"}, 0.25),
+    ({"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"}, None),
+    ({}, None)
+])
+def test_retry_after_seconds(headers, expected):
+    assert retry_after_seconds(provider_error(openai.RateLimitError, headers)) == expected
+
+
+def test_retry_after_without_response():
+    assert retry_after_seconds(ValueError("no response")) is None
+
+
+def test_token_bucket_waits_and_refunds(clock):
+    bucket = TokenBucket(600)
+    assert bucket.reserve(600) == 0
+    assert bucket.reserve(100) == pytest.approx(10)
+    assert bucket.reserve(100, max_wait=5) is None
+    bucket.refund(300)
+    assert bucket.tokens == pytest.approx(200)
+    bucket.refund(10000)
+    assert bucket.tokens == 600
+
+
+def test_guarded_call_retries_retryable_errors_with_retry_after(guard, clock):
+    create = failing(provider_error(openai.RateLimitError, {"retry-after": "4"}),
+                     provider_error(openai.InternalServerError))
+    assert guard.guarded_call(create, LABELS, 1000) == "ok"
+    assert len(create.calls) == 3
+    assert 4 <= clock.sleeps[0] <= 4.5
+    # Failed attempts give their tokens back; only the successful one holds a reservation
+    assert guard.limiter.tokens.tokens == 5000
+    assert guard.breaker.state == "closed" and guard.breaker.failures == 0
+
+
+def test_guarded_call_gives_up_after_retry_attempts(guard, clock):
+    errors = [provider_error(openai.APIConnectionError) for _ in range(5)]
+    create = failing(*errors)
+    with pytest.raises(openai.APIConnectionError):
+        guard.guarded_call(create, LABELS, 1000)
+    assert len(create.calls) == 3
+    assert guard.breaker.failures == 3 and guard.breaker.state == "open"
+
+
+@pytest.mark.parametrize("error", [ValueError("bad request"), provider_error(openai.BadRequestError),
+                                   provider_error(openai.AuthenticationError)])
+def test_non_retryable_errors_are_not_retried(guard, error):
+    guard.breaker.failures = 2
+    create = failing(error)
+    with pytest.raises(type(error)):
+        guard.guarded_call(create, LABELS, 1000)
+    assert len(create.calls) == 1
+    # The provider answered, so it counts as up
+    assert guard.breaker.failures == 0 and guard.breaker.state == "closed"
+
+
+def test_open_breaker_refuses_without_calling(guard):
+    for _ in range(3):
+        guard.breaker.record_failure()
+    create = failing()
+    with pytest.raises(CircuitOpenError):
+        guard.guarded_call(create, LABELS, 1000)
+    assert create.calls == []
+
+
+def test_rate_limit_refuses_without_calling(guard, monkeypatch):
+    monkeypatch.setattr(upstream_guard, "max_wait_seconds", 5)
+    guard.limiter.tokens.tokens = 0
+    create = failing()
+    with pytest.raises(RateLimitExceeded):
+        guard.guarded_call(create, LABELS, 1000)
+    assert create.calls == []
+
+
+def test_settle_tokens_refunds_unused_reservation(guard):
+    guard.guarded_call(failing(), LABELS, 1000)
+    guard.settle_tokens(1000, {"total_tokens": 400})
+    assert guard.limiter.tokens.tokens == 5600
+    guard.settle_tokens(1000, None)
+    assert guard.limiter.tokens.tokens == 5600
@@ -0,0 +1,92 @@
+# test_validation.py - JavaScript checks on modern syntax, classic scripts and real errors; background checks
+import threading
+import pytest
+import validation
+from validation import ValidationPool, check_js
+
+MODERN = {
+    "optional chaining": "const a = {b: 1};\nconsole.log(a?.b);",
+    "nullish coalescing": "let x = null;\nconst y = x ?? 1;",
+    "logical assignment": "let x = 0;\nx ||= 2;",
+    "class fields": "class Counter {\n  count = 0;\n  static step = 1;\n  inc() { this.count += Counter.step; }\n}",
+    "private members": "class A {\n  #x = 1;\n  get() { return this.#x; }\n}",
+    "for await": "async function f(xs) {\n  for await (const x of xs) { console.log(x); }\n}",
+    "numeric separators": "const big = 1_000_000;"
+}
+
+
+def errors(issues):
+    return [item for item in issues if item["severity"] == "error"]
+
+
+@pytest.mark.parametrize("name", list(MODERN))
+def test_modern_syntax_is_not_an_error(name):
+    assert errors(check_js("js", MODERN[name])) == []
+
+
+def test_modern_jsx_is_not_an_error():
+    code = "export default function App({user}) {\n  return <div>{user?.name ?? 'guest'}</div>;\n}"
+    assert errors(check_js("jsx", code, jsx=True)) == []
+
+
+def test_classic_script_parses_as_script():
+    # `with` is a syntax error in modules (strict mode) but fine in a classic script
+    assert check_js("js", "with (Math) { console.log(max(1, 2)); }") == []
+
+
+@pytest.mark.parametrize("code", ["function f( {\n  return 1;\n}", "let = ;", "const a = [1, 2;"])
+def test_broken_code_is_an_error(code):
+    assert errors(check_js("js", code))
+
+
+def test_broken_modern_code_still_fails_the_bracket_check():
+    issues = check_js("js", "const y = a?.b;\nfunction f( {\n")
+    assert errors(issues)
+    if validation.esprima is not None:
+        assert any(item["severity"] == "warning" for item in issues)
+
+
+def generated(js):
+    return {"interactive_code": "<p>hi</p>", "css_code": "p { color: red; }", "framework_specific_code": "",
+            "separate_code": {"html": "<p>hi</p>", "js": js},
+            "metadata": {"framework": "HTML/CSS/JS", "device": "Desktop"}}
+
+
+@pytest.fixture
+def pool():
+    pool = ValidationPool(workers=1, timeout=30)
+    yield pool
+    pool.shutdown()
+
+
+def test_check_later_returns_at_once(pool):
+    gate = threading.Event()
+    done = []
+    result = generated("function f( {")
+    shown = pool.check_later(result, "HTML/CSS/JS", "Desktop", done.append,
+                             repair=lambda broken, instruction: gate.wait() and None)
+    assert shown is result and result["metadata"]["validation"]["status"] == "pending"
+    assert pool.is_checking(result) and pool.checked(result) is None
+    gate.set()
+    pool.shutdown()
+    assert not pool.is_checking(result)
+    checked = pool.checked(result)
+    assert done == [checked] and checked is not result
+    assert checked["metadata"]["validation"]["errors"] and checked["metadata"]["validation"]["repair"]
+    assert result["metadata"]["validation"]["status"] == "pending"
+
+
+def test_check_later_keeps_a_better_repair(pool):
+    done = []
+    pool.check_later(generated("function f( {"), "HTML/CSS/JS", "Desktop", done.append,
+                     repair=lambda broken, instruction: generated("function f() {}"))
+    pool.shutdown()
+    [checked] = done
+    assert checked["separate_code"]["js"] == "function f() {}"
+    assert checked["metadata"]["validation"]["errors"] == 0
+
+
+def test_unknown_checks_are_not_pending(pool):
+    result = generated("")
+    result["metadata"]["validation"] = {"status": "pending", "check_id": "from another process"}
+    assert not pool.is_checking(result) and pool.checked(result) is None
@@ -1,9 +1,14 @@
 # troubleshoot_app.py - Simple diagnostic app
 import os
 import json
-from flask import Flask, request, jsonify, render_template
+from flask import Flask, Response, request, jsonify, render_template
 from dotenv import load_dotenv
-from openai import OpenAI
+from llm_client import chat_completion, get_client, preload_client
+from upstream_guard import UpstreamUnavailable
+import metrics
+import admission
+from shared_state import get_shared_metrics, get_state, render_metrics
+from serving import lifecycle
 
 # Load environment variables
 load_dotenv()
@@ -16,8 +21,17 @@ print(f"API Key exists: {bool(api_key)}")
 print(f"Base URL: {base_url}")
 print(f"Model ID: {model_id}")
 
-# Initialize the OpenAI client
-client = OpenAI(api_key=api_key, base_url=base_url)
+# Create the shared, pooled OpenAI client in the background so startup is not held up by importing openai
+preload_client()
+
+# Under serve.py the workers share job status, rate limits and metrics through this file
+shared_state = get_state()
+# Publish this worker's metrics from the start, not only once it has been scraped
+get_shared_metrics()
+if shared_state is not None:
+    lifecycle.add_check("shared_state", lambda: shared_state.ping() or "ok")
+# Slots in use and waiting per priority class, and the latency that drives shedding
+lifecycle.add_check("admission", admission.stats)
 
 app = Flask(__name__)
 
@@ -25,6 +39,17 @@ app = Flask(__name__)
 def index():
     return render_template('troubleshoot.html')
 
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition of the upstream call metrics (summed over all workers under serve.py)"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness for load balancers: 503 while this worker drains for shutdown"""
+    ready, details = lifecycle.readiness()
+    return jsonify(details), 200 if ready else 503
+
 @app.route('/simple-test', methods=['POST'])
 def simple_test():
     """Simple test endpoint that just echoes back the received JSON"""
@@ -76,7 +101,9 @@ def api_test():
         print(f"Testing API with prompt: {prompt}")
         
         # Make a simple API call
-        response = client.chat.completions.create(
+        response = chat_completion(
+            get_client(),
+            metric_labels=metrics.call_labels("api_test"),
             model=model_id,
             messages=[
                 {"role": "user", "content": prompt}
@@ -92,6 +119,14 @@ def api_test():
             'response': response_text
         })
         
+    except UpstreamUnavailable as e:
+        response = jsonify({
+            'status': 'error',
+            'message': f'API test skipped, the model API is unavailable: {str(e)}'
+        })
+        response.status_code = 503
+        response.headers['Retry-After'] = str(int(e.retry_after) + 1)
+        return response
     except Exception as e:
         print(f"API test error: {str(e)}")
         return jsonify({
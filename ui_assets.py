@@ -0,0 +1,51 @@
+# ui_assets.py - Static HTML/CSS snippets for the Streamlit app
+# Kept out of app.py so they are built once per process instead of on every rerun
+
+APP_CSS = """
+<style>
+    /* Clean, modern UI styling */
+    .main .block-container {
+        padding-top: 1rem;
+    }
+    
+    .stButton button {
+        border-radius: 4px;
+        font-weight: 500;
+    }
+    
+    .stTabs [data-baseweb="tab-list"] {
+        gap: 2px;
+    }
+    
+    .stTabs [data-baseweb="tab"] {
+        height: 40px;
+        border-radius: 4px 4px 0px 0px;
+        padding: 10px 16px;
+    }
+    
+    [data-testid="stCodeBlock"] {
+        max-height: 500px;
+    }
+    
+    iframe {
+        border: none;
+        background-color: white;
+    }
+</style>
+"""
+
+FOOTER_HTML = """
+<footer>
+    <p style="text-align: center; color: #888; font-size: 0.8em;">© 2025 CodePilot AI - Powered by Claude 3.7 Sonnet</p>
+</footer>
+"""
+
+# Opening tag of the frame drawn around Mobile and Tablet previews
+DEVICE_FRAME_HTML = {
+    "Mobile": """
+                <div style="margin: 0 auto; max-width: 375px; border: 12px solid #222; border-radius: 25px; overflow: hidden;">
+                """,
+    "Tablet": """
+                <div style="margin: 0 auto; max-width: 768px; border: 16px solid #222; border-radius: 25px; overflow: hidden;">
+                """
+}
@@ -0,0 +1,320 @@
+# upstream_guard.py - Process-wide rate limiting, retries and circuit breaking for upstream model calls
+import os
+import time
+import random
+import threading
+import metrics
+import shared_state
+
+# Process-wide quota (0 = unlimited)
+requests_per_minute = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))
+tokens_per_minute = int(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))
+
+# Upper bound on time spent waiting for quota and between retries, per call
+max_wait_seconds = float(os.getenv("LLM_MAX_WAIT_SECONDS", "30"))
+
+# Retries after the first attempt, with jittered exponential backoff
+retry_attempts = int(os.getenv("OPENAI_MAX_RETRIES", "2"))
+backoff_base = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+backoff_max = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+
+# Open the breaker after this many consecutive upstream failures, probe again after the reset time
+breaker_failure_threshold = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+breaker_reset_seconds = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+
+
+class UpstreamUnavailable(Exception):
+    """Raised without calling the API when the limiter or the breaker refuses a request"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class RateLimitExceeded(UpstreamUnavailable):
+    pass
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    pass
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at `rate_per_minute`.
+
+    `reserve` takes the amount immediately and returns how long the caller
+    has to wait before the reservation is covered, so sync and async callers
+    can sleep in their own way. A rate of 0 disables the bucket.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount, max_wait=None):
+        """Reserve `amount` and return the wait in seconds, or None (nothing reserved) if it exceeds `max_wait`"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            self._refill()
+            # A single request larger than the bucket would otherwise never fit
+            amount = min(amount, self.capacity)
+            wait = max(0.0, (amount - self.tokens) / self.rate)
+            if max_wait is not None and wait > max_wait:
+                return None
+            self.tokens -= amount
+            return wait
+
+    def refund(self, amount):
+        if self.rate <= 0 or amount <= 0:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class RateLimiter:
+    """Request and token buckets shared by every upstream call in the process.
+
+    With a shared `state` (see shared_state) the buckets are shared by every
+    worker process of the server instead.
+    """
+
+    def __init__(self, requests_per_minute=0, tokens_per_minute=0, state=None):
+        if state is not None:
+            self.requests = shared_state.SharedTokenBucket(state, "llm_requests", requests_per_minute)
+            self.tokens = shared_state.SharedTokenBucket(state, "llm_tokens", tokens_per_minute)
+        else:
+            self.requests = TokenBucket(requests_per_minute)
+            self.tokens = TokenBucket(tokens_per_minute)
+
+    def reserve(self, estimated_tokens, max_wait):
+        """Reserve one request and `estimated_tokens`; return the wait or raise RateLimitExceeded"""
+        request_wait = self.requests.reserve(1, max_wait)
+        if request_wait is None:
+            raise RateLimitExceeded("Request rate limit reached", retry_after=max_wait)
+        token_wait = self.tokens.reserve(estimated_tokens, max_wait)
+        if token_wait is None:
+            self.requests.refund(1)
+            raise RateLimitExceeded("Token rate limit reached", retry_after=max_wait)
+        return max(request_wait, token_wait)
+
+
+class CircuitBreaker:
+    """Fail fast while the provider is down.
+
+    Closed: calls go through and consecutive failures are counted. After
+    `failure_threshold` failures the breaker opens and rejects calls for
+    `reset_seconds`. Then it is half-open and lets a single probe through;
+    success closes it, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_seconds=30):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Raise CircuitOpenError unless a call may go upstream now"""
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self._transition("half_open")
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return
+            raise CircuitOpenError("Model API circuit breaker is open", retry_after=max(1.0, remaining))
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            if self.state != "closed":
+                self._transition("closed")
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self._transition("open")
+
+    def release_probe(self):
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _transition(self, state):
+        self.state = state
+        metrics.BREAKER_TRANSITIONS.inc({"state": state})
+        print(f"Model API circuit breaker {state}")
+
+
+# Only open the shared file when there is a quota to share
+limiter = RateLimiter(
+    requests_per_minute,
+    tokens_per_minute,
+    state=shared_state.get_state() if requests_per_minute or tokens_per_minute else None
+)
+breaker = CircuitBreaker(breaker_failure_threshold, breaker_reset_seconds)
+
+
+def is_retryable(error):
+    """Whether an error means the provider is overloaded or unreachable (bad requests are not retried)"""
+    # Imported here so the guard does not pull in openai before the first call
+    import openai
+    return isinstance(error, (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError))
+
+
+def estimate_prompt_tokens(params):
+    """Rough prompt size of a request: characters / 4"""
+    return sum(len(str(message.get("content", ""))) for message in params.get("messages", [])) // 4
+
+
+def estimate_tokens(params):
+    """Rough token cost of a request: the prompt estimate plus the completion budget"""
+    return estimate_prompt_tokens(params) + params.get("max_tokens", 1000)
+
+
+def retry_after_seconds(error):
+    """The delay the provider asked for in Retry-After / retry-after-ms, if any"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        # HTTP-date values are rare for model APIs; use the backoff instead
+        pass
+    return None
+
+
+def retry_delay(error, attempt):
+    """Honor Retry-After when present, otherwise full-jitter exponential backoff"""
+    requested = retry_after_seconds(error)
+    if requested is not None:
+        return requested + random.uniform(0, backoff_base)
+    return random.uniform(0, min(backoff_max, backoff_base * (2 ** attempt)))
+
+
+def _before_attempt(estimated_tokens, waited):
+    breaker.allow()
+    try:
+        return limiter.reserve(estimated_tokens, max(0.0, max_wait_seconds - waited))
+    except RateLimitExceeded:
+        breaker.release_probe()
+        raise
+
+
+def _after_failure(labels, error, attempt, waited, estimated_tokens):
+    """Record a failed attempt and return the delay before the next one, or None to give up"""
+    limiter.tokens.refund(estimated_tokens)
+    breaker.record_failure()
+    delay = retry_delay(error, attempt)
+    if attempt >= retry_attempts or waited + delay > max_wait_seconds:
+        return None
+    metrics.LLM_RETRIES.inc(dict(labels, reason=type(error).__name__))
+    return delay
+
+
+def guarded_call(create, labels, estimated_tokens):
+    """Run `create()` under the shared limiter, breaker and retry policy"""
+    waited = 0.0
+    attempt = 0
+    while True:
+        try:
+            wait = _before_attempt(estimated_tokens, waited)
+        except UpstreamUnavailable as e:
+            metrics.UPSTREAM_REJECTIONS.inc(dict(labels, reason=type(e).__name__))
+            raise
+        if wait:
+            time.sleep(wait)
+            waited += wait
+        try:
+            response = create()
+        except Exception as e:
+            if not is_retryable(e):
+                # The provider answered (e.g. a 400), so it is up
+                breaker.record_success()
+                raise
+            delay = _after_failure(labels, e, attempt, waited, estimated_tokens)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            waited += delay
+            attempt += 1
+            continue
+        except BaseException:
+            # Cancelled mid-call; let the next caller probe instead
+            breaker.release_probe()
+            raise
+        breaker.record_success()
+        return response
+
+
+async def async_guarded_call(create, labels, estimated_tokens):
+    """Async counterpart of `guarded_call`; `create` returns an awaitable"""
+    import asyncio
+    waited = 0.0
+    attempt = 0
+    while True:
+        try:
+            wait = _before_attempt(estimated_tokens, waited)
+        except UpstreamUnavailable as e:
+            metrics.UPSTREAM_REJECTIONS.inc(dict(labels, reason=type(e).__name__))
+            raise
+        if wait:
+            await asyncio.sleep(wait)
+            waited += wait
+        try:
+            response = await create()
+        except Exception as e:
+            if not is_retryable(e):
+                breaker.record_success()
+                raise
+            delay = _after_failure(labels, e, attempt, waited, estimated_tokens)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            waited += delay
+            attempt += 1
+            continue
+        except BaseException:
+            breaker.release_probe()
+            raise
+        breaker.record_success()
+        return response
+
+
+def settle_tokens(estimated_tokens, usage):
+    """Give back the part of a token reservation the call did not use"""
+    if usage and usage.get("total_tokens"):
+        limiter.tokens.refund(estimated_tokens - usage["total_tokens"])
+
+
+def stats():
+    return {
+        "breaker_state": breaker.state,
+        "consecutive_failures": breaker.failures,
+        "requests_per_minute": requests_per_minute,
+        "tokens_per_minute": tokens_per_minute
+    }
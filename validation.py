@@ -0,0 +1,450 @@
+# validation.py - Quality checks for generated code, run on a process pool off the request thread
+import re
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from html.parser import HTMLParser
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import metrics
+
+try:
+    import tinycss2
+except ImportError:  # tinycss2 is optional; a structural CSS check is always available
+    tinycss2 = None
+
+try:
+    import esprima
+except ImportError:  # esprima is optional; without it JSX is not checked and JS gets a bracket check
+    esprima = None
+
+CSS_CHECKER = "tinycss2" if tinycss2 is not None else "builtin"
+JS_CHECKER = "esprima" if esprima is not None else "builtin"
+
+# Preview documents above this size are flagged (they slow down the iframe and history)
+MAX_PREVIEW_BYTES = 200 * 1024
+
+# Keep reports small enough to store with every result
+MAX_ISSUES = 20
+
+# Finished background checks kept for pages that have not picked up their result yet
+MAX_FINISHED_CHECKS = 256
+
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+                 "param", "source", "track", "wbr"}
+# Elements whose end tag HTML lets authors leave out
+OPTIONAL_END_ELEMENTS = {"p", "li", "dt", "dd", "tr", "td", "th", "thead", "tbody", "tfoot", "option",
+                         "optgroup", "colgroup", "caption", "rt", "rp", "html", "head", "body"}
+
+SCRIPT_RE = re.compile(r"<script\b([^>]*)>(.*?)</script\s*>", re.IGNORECASE | re.DOTALL)
+STYLE_RE = re.compile(r"<style\b[^>]*>(.*?)</style\s*>", re.IGNORECASE | re.DOTALL)
+
+# Code with a top-level import or export is parsed as a module, anything else as a classic script
+MODULE_RE = re.compile(r"^\s*(import\s*[\w{*'\"]|export\s)", re.MULTILINE)
+
+# Syntax newer than ES2017, which esprima 4 cannot parse: optional chaining, nullish and logical
+# assignment, for await, private names, numeric separators and object spread
+MODERN_SYNTAX_RE = re.compile(
+    r"\?\.[\w$\[(]|\?\?|(\|\||&&)=|\bfor\s+await\b|(^|[\s.;{])#[A-Za-z_$]|\d_\d|[{,]\s*\.\.\."
+)
+# Class fields look like plain assignments, so they only count in code that declares a class
+CLASS_RE = re.compile(r"\bclass\s+[A-Za-z_$][\w$]*[^{]*\{")
+CLASS_FIELD_RE = re.compile(r"^\s*(static\s+)?[A-Za-z_$][\w$]*\s*(=(?![=>])|;)", re.MULTILINE)
+
+# Characters after which a "/" starts a regular expression rather than a division
+REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^")
+
+
+def issue(field, severity, message):
+    return {"field": field, "severity": severity, "message": message}
+
+
+class _TagBalanceParser(HTMLParser):
+    """Track open elements and report end tags that do not match"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []
+        self.problems = []
+        self.tags = set()
+
+    def handle_starttag(self, tag, attrs):
+        self.tags.add(tag)
+        if tag not in VOID_ELEMENTS:
+            self.stack.append((tag, self.getpos()[0]))
+
+    def handle_endtag(self, tag):
+        if tag in VOID_ELEMENTS:
+            return
+        open_tags = [name for name, _ in self.stack]
+        if tag not in open_tags:
+            self.problems.append(f"Line {self.getpos()[0]}: stray </{tag}>")
+            return
+        # Close everything opened after the matching tag; only optional ones may be left open
+        while self.stack:
+            name, line = self.stack.pop()
+            if name == tag:
+                break
+            if name not in OPTIONAL_END_ELEMENTS:
+                self.problems.append(f"Line {line}: <{name}> is not closed before </{tag}>")
+
+
+def check_html(field, html, document=True):
+    """Check tag balance and, for preview documents, the basic document structure"""
+    if not html.strip():
+        return [issue(field, "error", "Empty markup")]
+    parser = _TagBalanceParser()
+    parser.feed(html)
+    parser.close()
+    issues = [issue(field, "error", problem) for problem in parser.problems]
+    for name, line in parser.stack:
+        if name not in OPTIONAL_END_ELEMENTS:
+            issues.append(issue(field, "error", f"Line {line}: <{name}> is never closed"))
+    if document and "body" not in parser.tags and "html" not in parser.tags:
+        issues.append(issue(field, "warning", "Not a complete HTML document (no <html> or <body>)"))
+    return issues
+
+
+def _strip_css(css):
+    """Remove comments and string contents so braces inside them are not counted"""
+    out = []
+    i = 0
+    length = len(css)
+    while i < length:
+        char = css[i]
+        if css.startswith("/*", i):
+            end = css.find("*/", i + 2)
+            if end < 0:
+                return "".join(out), "Unterminated comment"
+            i = end + 2
+            continue
+        if char in "\"'":
+            end = i + 1
+            while end < length and css[end] != char:
+                end += 2 if css[end] == "\\" else 1
+            if end >= length:
+                return "".join(out), "Unterminated string"
+            out.append('""')
+            i = end + 1
+            continue
+        out.append(char)
+        i += 1
+    return "".join(out), None
+
+
+def check_css(field, css):
+    """Parse a stylesheet with tinycss2, or check its structure when tinycss2 is not installed"""
+    if not css.strip():
+        return [issue(field, "warning", "Empty stylesheet")]
+    if tinycss2 is not None:
+        issues = []
+        rules = tinycss2.parse_stylesheet(css, skip_comments=True, skip_whitespace=True)
+        for rule in rules:
+            if rule.type == "error":
+                issues.append(issue(field, "error", f"Line {rule.source_line}: {rule.message}"))
+            elif rule.type == "qualified-rule" and rule.content is not None:
+                for declaration in tinycss2.parse_declaration_list(rule.content, skip_comments=True,
+                                                                   skip_whitespace=True):
+                    if declaration.type == "error":
+                        issues.append(issue(field, "error", f"Line {declaration.source_line}: {declaration.message}"))
+        return issues
+
+    stripped, problem = _strip_css(css)
+    if problem:
+        return [issue(field, "error", problem)]
+    issues = []
+    depth = 0
+    for line_number, line in enumerate(stripped.splitlines(), 1):
+        for char in line:
+            if char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth < 0:
+                    issues.append(issue(field, "error", f"Line {line_number}: unexpected }}"))
+                    depth = 0
+    if depth > 0:
+        issues.append(issue(field, "error", f"{depth} unclosed {{"))
+    # Declarations inside innermost blocks need a property and a value
+    for block in re.findall(r"\{([^{}]*)\}", stripped):
+        for declaration in block.split(";"):
+            declaration = declaration.strip()
+            if declaration and ":" not in declaration:
+                issues.append(issue(field, "error", f"Malformed declaration: {declaration[:60]}"))
+    return issues
+
+
+def _bracket_problems(code):
+    """Check (), [] and {} balance in JavaScript, skipping strings, comments, templates and regexes"""
+    pairs = {")": "(", "]": "[", "}": "{"}
+    stack = []
+    previous = ""
+    i = 0
+    length = len(code)
+    while i < length:
+        char = code[i]
+        if code.startswith("//", i):
+            end = code.find("\n", i)
+            i = length if end < 0 else end
+            continue
+        if code.startswith("/*", i):
+            end = code.find("*/", i + 2)
+            if end < 0:
+                return ["Unterminated comment"]
+            i = end + 2
+            continue
+        if char in "\"'`" or (char == "/" and (previous in REGEX_PRECEDERS or previous == "")):
+            # Template literal substitutions are not checked; their braces stay inside the literal
+            end = i + 1
+            in_class = False
+            while end < length:
+                current = code[end]
+                if current == "\\":
+                    end += 2
+                    continue
+                if char == "/" and current == "[":
+                    in_class = True
+                elif char == "/" and current == "]":
+                    in_class = False
+                elif current == char and not in_class:
+                    break
+                elif current == "\n" and char != "`":
+                    return [f"Unterminated {'regular expression' if char == '/' else 'string'}"]
+                end += 1
+            if end >= length:
+                return ["Unterminated template literal" if char == "`" else "Unterminated string"]
+            i = end + 1
+            previous = "a"
+            continue
+        if char in "([{":
+            stack.append(char)
+        elif char in ")]}":
+            if not stack or stack[-1] != pairs[char]:
+                return [f"Unexpected '{char}'"]
+            stack.pop()
+        if not char.isspace():
+            previous = char if not (char.isalnum() or char in "_$") else "a"
+        i += 1
+    if stack:
+        return [f"Unclosed '{stack[-1]}'"]
+    return []
+
+
+def uses_modern_syntax(code):
+    return bool(MODERN_SYNTAX_RE.search(code) or (CLASS_RE.search(code) and CLASS_FIELD_RE.search(code)))
+
+
+def check_js(field, code, jsx=False):
+    """Syntax check with esprima when installed; plain JS falls back to a bracket check.
+
+    esprima only knows ES2017. When it rejects code that uses newer syntax,
+    the failure is reported as a warning (after the bracket check for plain
+    JS), so valid modern code never goes to the repair flow.
+    """
+    if not code.strip():
+        return []
+    if esprima is not None:
+        parse = esprima.parseModule if MODULE_RE.search(code) else esprima.parseScript
+        try:
+            parse(code, {"jsx": jsx, "tolerant": False})
+        except esprima.Error as e:
+            if not uses_modern_syntax(code):
+                return [issue(field, "error", str(e))]
+            issues = [] if jsx else [issue(field, "error", problem) for problem in _bracket_problems(code)]
+            return issues + [issue(field, "warning", f"Not checked by esprima (newer syntax): {str(e)}")]
+        return []
+    if jsx:
+        # JSX text content is not JavaScript, so the bracket check would report false errors
+        return []
+    return [issue(field, "error", problem) for problem in _bracket_problems(code)]
+
+
+def validate_fields(fields, framework):
+    """Check generated code and return a quality report (runs in a pool worker).
+
+    `fields` holds the text fields of a result: interactive_code, css_code,
+    framework_specific_code and the separate html/js.
+    """
+    started = time.perf_counter()
+    issues = []
+    preview = fields.get("interactive_code", "")
+
+    issues.extend(check_html("interactive_code", preview))
+    for attributes, script in SCRIPT_RE.findall(preview):
+        if "src=" not in attributes and "module" not in attributes and "json" not in attributes:
+            issues.extend(check_js("interactive_code", script))
+    for style in STYLE_RE.findall(preview):
+        issues.extend(check_css("interactive_code", style))
+
+    issues.extend(check_css("css_code", fields.get("css_code", "")))
+    if framework == "HTML/CSS/JS":
+        issues.extend(check_html("separate_code.html", fields.get("html", ""), document=False))
+        issues.extend(check_js("separate_code.js", fields.get("js", "")))
+    elif framework == "React":
+        issues.extend(check_js("framework_specific_code", fields.get("framework_specific_code", ""), jsx=True))
+
+    sizes = {name: len(value.encode("utf-8")) for name, value in fields.items()}
+    if sizes.get("interactive_code", 0) > MAX_PREVIEW_BYTES:
+        issues.append(issue("interactive_code", "warning",
+                            f"Preview is {sizes['interactive_code'] // 1024} KB (limit {MAX_PREVIEW_BYTES // 1024} KB)"))
+
+    errors = sum(1 for item in issues if item["severity"] == "error")
+    return {
+        "status": "errors" if errors else ("warnings" if issues else "ok"),
+        "errors": errors,
+        "warnings": len(issues) - errors,
+        "issues": issues[:MAX_ISSUES],
+        "sizes": sizes,
+        "checkers": {"html": "html.parser", "css": CSS_CHECKER, "js": JS_CHECKER},
+        "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+    }
+
+
+def result_fields(result):
+    """The text fields of a result that are validated (only these are sent to the pool)"""
+    separate = result.get("separate_code") if isinstance(result.get("separate_code"), dict) else {}
+    fields = {
+        "interactive_code": result.get("interactive_code", ""),
+        "css_code": result.get("css_code", ""),
+        "framework_specific_code": result.get("framework_specific_code", ""),
+        "html": separate.get("html", ""),
+        "js": separate.get("js", "")
+    }
+    return {name: value if isinstance(value, str) else str(value) for name, value in fields.items()}
+
+
+def repair_instruction(report):
+    """Change request asking the model to fix the errors in a report"""
+    problems = "; ".join(f"{item['field']}: {item['message']}" for item in report["issues"]
+                         if item["severity"] == "error")
+    return f"Fix these syntax problems without changing the design: {problems}"
+
+
+class ValidationPool:
+    """Run `validate_fields` on worker processes so parsing never holds up a request thread.
+
+    The pool is created on first use. If it cannot answer in `timeout`
+    seconds the result is returned without a report; if a worker dies the
+    pool is rebuilt and that check runs inline. `check_later` runs the whole
+    check, repair included, on a background thread and returns at once.
+    """
+
+    def __init__(self, workers=2, timeout=5.0):
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self._executor = None
+        self._background = None
+        self._checks = OrderedDict()  # check id -> future of the checked result
+        self._lock = threading.Lock()
+
+    def validate(self, result, framework):
+        """Return the quality report for `result`, or None when validation timed out"""
+        fields = result_fields(result)
+        try:
+            future = self._get_executor().submit(validate_fields, fields, framework)
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            return None
+        except BrokenProcessPool:
+            with self._lock:
+                self._executor = None
+            return validate_fields(fields, framework)
+
+    def check_later(self, result, framework, device, on_done, repair=None, endpoint="generate"):
+        """Start `check_result` on a background thread and return `result` at once.
+
+        Until the check is done the result's report is {"status": "pending"}
+        with the id of the check. `on_done(checked)` is then called on the
+        background thread with the result to keep (a copy of `result` with
+        its report, or the repaired result); `checked` returns it as well.
+        """
+        check_id = uuid.uuid4().hex
+        result["metadata"]["validation"] = {"status": "pending", "check_id": check_id}
+        # The caller keeps showing `result` while the copy is checked
+        copy = dict(result, metadata=dict(result["metadata"]))
+
+        def run():
+            try:
+                checked = check_result(self, copy, framework, device, repair=repair, endpoint=endpoint)
+            except Exception as e:
+                print(f"Validation failed: {str(e)}")
+                copy["metadata"]["validation"] = None
+                checked = copy
+            on_done(checked)
+            return checked
+
+        with self._lock:
+            if self._background is None:
+                self._background = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="validation")
+            self._checks[check_id] = self._background.submit(run)
+            finished = [key for key, future in self._checks.items() if future.done()]
+            for key in finished[:max(0, len(finished) - MAX_FINISHED_CHECKS)]:
+                del self._checks[key]
+        return result
+
+    def checked(self, result):
+        """The checked result for a result returned by `check_later`, or None while (or if no longer) known"""
+        future = self._pending_check(result)
+        if future is None or not future.done():
+            return None
+        return future.result()
+
+    def is_checking(self, result):
+        """Whether a background check of `result` is still running in this process"""
+        future = self._pending_check(result)
+        return future is not None and not future.done()
+
+    def shutdown(self, timeout=None):
+        """Finish the background checks and stop the worker processes; a later `validate` starts a new pool"""
+        with self._lock:
+            background, self._background = self._background, None
+        if background is not None:
+            background.shutdown(wait=True)
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        return True
+
+    def _pending_check(self, result):
+        report = (result.get("metadata") or {}).get("validation") or {}
+        if report.get("status") != "pending":
+            return None
+        with self._lock:
+            return self._checks.get(report.get("check_id"))
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+
+def check_result(pool, result, framework, device, repair=None, endpoint="generate"):
+    """Attach a quality report to `result["metadata"]["validation"]` and return the result to use.
+
+    When the report has errors and `repair(result, instruction)` is given,
+    one repair call is made; its result replaces the original only if it
+    validates with fewer errors. `repair` returns None when it failed.
+    """
+    labels = metrics.call_labels(endpoint, framework, device)
+    report = pool.validate(result, framework)
+    if report is None:
+        metrics.OUTPUT_VALIDATIONS.inc(dict(labels, status="timeout"))
+        return result
+
+    if report["errors"] and repair is not None:
+        repaired = repair(result, repair_instruction(report))
+        repaired_report = pool.validate(repaired, framework) if repaired is not None else None
+        fixed = repaired_report is not None and repaired_report["errors"] < report["errors"]
+        metrics.OUTPUT_REPAIRS.inc(dict(labels, outcome="fixed" if fixed else "failed"))
+        if fixed:
+            repaired_report["repair"] = {"errors_before": report["errors"], "errors_after": repaired_report["errors"]}
+            result, report = repaired, repaired_report
+        else:
+            report["repair"] = {"errors_before": report["errors"], "errors_after": None}
+
+    metrics.OUTPUT_VALIDATIONS.inc(dict(labels, status=report["status"]))
+    result["metadata"]["validation"] = report
+    return result
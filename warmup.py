@@ -0,0 +1,109 @@
+# warmup.py - Background pre-generation of the prompt library into the response cache
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from batch_generate import build_jobs
+from upstream_guard import UpstreamUnavailable
+
+
+class CatalogWarmer:
+    """Pre-generate library prompts on a background thread.
+
+    `is_warm(job)` says whether a job is already cached and `warm(job)`
+    generates and caches it (returning False if the result was not worth
+    caching). Both are supplied by the app, so this module stays free of
+    UI code. Runs once, or every `interval_seconds` to refill entries that
+    expired. A round stops early when the model API is unavailable, so the
+    warm-up never competes with users for a degraded provider.
+    """
+
+    def __init__(self, jobs, is_warm, warm, concurrency=2, interval_seconds=0):
+        self.jobs = jobs
+        self.is_warm = is_warm
+        self.warm = warm
+        self.concurrency = max(1, concurrency)
+        self.interval_seconds = interval_seconds
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._paused = threading.Event()
+        self._thread = None
+        self._status = {
+            "state": "idle",
+            "total": len(jobs),
+            "warmed": 0,
+            "skipped": 0,
+            "failed": 0,
+            "rounds": 0,
+            "last_round_s": None
+        }
+
+    def start(self):
+        """Start the background thread (returns immediately)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="catalog-warmer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self):
+        with self._lock:
+            return dict(self._status)
+
+    def run_once(self):
+        """Warm every job that is not cached yet; returns the number generated"""
+        self._paused.clear()
+        self._update(state="running", warmed=0, skipped=0, failed=0)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="warmup") as pool:
+            outcomes = list(pool.map(self._warm_job, self.jobs))
+        self._update(
+            state="paused" if self._paused.is_set() else "done",
+            rounds=self._status["rounds"] + 1,
+            last_round_s=round(time.perf_counter() - started, 1)
+        )
+        return outcomes.count("warmed")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"Catalog warm-up failed: {str(e)}")
+                self._update(state="error")
+            if not self.interval_seconds:
+                return
+            self._stop.wait(self.interval_seconds)
+
+    def _warm_job(self, job):
+        if self._stop.is_set() or self._paused.is_set():
+            return "skipped"
+        if self.is_warm(job):
+            self._increment("skipped")
+            return "skipped"
+        try:
+            warmed = self.warm(job)
+        except UpstreamUnavailable as e:
+            # Leave the rest of this round to the next one
+            print(f"Catalog warm-up paused: {str(e)}")
+            self._paused.set()
+            return "skipped"
+        except Exception as e:
+            print(f"Catalog warm-up failed for {job['framework']} / {job['device']}: {job['prompt'][:50]}: {str(e)}")
+            warmed = False
+        self._increment("warmed" if warmed else "failed")
+        return "warmed" if warmed else "failed"
+
+    def _update(self, **values):
+        with self._lock:
+            self._status.update(values)
+
+    def _increment(self, key):
+        with self._lock:
+            self._status[key] += 1
+
+
+def create_catalog_warmer(frameworks, devices, is_warm, warm, concurrency=2, interval_seconds=0):
+    """Build a warmer for every library prompt in the given frameworks and devices"""
+    return CatalogWarmer(build_jobs(None, frameworks, devices), is_warm, warm, concurrency, interval_seconds)